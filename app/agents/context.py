@@ -0,0 +1,94 @@
+from __future__ import annotations
+from typing import List, Sequence, Tuple
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from app.core.config import settings
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant. "
+    "Fold the new messages into the current summary. Keep facts, decisions, names, numbers, "
+    "open questions and user preferences; drop pleasantries and tool-call mechanics. "
+    "Reply with the updated summary only, at most 250 words."
+)
+
+
+def _text(m: BaseMessage) -> str:
+    return m.content if isinstance(m.content, str) else str(m.content)
+
+
+def estimate_tokens(messages: Sequence[BaseMessage]) -> int:
+    """Cheap, model-agnostic estimate (~4 chars/token plus per-message overhead)."""
+    return sum(len(_text(m)) // 4 + 4 for m in messages)
+
+
+def split_turns(messages: Sequence[BaseMessage]) -> List[List[BaseMessage]]:
+    """Group messages into turns, each starting at a user message, so tool call/result pairs stay together."""
+    turns: List[List[BaseMessage]] = []
+    for m in messages:
+        if isinstance(m, HumanMessage) or not turns:
+            turns.append([m])
+        else:
+            turns[-1].append(m)
+    return turns
+
+
+def render_for_summary(messages: Sequence[BaseMessage], max_chars: int = 2000) -> str:
+    lines = []
+    for m in messages:
+        if isinstance(m, ToolMessage):
+            continue
+        who = getattr(m, "name", None) or m.type
+        text = _text(m).strip()
+        if text:
+            lines.append(f"{who}: {text[:max_chars]}")
+    return "\n".join(lines)
+
+
+class ContextManager:
+    """
+    Token-budgeted view of a thread: the latest turns verbatim (the current turn always),
+    older ones represented only by the running summary kept in graph state.
+    """
+
+    def __init__(self, budget_tokens: int, keep_turns: int, compact_after_turns: int):
+        self.budget = budget_tokens
+        self.keep_turns = max(1, keep_turns)
+        self.compact_after_turns = max(self.keep_turns, compact_after_turns)
+
+    @classmethod
+    def for_model(cls, model: str) -> "ContextManager":
+        budget = settings.context_budgets.get(model, settings.context_default_budget)
+        return cls(budget, settings.context_keep_turns, settings.context_compact_after_turns)
+
+    def window(self, messages: Sequence[BaseMessage], summary: str = "") -> List[BaseMessage]:
+        turns = split_turns(messages)
+        if not turns:
+            return list(messages)
+        head: List[BaseMessage] = (
+            [SystemMessage(content="Summary of the earlier conversation:\n" + summary)] if summary else []
+        )
+        kept = [turns[-1]]
+        used = estimate_tokens(head) + estimate_tokens(turns[-1])
+        for turn in reversed(turns[:-1]):
+            cost = estimate_tokens(turn)
+            if len(kept) >= self.keep_turns or used + cost > self.budget:
+                break
+            kept.insert(0, turn)
+            used += cost
+        return head + [m for turn in kept for m in turn]
+
+    def needs_compaction(self, messages: Sequence[BaseMessage]) -> bool:
+        turns = split_turns(messages)
+        if len(turns) <= 1:
+            return False
+        return len(turns) > self.compact_after_turns or estimate_tokens(messages) > self.budget
+
+    def split_for_compaction(self, messages: Sequence[BaseMessage]) -> Tuple[List[BaseMessage], List[BaseMessage]]:
+        """(older messages to fold into the summary, recent messages to keep verbatim)."""
+        turns = split_turns(messages)
+        keep = self.keep_turns
+        # keep fewer turns if even those blow the budget, but never drop the current turn
+        while keep > 1 and estimate_tokens([m for t in turns[-keep:] for m in t]) > self.budget:
+            keep -= 1
+        old = [m for t in turns[:-keep] for m in t]
+        recent = [m for t in turns[-keep:] for m in t]
+        return old, recent
@@ -0,0 +1,179 @@
+from __future__ import annotations
+import re, threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+ROUTES = ("web_researcher", "rag", "nl2sql", "memory")
+
+# Tier 1: keyword rules. They skip the LLM, so they only cover unambiguous phrasings; a
+# message is routed only if exactly one route's rule fires, anything else falls through.
+_SQL_ANCHOR = re.compile(r"\b(chinook|sql|database)\b", re.I)
+_SQL_TABLES = re.compile(
+    r"\b(invoices?|albums?|artists?|tracks?|genres?|playlists?|customers?|employees?|media types?|sales)\b", re.I)
+_SQL_VERBS = re.compile(r"\b(how many|number of|count|total|sum of|average|top \d+|list( all)?|show( all| me)?)\b", re.I)
+
+
+def _nl2sql_rule(text: str) -> bool:
+    """Named database, or a Chinook table word asked about with an aggregate/list verb."""
+    return bool(_SQL_ANCHOR.search(text) or (_SQL_TABLES.search(text) and _SQL_VERBS.search(text)))
+
+
+RULES: Dict[str, Callable[[str], object]] = {
+    "memory": re.compile(
+        r"\b(remember (that|this|my)|recall my|forget (that|my)|memori[sz]e|save (that|this)|what do you know about me|"
+        r"my (preferred|preference|favou?rite)|i prefer)\b", re.I).search,
+    "nl2sql": _nl2sql_rule,
+    "rag": re.compile(
+        r"\b(my (docs?|documents?|files?|pdfs?|papers?)|from (the|my) (docs?|documents?|pdfs?|papers?)|"
+        r"in the (docs?|documents?|pdfs?|papers?)|according to the (docs?|documents?|papers?))\b", re.I).search,
+    "web_researcher": re.compile(
+        r"\b(latest|breaking|news|tonight|this week|right now|weather|"
+        r"stock price|search the web|on the web|who won)\b", re.I).search,
+}
+
+# Tier 2: labelled examples for the nearest-example classifier.
+ROUTE_EXAMPLES: Dict[str, List[str]] = {
+    "web_researcher": [
+        "what is the capital of andhra pradesh?",
+        "what happened in the news yesterday?",
+        "who is the current prime minister of the uk?",
+        "what is the weather in hyderabad",
+        "latest release of python",
+        "search the internet for langgraph tutorials",
+    ],
+    "rag": [
+        "what is diabetic retinopathy screening from my doc?",
+        "summarize the privacy challenges of generative ai in medical practice",
+        "what does the paper say about security risks of llms in healthcare?",
+        "according to the documents, how is patient data protected?",
+        "what are the findings of the study in my pdf?",
+    ],
+    "nl2sql": [
+        "what is email of andrew adams who is general manager?",
+        "how many tracks are in each genre?",
+        "list the top 5 customers by total invoice amount",
+        "which artist has the most albums?",
+        "show employees who report to the general manager",
+        "total sales by country",
+    ],
+    "memory": [
+        "remember that my preferred tone is concise",
+        "remember that i prefer short answers",
+        "what is my preferred tone?",
+        "forget my summary style",
+        "save that i like sources at the end",
+        "what did i tell you about my preferences?",
+    ],
+}
+
+
+# cues that a message asks for several sources at once ("compare my docs with the latest news")
+COMPOUND_RE = re.compile(r"\b(compare|comparison|versus|vs\.?|as well as|and also|both|along with|cross-check)\b", re.I)
+
+
+@dataclass
+class FastRoute:
+    route: str
+    tier: str          # "rule" | "embedding"
+    confidence: float
+    parallel: tuple = ()   # extra workers to fan out to alongside `route`
+
+    @property
+    def routes(self) -> tuple:
+        return (self.route,) + tuple(r for r in self.parallel if r != self.route)
+
+
+class RouterStats:
+    """Counts routing decisions per tier and route, to show how many supervisor LLM calls are avoided."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {"rule": {}, "embedding": {}, "llm": {}}
+
+    def record(self, tier: str, route: str) -> None:
+        with self._lock:
+            bucket = self._counts.setdefault(tier, {})
+            bucket[route] = bucket.get(route, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = {tier: dict(b) for tier, b in self._counts.items()}
+        per_tier = {tier: sum(b.values()) for tier, b in counts.items()}
+        total = sum(per_tier.values())
+        saved = per_tier.get("rule", 0) + per_tier.get("embedding", 0)
+        return {
+            "decisions": total,
+            "per_tier": per_tier,
+            "per_route": counts,
+            "llm_calls_saved": saved,
+            "fast_path_hit_rate": (saved / total) if total else 0.0,
+        }
+
+
+ROUTER_STATS = RouterStats()
+
+
+class EmbeddingRouteClassifier:
+    """Nearest labelled example by cosine similarity; example vectors are embedded once, lazily."""
+
+    def __init__(self, examples: Dict[str, List[str]]):
+        self.examples = examples
+        self._labels: List[str] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._owner: Optional[Embeddings] = None
+        self._lock = threading.Lock()
+
+    def _ensure(self, embeddings: Embeddings) -> np.ndarray:
+        with self._lock:
+            if self._matrix is None or self._owner is not embeddings:
+                texts = [t for route in self.examples for t in self.examples[route]]
+                self._labels = [route for route in self.examples for _ in self.examples[route]]
+                mat = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+                mat /= np.maximum(np.linalg.norm(mat, axis=1, keepdims=True), 1e-12)
+                self._matrix, self._owner = mat, embeddings
+            return self._matrix
+
+    def classify(self, text: str, embeddings: Embeddings) -> tuple[str, float, float]:
+        """Return (best route, best similarity, margin over the best example of any other route)."""
+        mat = self._ensure(embeddings)
+        q = np.asarray(embeddings.embed_query(text), dtype=np.float32)
+        q /= max(float(np.linalg.norm(q)), 1e-12)
+        sims = mat @ q
+        best_per_route: Dict[str, float] = {}
+        for label, sim in zip(self._labels, sims.tolist()):
+            if sim > best_per_route.get(label, -1.0):
+                best_per_route[label] = sim
+        ranked = sorted(best_per_route.items(), key=lambda kv: kv[1], reverse=True)
+        best, second = ranked[0], (ranked[1][1] if len(ranked) > 1 else -1.0)
+        return best[0], best[1], best[1] - second
+
+
+class FastRouter:
+    """
+    Tiered router in front of the supervisor LLM: keyword rules, then the embedding
+    classifier; returns None (-> ask the LLM) when neither is confident enough.
+    """
+
+    def __init__(self, embeddings_provider: Callable[[], Optional[Embeddings]],
+                 threshold: float = 0.6, margin: float = 0.05):
+        self.embeddings_provider = embeddings_provider
+        self.threshold = threshold
+        self.margin = margin
+        self.classifier = EmbeddingRouteClassifier(ROUTE_EXAMPLES)
+
+    def route(self, text: str) -> Optional[FastRoute]:
+        """Blocking (the embedding tier runs the encoder): call it off the event loop."""
+        fired = [route for route, rule in RULES.items() if rule(text)]
+        if len(fired) == 1:
+            return FastRoute(fired[0], "rule", 1.0)
+        if len(fired) > 1 and COMPOUND_RE.search(text) and "memory" not in fired:
+            return FastRoute(fired[0], "rule", 1.0, parallel=tuple(fired[1:]))
+        embeddings = self.embeddings_provider()
+        if embeddings is None:
+            return None
+        route, sim, margin = self.classifier.classify(text, embeddings)
+        if sim >= self.threshold and margin >= self.margin and (not fired or route in fired):
+            return FastRoute(route, "embedding", sim)
+        return None
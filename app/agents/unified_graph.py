@@ -1,12 +1,13 @@
 from __future__ import annotations
+import asyncio
 from typing import Literal, Sequence, List
 from typing_extensions import Annotated, TypedDict
-from langchain_core.messages import BaseMessage, SystemMessage, AIMessage
+from langchain_core.messages import BaseMessage, SystemMessage, AIMessage, HumanMessage, RemoveMessage
 from langgraph.graph import StateGraph, START, END, MessagesState
-from langgraph.types import Command
+from langgraph.types import Command, Send
 from langgraph.prebuilt.tool_node import ToolNode, tools_condition
 from langgraph.graph.message import add_messages
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from app.core.config import settings
 from app.db.profile_store import ProfileStore
@@ -16,10 +17,16 @@ from app.tools.nl2sql import nl2sql_tool
 from app.tools.memory_tools import remember_tool, recall_tool
 import app.tools.rag as rag_mod  # IMPORTANT: use the module, not a copied symbol
 from app.core.tracking import traceable
+from app.agents.fast_router import FastRouter, ROUTER_STATS
+from app.agents.context import ContextManager, SUMMARY_PROMPT, render_for_summary
 
 # LLMs
 from langchain_openai import ChatOpenAI
 from langchain_community.chat_models import ChatOllama
+from app.services.llm_cache import with_llm_cache, messages_key
+from app.core.cache import AsyncSingleFlight
+from app.services.observability import instrument_llm, instrument_tools, timed_node
+from app.services.concurrency import backend_limiter, llm_backend
 
 
 def get_router_llm():
@@ -34,6 +41,7 @@ def get_router_llm():
 
 class AgentState(TypedDict):
     messages: Annotated[Sequence[BaseMessage], add_messages]
+    summary: str
 
 
 def make_memory_injector(profile_store: ProfileStore):
@@ -51,12 +59,15 @@ def make_memory_injector(profile_store: ProfileStore):
     return _inject
 
 @traceable(name="worker_agent_step")
-def create_agent(agent_llm, tools: List, memory_inject):
+def create_agent(agent_llm, tools: List, memory_inject, context: ContextManager):
+    tools = instrument_tools(tools)
     llm_with_tools = agent_llm.bind_tools(tools)
+    llm_slot = backend_limiter(llm_backend(settings.supervisor_model))
 
-    def chatbot(state: AgentState):
-        msgs = memory_inject(state["messages"])
-        return {"messages": [llm_with_tools.invoke(msgs)]}
+    async def chatbot(state: AgentState):
+        msgs = memory_inject(context.window(state["messages"], state.get("summary") or ""))
+        async with llm_slot:
+            return {"messages": [await llm_with_tools.ainvoke(msgs)]}
 
     gb = StateGraph(AgentState)
     gb.add_node("agent", chatbot)
@@ -79,17 +90,72 @@ def _should_finish(state: MessagesState, workers: list[str]) -> bool:
     return False
 
 
+def _pending_question(state: MessagesState) -> str | None:
+    """The user's message when it is the latest one, i.e. the first routing hop of a turn."""
+    msgs = state.get("messages", [])
+    if msgs and isinstance(msgs[-1], HumanMessage) and isinstance(msgs[-1].content, str):
+        return msgs[-1].content
+    return None
+
+
+def _router_embeddings():
+    # reuse the RAG embedding model (and its query cache) once the index is up
+    vs = rag_mod.VECTORSTORE
+    return getattr(vs, "embeddings", None) if vs is not None else None
+
+
+Worker = Literal["web_researcher", "rag", "nl2sql", "memory"]
+
+
 class Router(BaseModel):
     next: Literal["web_researcher", "rag", "nl2sql", "memory", "FINISH"]
+    also: List[Worker] = Field(
+        default_factory=list,
+        description="Other workers to run in parallel with `next` when the question needs several sources.",
+    )
 
 
-def build_graph(checkpointer, profile_store: ProfileStore):
-    # Ensure the vectorstore exists ON THE MODULE (so the tool sees it)
-    if rag_mod.VECTORSTORE is None:
-        rag_mod.VECTORSTORE = rag_mod.initialize_vectorstore(str(settings.docs_dir))
+# identical routing prompts in flight at once (e.g. a batch of first turns) share one LLM call
+ROUTE_FLIGHTS = AsyncSingleFlight()
+
+
+class SupervisorState(MessagesState):
+    # workers running in parallel for this hop; empty on the one-worker-at-a-time path
+    fanout: List[str]
+    # running summary of turns folded out of `messages` by compact_history
+    summary: str
 
+
+SYNTHESIS_PROMPT = (
+    "Several workers answered parts of the user's question in parallel. "
+    "Merge their findings into one coherent answer to the question. Keep each worker's sources, "
+    "note disagreements between sources, and do not add facts that none of them reported."
+)
+
+
+def _fanout_findings(state: SupervisorState) -> tuple[str, List[AIMessage]]:
+    """The turn's question and the parallel workers' replies that followed it."""
+    msgs = list(state.get("messages", []))
+    fanout = set(state.get("fanout") or [])
+    question, replies = "", []
+    for m in reversed(msgs):
+        if isinstance(m, HumanMessage):
+            question = m.content if isinstance(m.content, str) else str(m.content)
+            break
+        if isinstance(m, AIMessage) and getattr(m, "name", None) in fanout:
+            replies.append(m)
+    return question, list(reversed(replies))
+
+
+def build_graph(checkpointer, profile_store: ProfileStore):
+    # The vectorstore is opened and synced in the background by the ingestion worker;
+    # retriever_tool and the fast router cope with rag_mod.VECTORSTORE still being None.
     memory_inject = make_memory_injector(profile_store)
-    SUP_LLM = get_router_llm()
+    base_llm = instrument_llm(get_router_llm())
+    SUP_LLM = with_llm_cache(base_llm, "supervisor")     # routing, compaction, synthesis
+    AGENT_LLM = with_llm_cache(base_llm, "agents")       # tool-calling worker steps (off by default)
+    context = ContextManager.for_model(settings.supervisor_model)
+    llm_slot = backend_limiter(llm_backend(settings.supervisor_model))
 
     members = ["web_researcher", "rag", "nl2sql", "memory"]
     options = members + ["FINISH"]
@@ -102,41 +168,104 @@ def build_graph(checkpointer, profile_store: ProfileStore):
         "- nl2sql for Chinook database\n"
         "- memory for remember/recall/save/forget\n"
         "- FINISH when task is complete.\n"
+        "If the question needs several sources (e.g. compare what the documents say with current news), "
+        "put one worker in `next` and the others in `also`; they run in parallel.\n"
     )
 
     # Create each worker agent ONCE, and use rag_mod.retriever_tool
-    web_agent = create_agent(SUP_LLM, [web_search_tool, remember_tool, recall_tool], memory_inject)
-    rag_agent = create_agent(SUP_LLM, [rag_mod.retriever_tool, remember_tool, recall_tool], memory_inject)
-    sql_agent = create_agent(SUP_LLM, [nl2sql_tool, remember_tool, recall_tool], memory_inject)
-    mem_agent = create_agent(SUP_LLM, [remember_tool, recall_tool], memory_inject)
+    web_agent = create_agent(AGENT_LLM, [web_search_tool, remember_tool, recall_tool], memory_inject, context)
+    rag_agent = create_agent(AGENT_LLM, [rag_mod.retriever_tool, remember_tool, recall_tool], memory_inject, context)
+    sql_agent = create_agent(AGENT_LLM, [nl2sql_tool, remember_tool, recall_tool], memory_inject, context)
+    mem_agent = create_agent(AGENT_LLM, [remember_tool, recall_tool], memory_inject, context)
+    fast_router = FastRouter(
+        _router_embeddings,
+        threshold=settings.router_embed_threshold,
+        margin=settings.router_embed_margin,
+    ) if settings.router_fast_path else None
 
+    def dispatch(state: SupervisorState, workers: List[str]) -> Command:
+        workers = [w for w in dict.fromkeys(workers) if w in members][: max(1, settings.max_parallel_workers)]
+        if len(workers) == 1 or not settings.router_parallel:
+            return Command(update={"fanout": []}, goto=workers[0])
+        # fan out: every worker gets the same history; their replies meet in "synthesize"
+        payload = {"messages": state["messages"], "fanout": workers, "summary": state.get("summary") or ""}
+        return Command(update={"fanout": workers}, goto=[Send(w, payload) for w in workers])
 
     @traceable(name="supervisor_node")
-    def supervisor_node(state: MessagesState) -> Command:
+    async def supervisor_node(state: SupervisorState) -> Command:
         if _should_finish(state, members):
             return Command(goto=END)
-        messages = [SystemMessage(content=SUPERVISOR_PROMPT)] + state["messages"]
-        decision = SUP_LLM.with_structured_output(Router).invoke(messages)
+        question = _pending_question(state)
+        fast = await asyncio.to_thread(fast_router.route, question) if fast_router and question else None
+        if fast is not None:
+            ROUTER_STATS.record(fast.tier, "+".join(fast.routes))
+            return dispatch(state, list(fast.routes))
+        history = context.window(state["messages"], state.get("summary") or "")
+        messages = [SystemMessage(content=SUPERVISOR_PROMPT)] + history
+
+        async def decide() -> Router:
+            async with llm_slot:
+                return await SUP_LLM.with_structured_output(Router).ainvoke(messages)
+        decision = await ROUTE_FLIGHTS.do(messages_key(messages), decide)
         goto = decision.next
         if goto == "FINISH":
+            ROUTER_STATS.record("llm", goto)
             return Command(goto=END)
-        return Command(goto=goto)
+        workers = [goto] + list(decision.also)
+        ROUTER_STATS.record("llm", "+".join(dict.fromkeys(workers)))
+        return dispatch(state, workers)
+
+    @traceable(name="compact_history_node")
+    async def compact_history_node(state: SupervisorState) -> Command:
+        """Fold turns beyond the window into the running summary and drop them from the thread."""
+        msgs = list(state.get("messages", []))
+        if not context.needs_compaction(msgs):
+            return Command(goto="supervisor")
+        old, _ = context.split_for_compaction(msgs)
+        if not old:
+            return Command(goto="supervisor")
+        summary = state.get("summary") or ""
+        async with llm_slot:
+            folded = await SUP_LLM.ainvoke([
+                SystemMessage(content=SUMMARY_PROMPT),
+                HumanMessage(content=f"Current summary:\n{summary or '(empty)'}\n\nNew messages:\n{render_for_summary(old)}"),
+            ])
+        return Command(
+            update={"summary": folded.content, "messages": [RemoveMessage(id=m.id) for m in old if m.id]},
+            goto="supervisor",
+        )
+
+    @traceable(name="synthesize_node")
+    async def synthesize_node(state: SupervisorState) -> Command:
+        question, replies = _fanout_findings(state)
+        findings = "\n\n".join(f"### {m.name}\n{m.content}" for m in replies)
+        async with llm_slot:
+            merged = await SUP_LLM.ainvoke([
+                SystemMessage(content=SYNTHESIS_PROMPT),
+                HumanMessage(content=f"Question:\n{question}\n\nFindings:\n{findings}"),
+            ])
+        return Command(
+            update={"messages": [AIMessage(content=merged.content, name="synthesizer")], "fanout": []},
+            goto=END,
+        )
 
     def wrap(agent, name: str):
-        def node(state: MessagesState) -> Command:
-            result = agent.invoke({"messages": state["messages"]})
+        async def node(state: SupervisorState) -> Command:
+            result = await agent.ainvoke({"messages": state["messages"], "summary": state.get("summary") or ""})
             last = result["messages"][-1]
             return Command(
                 update={"messages": [AIMessage(content=last.content, name=name, additional_kwargs=last.additional_kwargs)]},
-                goto="supervisor"
+                goto="synthesize" if state.get("fanout") else "supervisor",
             )
         return node
 
-    builder = StateGraph(MessagesState)
-    builder.add_node("supervisor", supervisor_node)
-    builder.add_node("web_researcher", wrap(web_agent, "web_researcher"))
-    builder.add_node("rag", wrap(rag_agent, "rag"))
-    builder.add_node("nl2sql", wrap(sql_agent, "nl2sql"))
-    builder.add_node("memory", wrap(mem_agent, "memory"))
-    builder.add_edge(START, "supervisor")
+    builder = StateGraph(SupervisorState)
+    builder.add_node("compact_history", timed_node("compact_history", compact_history_node))
+    builder.add_node("supervisor", timed_node("supervisor", supervisor_node))
+    builder.add_node("synthesize", timed_node("synthesize", synthesize_node))
+    builder.add_node("web_researcher", timed_node("web_researcher", wrap(web_agent, "web_researcher")))
+    builder.add_node("rag", timed_node("rag", wrap(rag_agent, "rag")))
+    builder.add_node("nl2sql", timed_node("nl2sql", wrap(sql_agent, "nl2sql")))
+    builder.add_node("memory", timed_node("memory", wrap(mem_agent, "memory")))
+    builder.add_edge(START, "compact_history")
     return builder.compile(checkpointer=checkpointer)
@@ -1,5 +1,5 @@
 # app/api/deps.py
-from fastapi import Request
+from fastapi import HTTPException, Request
 from app.db.profile_store import ProfileStore
 
 def get_profile_store(request: Request) -> ProfileStore:
@@ -7,5 +7,21 @@ def get_profile_store(request: Request) -> ProfileStore:
     return request.app.state.profile_store
 
 def get_graph(request: Request):
-    """Return the compiled LangGraph app stored on app.state."""
-    return request.app.state.graph
+    """Return the compiled LangGraph app stored on app.state (503 until startup has built it)."""
+    graph = getattr(request.app.state, "graph", None)
+    if graph is None:
+        raise HTTPException(status_code=503, detail="Agent graph is not ready yet; see /health/ready",
+                            headers={"Retry-After": "5"})
+    return graph
+
+def get_ingestion_worker(request: Request):
+    """Return the background RAG ingestion worker stored on app.state."""
+    return request.app.state.ingestion_worker
+
+def get_checkpoint_janitor(request: Request):
+    """Return the checkpoint retention job stored on app.state."""
+    return request.app.state.checkpoint_janitor
+
+def get_batch_store(request: Request):
+    """Return the /chat/batch result store stored on app.state."""
+    return request.app.state.batch_store
@@ -0,0 +1,76 @@
+# app/api/routes/admin.py
+from fastapi import APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
+from app.api.deps import get_ingestion_worker, get_checkpoint_janitor, get_profile_store
+from app.db.profile_store import ProfileStore
+from app.services.ingest_worker import IngestionWorker
+from app.services.checkpoint_retention import CheckpointJanitor
+from app.agents.fast_router import ROUTER_STATS
+import app.tools.nl2sql as nl2sql_mod
+import app.tools.web_search as web_search_mod
+from app.services import llm_cache
+from app.services import concurrency
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+@router.get("/ingestion")
+def ingestion_status(worker: IngestionWorker = Depends(get_ingestion_worker)):
+    return worker.status()
+
+@router.post("/ingestion/rescan")
+def ingestion_rescan(worker: IngestionWorker = Depends(get_ingestion_worker)):
+    worker.trigger()
+    return {"triggered": True}
+
+@router.get("/router")
+def router_stats():
+    return ROUTER_STATS.snapshot()
+
+@router.get("/checkpoints")
+def checkpoint_stats(janitor: CheckpointJanitor = Depends(get_checkpoint_janitor)):
+    return janitor.stats()
+
+@router.post("/checkpoints/compact")
+async def checkpoint_compact(janitor: CheckpointJanitor = Depends(get_checkpoint_janitor)):
+    # runs on a worker thread; the DB stays writable between its short delete transactions
+    return await run_in_threadpool(janitor.run_once)
+
+@router.get("/profile-store")
+def profile_store_stats(store: ProfileStore = Depends(get_profile_store)):
+    return {"cache": store.cache_stats(), "write_behind": store.queue_stats()}
+
+@router.get("/nl2sql/schema")
+def nl2sql_schema_status():
+    return nl2sql_mod.SCHEMA.status()
+
+@router.post("/nl2sql/schema/refresh")
+async def nl2sql_schema_refresh():
+    await run_in_threadpool(nl2sql_mod.SCHEMA.refresh)
+    return nl2sql_mod.SCHEMA.status()
+
+@router.get("/nl2sql/cache")
+def nl2sql_cache_stats():
+    return nl2sql_mod.cache_stats()
+
+@router.delete("/nl2sql/cache")
+def nl2sql_cache_clear():
+    nl2sql_mod.SQL_CACHE.clear()
+    nl2sql_mod.RESULT_CACHE.clear()
+    return nl2sql_mod.cache_stats()
+
+@router.get("/web-search")
+def web_search_stats():
+    return web_search_mod.cache_stats()
+
+@router.get("/llm-cache")
+def llm_cache_stats():
+    return llm_cache.cache_stats()
+
+@router.delete("/llm-cache")
+def llm_cache_clear():
+    llm_cache.clear_all()
+    return llm_cache.cache_stats()
+
+@router.get("/concurrency")
+def concurrency_stats():
+    return concurrency.stats()
@@ -1,30 +1,171 @@
-from fastapi import APIRouter, Depends
+import hashlib, json
+from typing import Any, AsyncIterator
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from app.api.deps import get_graph
+from langgraph.types import Command
+from app.api.deps import get_batch_store, get_graph
+from app.core.config import settings
+from app.db.batch_store import BatchStore
 from app.services.graph_runtime import current_user_id_ctx
+from app.services.concurrency import THREAD_LOCKS
+from app.services.batch import RUNNING_BATCHES, BatchRejected, run_batch
+from app.core.logger import logger
 from app.core.tracking import traceable
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
+GRAPH_NODES = {"supervisor", "web_researcher", "rag", "nl2sql", "memory", "synthesize"}
+
 class ChatBody(BaseModel):
     message: str
 
-@router.post("/{user_id}")
-@traceable(name="http_chat_turn")
-def chat(user_id: str, body: ChatBody, graph = Depends(get_graph)):
-    # scope the user id to this request
+
+def _final_answer(messages) -> str | None:
+    if not messages:
+        return None
+    last = messages[-1]
+    return getattr(last, "content", None) or (last.get("content") if isinstance(last, dict) else None)
+
+
+def _top_node(ev: dict) -> str | None:
+    """Top-level graph node an event belongs to (events from worker subgraphs report their inner node)."""
+    md = ev.get("metadata") or {}
+    ns = md.get("langgraph_checkpoint_ns") or ""
+    return ns.split("|", 1)[0].split(":", 1)[0] or md.get("langgraph_node")
+
+
+def thread_of_path(path: str) -> str | None:
+    """Conversation thread of a /chat/{user_id}[/stream] request path (for admission control)."""
+    parts = path.split("/")
+    return parts[2] if len(parts) > 2 and parts[1] == "chat" and parts[2] else None
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+async def run_turn(graph, user_id: str, message: str) -> str | None:
+    """One blocking turn on the user's thread; returns the final answer."""
+    # scope the user id to this turn (copied into the graph's tasks and tool threads)
     token = current_user_id_ctx.set(user_id)
     try:
-        # one-shot run (simpler than streaming for Postman)
-        result = graph.invoke(
-            {"messages": [("user", body.message)]},
-            config={"configurable": {"thread_id": user_id}},
-        )
-        msgs = result.get("messages", [])
-        final = None
-        if msgs:
-            last = msgs[-1]
-            final = getattr(last, "content", None) or (last.get("content") if isinstance(last, dict) else None)
-        return {"answer": final}
+        # one turn at a time per thread: concurrent turns would race on the same checkpoint
+        async with THREAD_LOCKS.hold(user_id):
+            result = await graph.ainvoke(
+                {"messages": [("user", message)]},
+                config={"configurable": {"thread_id": user_id}},
+            )
+        return _final_answer(result.get("messages", []))
     finally:
         current_user_id_ctx.reset(token)
+
+
+async def _stream_batch(batch_id: str, lines, graph, store: BatchStore, concurrency: int) -> AsyncIterator[str]:
+    try:
+        results = run_batch(batch_id, lines, lambda uid, msg: run_turn(graph, uid, msg), store,
+                            concurrency, settings.batch_item_timeout or None)
+        try:
+            async for result in results:
+                yield json.dumps(result, ensure_ascii=False, default=str) + "\n"
+        finally:
+            # also reached on client disconnect: cancels the items still running
+            await results.aclose()
+    finally:
+        RUNNING_BATCHES.release(batch_id)
+
+
+# declared before /{user_id} so "batch" is not taken for a user id
+@router.post("/batch")
+async def chat_batch(request: Request,
+                     batch_id: str | None = Query(None, max_length=200),
+                     concurrency: int | None = Query(None, ge=1),
+                     graph = Depends(get_graph), store: BatchStore = Depends(get_batch_store)):
+    """
+    NDJSON in ({"id", "user_id", "message"} per line), NDJSON out: one item result per line as
+    each finishes, then a summary line. Re-posting with the same batch_id (by default a hash
+    of the body) skips the items that already succeeded.
+    """
+    body = await request.body()   # read up front: the response streams while the batch runs
+    try:
+        lines = body.decode("utf-8").splitlines()
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Batch body must be UTF-8 NDJSON")
+    batch_id = batch_id or "b-" + hashlib.sha256(body).hexdigest()[:16]
+    concurrency = min(concurrency or settings.batch_concurrency, settings.batch_max_concurrency)
+    try:
+        RUNNING_BATCHES.claim(batch_id)
+    except BatchRejected as r:
+        raise HTTPException(status_code=r.status, detail=r.detail,
+                            headers={"Retry-After": "30"} if r.status == 429 else None)
+    return StreamingResponse(
+        _stream_batch(batch_id, lines, graph, store, concurrency),
+        media_type="application/x-ndjson",
+        headers={"X-Batch-Id": batch_id, "Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/batch/{batch_id}")
+def chat_batch_status(batch_id: str, store: BatchStore = Depends(get_batch_store)):
+    """Recorded item counts per status, and whether the batch is streaming right now."""
+    return {**store.summary(batch_id), "running": batch_id in RUNNING_BATCHES}
+
+
+@router.post("/{user_id}")
+@traceable(name="http_chat_turn")
+async def chat(user_id: str, body: ChatBody, graph = Depends(get_graph)):
+    return {"answer": await run_turn(graph, user_id, body.message)}
+
+
+async def _stream_turn(request: Request, graph, user_id: str, message: str) -> AsyncIterator[str]:
+    # set inside the generator: it runs in the response task, after the endpoint has returned
+    current_user_id_ctx.set(user_id)
+    config = {"configurable": {"thread_id": user_id}}
+    # waits behind any turn already running on this thread (see chat())
+    async with THREAD_LOCKS.hold(user_id):
+        events = graph.astream_events({"messages": [("user", message)]}, config=config, version="v2")
+        try:
+            async for ev in events:
+                if await request.is_disconnected():
+                    logger.info(f"chat stream for {user_id}: client disconnected, cancelling run")
+                    break
+                kind, name = ev["event"], ev.get("name")
+                node = _top_node(ev)
+                if kind == "on_chain_end" and name == "supervisor":
+                    out = (ev.get("data") or {}).get("output")
+                    goto = getattr(out, "goto", None) if isinstance(out, Command) else None
+                    if isinstance(goto, (list, tuple)):
+                        goto = [getattr(g, "node", g) for g in goto]   # parallel fan-out (Send)
+                    yield _sse("route", {"next": "FINISH" if goto in (None, "__end__") else goto})
+                elif kind == "on_chain_start" and name in GRAPH_NODES - {"supervisor"} and node == name:
+                    yield _sse("worker_start", {"worker": name})
+                elif kind == "on_tool_start":
+                    yield _sse("tool_start", {"tool": name, "node": node, "input": ev["data"].get("input")})
+                elif kind == "on_tool_end":
+                    output = ev["data"].get("output")
+                    yield _sse("tool_end", {"tool": name, "node": node,
+                                            "output": getattr(output, "content", output)})
+                elif kind == "on_chat_model_stream":
+                    chunk = ev["data"].get("chunk")
+                    text = getattr(chunk, "content", "")
+                    if text and isinstance(text, str) and node not in ("supervisor", "compact_history"):
+                        yield _sse("token", {"node": node, "text": text})
+            else:
+                state = await graph.aget_state(config)
+                yield _sse("final", {"answer": _final_answer(state.values.get("messages", []))})
+        except Exception as e:
+            logger.warning(f"chat stream for {user_id} failed: {e}")
+            yield _sse("error", {"detail": str(e)})
+        finally:
+            # closing the generator cancels the in-flight graph run (disconnect or early exit)
+            await events.aclose()
+
+
+@router.post("/{user_id}/stream")
+async def chat_stream(user_id: str, body: ChatBody, request: Request, graph = Depends(get_graph)):
+    """Server-Sent Events: route, worker_start, tool_start, tool_end, token, then final (or error)."""
+    return StreamingResponse(
+        _stream_turn(request, graph, user_id, body.message),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
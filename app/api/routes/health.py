@@ -1,7 +1,20 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.services.readiness import READINESS
 
 router = APIRouter(tags=["health"])
 
 @router.get("/health")
 def health():
     return {"status": "ok"}
+
+@router.get("/health/live")
+def health_live():
+    """Liveness: the process is up and serving HTTP, whatever its backends are doing."""
+    return {"status": "ok", "uptime_s": READINESS.snapshot()["uptime_s"]}
+
+@router.get("/health/ready")
+def health_ready():
+    """Readiness: 200 once the required subsystems are up (optional ones may still be degraded), else 503."""
+    snap = READINESS.snapshot()
+    return JSONResponse(snap, status_code=200 if READINESS.is_ready else 503)
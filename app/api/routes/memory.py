@@ -1,15 +1,76 @@
 # app/api/routes/memory.py
-from fastapi import APIRouter, Depends
+import json
+from typing import Any, Dict, Iterator, List, Tuple
+from fastapi import APIRouter, Depends, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from app.api.deps import get_profile_store
 from app.db.profile_store import ProfileStore
 
 router = APIRouter(prefix="/memory", tags=["memory"])
 
+IMPORT_BATCH = 1000
+
 class RememberBody(BaseModel):
     key: str
     value: str
 
+
+def _rows_from_line(item: Dict[str, Any]) -> List[Tuple[str, str, Any]]:
+    """{"user_id", "key", "value"} or {"user_id", "profile": {key: value, ...}}."""
+    uid = item["user_id"]
+    if "profile" in item:
+        return [(uid, k, v) for k, v in item["profile"].items()]
+    return [(uid, item["key"], item["value"])]
+
+
+def _ndjson(rows: Iterator[Dict[str, Any]]) -> Iterator[bytes]:
+    for row in rows:
+        yield (json.dumps(row, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+
+# declared before /{user_id} so "export" isn't taken for a user id
+@router.get("/export")
+def export_memory(user_id: str | None = None, store: ProfileStore = Depends(get_profile_store)):
+    """Stream stored profile rows as NDJSON: one {"user_id", "key", "value", "updated_at"} per line."""
+    return StreamingResponse(_ndjson(store.iter_rows(user_id)), media_type="application/x-ndjson")
+
+
+@router.post("/import")
+async def import_memory(request: Request, store: ProfileStore = Depends(get_profile_store)):
+    """
+    Bulk upsert from an NDJSON request body, read as it streams in and written in
+    batches of IMPORT_BATCH rows (one transaction each). Bad lines are reported, not fatal.
+    """
+    imported, errors, batch = 0, [], []
+    buf, line_no = b"", 0
+
+    def take(line: bytes):
+        nonlocal line_no
+        line_no += 1
+        if not line.strip():
+            return
+        try:
+            batch.extend(_rows_from_line(json.loads(line)))
+        except Exception as e:
+            if len(errors) < 100:
+                errors.append({"line": line_no, "error": f"{type(e).__name__}: {e}"})
+
+    async for chunk in request.stream():
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            take(line)
+        if len(batch) >= IMPORT_BATCH:
+            imported += await run_in_threadpool(store.upsert_many, batch)
+            batch = []
+    take(buf)
+    if batch:
+        imported += await run_in_threadpool(store.upsert_many, batch)
+    return {"imported": imported, "lines": line_no, "errors": errors}
+
+
 @router.get("/{user_id}")
 def get_memory(user_id: str, store: ProfileStore = Depends(get_profile_store)):
     return store.get_profile(user_id)
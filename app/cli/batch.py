@@ -0,0 +1,85 @@
+"""
+Send a JSONL file of questions through POST /chat/batch and write the streamed results.
+
+Each input line becomes one item: id from "id" or "request_id" (else the line number),
+message from "message" (else "title" + "body", as in requests.jsonl), user_id from the
+line, else --user-id, else "<--user-prefix>-<id>" (one conversation thread per item).
+The batch id defaults to a hash of the input file, so rerunning the same command after an
+interruption resumes it: items that already succeeded come back without being rerun.
+
+    python -m app.cli.batch requests.jsonl --url http://localhost:8000 --out results.ndjson
+"""
+from __future__ import annotations
+import argparse, hashlib, json, sys, time
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+import httpx
+
+
+def to_items(lines: Iterator[str], user_id: str | None, user_prefix: str) -> Iterator[Dict[str, str]]:
+    for line_no, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        obj = json.loads(line)
+        item_id = str(obj.get("id") or obj.get("request_id") or line_no)
+        message = obj.get("message") or "\n\n".join(p for p in (obj.get("title"), obj.get("body")) if p)
+        if not message:
+            raise SystemExit(f"line {line_no}: no message (or title/body)")
+        yield {"id": item_id, "user_id": obj.get("user_id") or user_id or f"{user_prefix}-{item_id}",
+               "message": message}
+
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("input", help="JSONL file, one question per line")
+    ap.add_argument("--url", default="http://localhost:8000", help="API base URL")
+    ap.add_argument("--out", default=None, help="write result lines here (default: stdout)")
+    ap.add_argument("--batch-id", default=None, help="default: derived from the input file, so reruns resume")
+    ap.add_argument("--concurrency", type=int, default=None, help="items in flight (server default if omitted)")
+    ap.add_argument("--user-id", default=None, help="run every item on this user's thread")
+    ap.add_argument("--user-prefix", default="batch", help="per-item user id prefix when lines carry none")
+    args = ap.parse_args(argv)
+
+    raw = Path(args.input).read_bytes()
+    items = list(to_items(iter(raw.decode("utf-8").splitlines()), args.user_id, args.user_prefix))
+    body = "".join(json.dumps(it, ensure_ascii=False) + "\n" for it in items).encode("utf-8")
+    params = {"batch_id": args.batch_id or "cli-" + hashlib.sha256(raw).hexdigest()[:16]}
+    if args.concurrency:
+        params["concurrency"] = args.concurrency
+
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    done, failed, t0 = 0, 0, time.perf_counter()
+    try:
+        with httpx.Client(base_url=args.url, timeout=httpx.Timeout(30.0, read=None)) as client:
+            with client.stream("POST", "/chat/batch", params=params, content=body,
+                               headers={"Content-Type": "application/x-ndjson"}) as resp:
+                if resp.status_code != 200:
+                    resp.read()
+                    print(f"batch rejected: HTTP {resp.status_code} {resp.text}", file=sys.stderr)
+                    return 2
+                print(f"batch {resp.headers.get('X-Batch-Id')}: {len(items)} items", file=sys.stderr)
+                for line in resp.iter_lines():
+                    if not line:
+                        continue
+                    result = json.loads(line)
+                    if result.get("event") == "summary":
+                        print(f"\ndone in {time.perf_counter() - t0:.1f}s: {json.dumps(result['statuses'])}, "
+                              f"{result['resumed']} resumed", file=sys.stderr)
+                        continue
+                    out.write(line + "\n")
+                    out.flush()
+                    done += 1
+                    failed += result.get("status") != "ok"
+                    print(f"\r{done}/{len(items)} ({failed} failed)", end="", file=sys.stderr)
+    except httpx.HTTPError as e:
+        print(f"\nbatch interrupted after {done} results ({e}); rerun the same command to resume", file=sys.stderr)
+        return 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 1 if failed or done < len(items) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
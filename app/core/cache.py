@@ -0,0 +1,214 @@
+from __future__ import annotations
+import asyncio, json, sqlite3, threading, time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Hashable, Optional
+from app.core.metrics import SQLITE_WRITE_DURATION
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU map with optional per-entry TTL and hit/miss counters."""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING and self.ttl is not None and time.monotonic() - item[0] > self.ttl:
+                del self._data[key]
+                item = _MISSING
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+            return default if item is _MISSING else item[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits,
+                "misses": self.misses, "hit_rate": (self.hits / total) if total else 0.0}
+
+
+class PersistentCache:
+    """
+    String-keyed JSON cache in a SQLite table, so entries survive restarts.
+    Bounded by `maxsize` (least recently used rows are evicted) and an optional TTL.
+    One connection guarded by a lock; several caches may share a file (one table each).
+    """
+
+    def __init__(self, path: Path, table: str = "cache", maxsize: int = 10000, ttl: Optional[float] = None):
+        if not table.isidentifier():
+            raise ValueError(f"invalid cache table name: {table!r}")
+        self.path = Path(path)
+        self.table = table
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("PRAGMA synchronous=NORMAL;")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table}(accessed_at)")
+        self._conn.commit()
+        self._size = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                with self._conn:
+                    self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._size -= 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return default
+            with self._conn:
+                self._conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        now = time.time()
+        data = json.dumps(value, ensure_ascii=False, default=str)
+        with self._lock, SQLITE_WRITE_DURATION.time(db=self.path.stem), self._conn:
+            exists = self._conn.execute(f"SELECT 1 FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                f"INSERT INTO {self.table}(key, value, created_at, accessed_at) VALUES(?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, created_at = excluded.created_at, "
+                "accessed_at = excluded.accessed_at", (key, data, now, now))
+            if not exists:
+                self._size += 1
+            if self._size > self.maxsize:
+                # evict in slices of 10% so a full cache doesn't pay a DELETE on every insert
+                excess = self._size - self.maxsize + max(1, self.maxsize // 10)
+                self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY accessed_at LIMIT ?)", (excess,))
+                self._size -= excess
+
+    def pop(self, key: str) -> None:
+        with self._lock, self._conn:
+            if self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,)).rowcount:
+                self._size -= 1
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._size = 0
+
+    def purge_expired(self) -> int:
+        if self.ttl is None:
+            return 0
+        with self._lock, self._conn:
+            n = self._conn.execute(f"DELETE FROM {self.table} WHERE created_at < ?", (time.time() - self.ttl,)).rowcount
+            self._size -= n
+        return n
+
+    def __len__(self) -> int:
+        return self._size
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"size": self._size, "maxsize": self.maxsize, "ttl": self.ttl, "hits": self.hits,
+                "misses": self.misses, "hit_rate": (self.hits / total) if total else 0.0}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into one: the first caller runs `fn`,
+    callers arriving while it is in flight block and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict = {}
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event(), "value": None, "error": None}
+            else:
+                self.coalesced += 1
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["value"]
+        try:
+            call["value"] = fn()
+            return call["value"]
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call["done"].set()
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines on the event loop: concurrent awaits of the same key share
+    one run of `fn()`. The shared run is shielded, so one caller being cancelled (client
+    gone) doesn't fail the others.
+    """
+
+    def __init__(self):
+        self._calls: dict = {}
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        fut = self._calls.get(key)
+        if fut is None:
+            fut = self._calls[key] = asyncio.ensure_future(fn())
+            fut.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(fut)
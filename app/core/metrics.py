@@ -0,0 +1,183 @@
+"""
+Minimal in-process metrics with Prometheus text exposition (format 0.0.4).
+Counters, gauges and fixed-bucket histograms keyed by label values; each metric
+has its own lock and observe()/inc() are a dict lookup plus a bisect, so this
+stays on in production. Collectors add samples computed at scrape time
+(e.g. cache hit counters that already live elsewhere).
+"""
+from __future__ import annotations
+import bisect, threading, time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+Sample = Tuple[str, Dict[str, str], float]   # (name, labels, value)
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            return [(self.name, self._labels(k), v) for k, v in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}   # key -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            s[idx] += 1
+            s[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def samples(self) -> List[Sample]:
+        out: List[Sample] = []
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for key, s in series.items():
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), s[:-1]):
+                cumulative += n
+                out.append((f"{self.name}_bucket", {**labels, "le": _fmt_value(bound)}, cumulative))
+            out.append((f"{self.name}_sum", labels, s[-1]))
+            out.append((f"{self.name}_count", labels, cumulative))
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Tuple[str, str, str, Callable[[], Iterable[Sample]]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def get(self, name: str) -> _Metric | None:
+        with self._lock:
+            return self._metrics.get(name)
+
+    def collector(self, name: str, kind: str, help: str, fn: Callable[[], Iterable[Sample]]) -> None:
+        """Register a metric family whose samples are produced by `fn` at scrape time."""
+        with self._lock:
+            self._collectors.append((name, kind, help, fn))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines: List[str] = []
+        families = [(m.name, m.kind, m.help, m.samples) for m in metrics] + collectors
+        for name, kind, help, fn in families:
+            try:
+                samples = list(fn())
+            except Exception as e:   # one broken collector must not break the scrape
+                lines.append(f"# {name}: collector failed: {type(e).__name__}")
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{n}{_fmt_labels(l)} {_fmt_value(v)}" for n, l, v in samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Families shared across modules (HTTP middleware, graph callbacks, tools, stores).
+HTTP_IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "HTTP requests currently being served")
+HTTP_DURATION = REGISTRY.histogram("http_request_duration_seconds", "HTTP request latency",
+                                   ("method", "route", "status"))
+NODE_DURATION = REGISTRY.histogram("agent_node_duration_seconds", "Graph node latency", ("node",))
+TOOL_DURATION = REGISTRY.histogram("agent_tool_duration_seconds", "Tool call latency", ("tool", "status"))
+LLM_DURATION = REGISTRY.histogram("llm_request_duration_seconds", "LLM call latency (cache hits included)",
+                                  ("model",))
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "LLM tokens reported by the provider", ("model", "kind"))
+BACKEND_DURATION = REGISTRY.histogram("backend_request_duration_seconds",
+                                      "Latency of calls to external backends", ("backend", "op"))
+SQLITE_WRITE_DURATION = REGISTRY.histogram("sqlite_write_duration_seconds", "SQLite write transaction latency",
+                                           ("db",), buckets=FAST_BUCKETS)
@@ -0,0 +1,83 @@
+from __future__ import annotations
+import sqlite3, threading, time
+from pathlib import Path
+from typing import Any, Dict, Optional
+from app.core.metrics import SQLITE_WRITE_DURATION
+
+RECORD_SQL = """INSERT INTO batch_items(batch_id, item_id, user_id, message_sha, status, answer, error,
+                                        elapsed_ms, finished_at)
+                VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(batch_id, item_id) DO UPDATE SET
+                  user_id = excluded.user_id, message_sha = excluded.message_sha,
+                  status = excluded.status, answer = excluded.answer, error = excluded.error,
+                  elapsed_ms = excluded.elapsed_ms, finished_at = excluded.finished_at"""
+
+
+class BatchStore:
+    """
+    Per-item outcomes of /chat/batch runs (batches.sqlite3), keyed by (batch_id, item_id).
+    A batch re-posted under the same id replays the items recorded as "ok" for the same
+    message and reruns the rest. One connection under a lock; rows are small and written
+    one per finished item.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute("PRAGMA synchronous=NORMAL;")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS batch_items (
+              batch_id    TEXT NOT NULL,
+              item_id     TEXT NOT NULL,
+              user_id     TEXT NOT NULL,
+              message_sha TEXT NOT NULL,
+              status      TEXT NOT NULL,
+              answer      TEXT,
+              error       TEXT,
+              elapsed_ms  INTEGER,
+              finished_at REAL NOT NULL,
+              PRIMARY KEY (batch_id, item_id)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS batch_items_finished ON batch_items(finished_at)")
+        self.conn.commit()
+        self._lock = threading.Lock()
+
+    def get(self, batch_id: str, item_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT user_id, message_sha, status, answer, error, elapsed_ms FROM batch_items "
+                "WHERE batch_id = ? AND item_id = ?", (batch_id, item_id)).fetchone()
+        if row is None:
+            return None
+        keys = ("user_id", "message_sha", "status", "answer", "error", "elapsed_ms")
+        return dict(zip(keys, row))
+
+    def record(self, batch_id: str, item_id: str, user_id: str, message_sha: str, status: str,
+               answer: str | None = None, error: str | None = None, elapsed_ms: int | None = None) -> None:
+        params = (batch_id, item_id, user_id, message_sha, status, answer, error, elapsed_ms, time.time())
+        with self._lock:
+            with SQLITE_WRITE_DURATION.time(db="batches"), self.conn:
+                self.conn.execute(RECORD_SQL, params)
+
+    def summary(self, batch_id: str) -> Dict[str, Any]:
+        """Item counts per status for a batch (empty `statuses` if it was never run)."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT status, COUNT(*), MAX(finished_at) FROM batch_items WHERE batch_id = ? GROUP BY status",
+                (batch_id,)).fetchall()
+        statuses = {status: n for status, n, _ in rows}
+        last = max((ts for _, _, ts in rows), default=None)
+        return {"batch_id": batch_id, "items": sum(statuses.values()), "statuses": statuses, "last_finished_at": last}
+
+    def purge(self, older_than: float) -> int:
+        """Drop items finished more than `older_than` seconds ago; returns rows deleted."""
+        with self._lock:
+            with SQLITE_WRITE_DURATION.time(db="batches"), self.conn:
+                cur = self.conn.execute("DELETE FROM batch_items WHERE finished_at < ?", (time.time() - older_than,))
+        return cur.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
@@ -1,11 +1,41 @@
 from __future__ import annotations
-import sqlite3, json
+import sqlite3, json, threading
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from app.core.cache import LRUCache
 from app.core.logger import logger
+from app.core.metrics import SQLITE_WRITE_DURATION
+
+UPSERT_SQL = """INSERT INTO user_profile(user_id, key, value)
+                VALUES(?, ?, ?)
+                ON CONFLICT(user_id, key) DO UPDATE SET
+                  value = excluded.value,
+                  updated_at = CURRENT_TIMESTAMP"""
+
+
+def _serialize(v: Any) -> str:
+    return json.dumps(v, ensure_ascii=False) if isinstance(v, (dict, list)) else str(v)
+
+
+def _deserialize(v: Optional[str]) -> Any:
+    try:
+        return json.loads(v)
+    except Exception:
+        return v
+
 
 class ProfileStore:
-    def __init__(self, db_path: Path):
+    """
+    user_profile table with a per-user read-through LRU cache.
+    Writes go through one connection under a lock; reads use a per-thread connection
+    (WAL lets them run concurrently with the writer), so requests never share a cursor.
+
+    With flush_interval > 0, upsert() is write-behind: updates are coalesced per
+    (user_id, key) in memory, visible to get_profile() immediately, and written by a
+    background thread with one executemany per transaction. close() flushes what is left.
+    """
+    def __init__(self, db_path: Path, cache_size: int = 4096,
+                 flush_interval: float = 0.0, flush_batch: int = 1000):
         self.db_path = db_path
         self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
         self.conn.execute("PRAGMA journal_mode=WAL;")
@@ -20,34 +50,192 @@ class ProfileStore:
             )
         """)
         self.conn.commit()
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._cache = LRUCache(cache_size)
+        # bumped (and the user's entry dropped) under _pending_lock on every write; a read
+        # only fills the cache, under the same lock, if no write happened meanwhile
+        self._generation = 0
+
+        # write-behind state: queued updates, and the batch currently being written
+        self.flush_interval = flush_interval
+        self.flush_batch = max(1, flush_batch)
+        self._pending: Dict[str, Dict[str, str]] = {}
+        self._pending_count = 0
+        self._inflight: Dict[str, Dict[str, str]] = {}
+        self._pending_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._flusher: threading.Thread | None = None
+        self.flushed_rows = 0
+        self.flushes = 0
+        if flush_interval > 0:
+            self._flusher = threading.Thread(target=self._run_flusher, name="profile-write-behind", daemon=True)
+            self._flusher.start()
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            conn.execute("PRAGMA query_only=ON;")
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
 
     def get_profile(self, user_id: str) -> Dict[str, Any]:
-        cur = self.conn.execute("SELECT key, value FROM user_profile WHERE user_id = ?", (user_id,))
-        out: Dict[str, Any] = {}
-        for k, v in cur.fetchall():
-            try:
-                out[k] = json.loads(v)
-            except Exception:
-                out[k] = v
-        return out
+        cached = self._cache.get(user_id)
+        if cached is not None:
+            return dict(cached)
+        # snapshot queued writes before reading, so a flush landing mid-read can't hide them
+        with self._pending_lock:
+            generation = self._generation
+            unflushed = dict(self._inflight.get(user_id, {}))
+            unflushed.update(self._pending.get(user_id, {}))
+        cur = self._reader().execute("SELECT key, value FROM user_profile WHERE user_id = ?", (user_id,))
+        out: Dict[str, Any] = {k: _deserialize(v) for k, v in cur.fetchall()}
+        out.update({k: _deserialize(v) for k, v in unflushed.items()})
+        with self._pending_lock:
+            if generation == self._generation:
+                self._cache.set(user_id, out)
+        return dict(out)
 
     def upsert(self, user_id: str, updates: Dict[str, Any]) -> None:
         if not updates:
             return
-        with self.conn:
+        if self._flusher is None:
+            self.upsert_many((user_id, k, v) for k, v in updates.items())
+            return
+        with self._pending_lock:
+            bucket = self._pending.setdefault(user_id, {})
             for k, v in updates.items():
-                sv = json.dumps(v, ensure_ascii=False) if isinstance(v, (dict, list)) else str(v)
-                self.conn.execute(
-                    """INSERT INTO user_profile(user_id, key, value)
-                       VALUES(?, ?, ?)
-                       ON CONFLICT(user_id, key) DO UPDATE SET
-                         value = excluded.value,
-                         updated_at = CURRENT_TIMESTAMP""",
-                    (user_id, k, sv),
-                )
+                if k not in bucket:
+                    self._pending_count += 1
+                bucket[k] = _serialize(v)
+            self._generation += 1
+            self._cache.pop(user_id)
+            full = self._pending_count >= self.flush_batch
+        if full:
+            self._wake.set()
+
+    def upsert_many(self, rows: Iterable[Tuple[str, str, Any]]) -> int:
+        """Write (user_id, key, value) rows synchronously in a single transaction."""
+        params = [(uid, k, _serialize(v)) for uid, k, v in rows]
+        if not params:
+            return 0
+        # older queued values for these keys must not be flushed over the rows written here
+        # (an in-flight batch holds _write_lock, so it lands before them)
+        with self._pending_lock:
+            for uid, k, _ in params:
+                bucket = self._pending.get(uid)
+                if bucket is not None and bucket.pop(k, None) is not None:
+                    self._pending_count -= 1
+                    if not bucket:
+                        del self._pending[uid]
+        self._write(params)
+        return len(params)
+
+    def _write(self, params: List[Tuple[str, str, str]]) -> None:
+        with self._write_lock:
+            with SQLITE_WRITE_DURATION.time(db="profile"), self.conn:
+                self.conn.executemany(UPSERT_SQL, params)
+            with self._pending_lock:
+                self._generation += 1
+                for uid in {p[0] for p in params}:
+                    self._cache.pop(uid)
+
+    # ---- write-behind -------------------------------------------------------
+    def _run_flusher(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"profile write-behind flush failed, will retry: {e}")
+
+    def flush(self) -> int:
+        """Write all queued upserts now (one transaction); returns the number of rows written."""
+        with self._write_lock:
+            with self._pending_lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending, self._pending_count = self._pending, {}, 0
+                self._inflight = batch
+            params = [(uid, k, v) for uid, kv in batch.items() for k, v in kv.items()]
+            try:
+                with SQLITE_WRITE_DURATION.time(db="profile"), self.conn:
+                    self.conn.executemany(UPSERT_SQL, params)
+            except Exception:
+                # put the batch back underneath anything queued since, then surface the error
+                with self._pending_lock:
+                    for uid, kv in batch.items():
+                        newer = self._pending.get(uid, {})
+                        self._pending[uid] = {**kv, **newer}
+                    self._pending_count = sum(len(kv) for kv in self._pending.values())
+                    self._inflight = {}
+                raise
+            with self._pending_lock:
+                self._inflight = {}
+            self.flushes += 1
+            self.flushed_rows += len(params)
+        return len(params)
+
+    def queue_stats(self) -> dict:
+        with self._pending_lock:
+            pending = self._pending_count
+        return {"write_behind": self._flusher is not None, "pending_rows": pending,
+                "flushes": self.flushes, "flushed_rows": self.flushed_rows}
+
+    def cache_stats(self) -> dict:
+        return self._cache.stats()
+
+    # ---- bulk export --------------------------------------------------------
+    def iter_rows(self, user_id: str | None = None, chunk: int = 1000) -> Iterator[Dict[str, Any]]:
+        """
+        Every stored row as a dict, in (user_id, key) order. Pages by keyset on a private
+        connection so a long export never holds a read transaction or a request thread's cursor.
+        """
+        self.flush()
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        try:
+            last: Tuple[str, str] = ("", "")
+            while True:
+                if user_id is None:
+                    rows = conn.execute(
+                        "SELECT user_id, key, value, updated_at FROM user_profile "
+                        "WHERE (user_id, key) > (?, ?) ORDER BY user_id, key LIMIT ?",
+                        (*last, chunk)).fetchall()
+                else:
+                    rows = conn.execute(
+                        "SELECT user_id, key, value, updated_at FROM user_profile "
+                        "WHERE user_id = ? AND key > ? ORDER BY key LIMIT ?",
+                        (user_id, last[1], chunk)).fetchall()
+                if not rows:
+                    return
+                for uid, k, v, ts in rows:
+                    yield {"user_id": uid, "key": k, "value": _deserialize(v), "updated_at": ts}
+                last = (rows[-1][0], rows[-1][1])
+        finally:
+            conn.close()
 
     def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._flusher is not None:
+            self._flusher.join(10.0)
         try:
-            self.conn.close()
+            if self.flush():
+                # fold the WAL into the main file so the last batch survives anything short of disk loss
+                self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
         except Exception as e:
-            logger.warning(f"profile store close error: {e}")
+            logger.warning(f"profile store final flush error: {e}")
+        with self._readers_lock:
+            readers, self._readers = self._readers, []
+        for conn in readers + [self.conn]:
+            try:
+                conn.close()
+            except Exception as e:
+                logger.warning(f"profile store close error: {e}")
@@ -1,37 +1,170 @@
 # app/main.py (only the relevant parts shown)
-from fastapi import FastAPI
+import time
+_IMPORT_T0 = time.perf_counter()
+
+import threading
+from fastapi import FastAPI, Request
 from app.core.config import settings
 from app.core.logger import logger
 from app.db.profile_store import ProfileStore
+from app.db.batch_store import BatchStore
 from app.tools.memory_tools import set_profile_store
 from app.services.graph_runtime import graph_runtime
-from app.agents.unified_graph import build_graph
-from app.api.routes import health, chat, memory
+from app.agents.unified_graph import build_graph, ROUTE_FLIGHTS
+from app.services.ingest_worker import IngestionWorker
+from app.services.checkpoint_retention import CheckpointJanitor
+from app.services.readiness import READINESS
+from app.services.observability import register_cache_collector
+from app.services import llm_cache
+from app.core.metrics import REGISTRY, HTTP_IN_FLIGHT, HTTP_DURATION
+from app.services.concurrency import ADMISSION, AdmissionMiddleware
+from app.api.routes import health, chat, memory, admin, metrics
+import app.tools.nl2sql as nl2sql_mod
+import app.tools.rag as rag_mod
+import app.tools.web_search as web_search_mod
 from pathlib import Path
 
+READINESS.set_boot(_IMPORT_T0, time.perf_counter() - _IMPORT_T0)
+
 app = FastAPI(title="Unified Agents API", version="0.1.0")
+# bounded queue in front of the agent turns (429/503 + Retry-After when saturated);
+# added before the metrics middleware so rejected requests are still measured;
+# /chat/batch is long-lived and bounded by its own concurrency instead
+app.add_middleware(AdmissionMiddleware, controller=ADMISSION, prefixes=("/chat",), exclude=("/chat/batch",),
+                   thread_of=chat.thread_of_path)
+
+
+if settings.metrics_enabled:
+    @app.middleware("http")
+    async def http_metrics(request: Request, call_next):
+        HTTP_IN_FLIGHT.inc()
+        t0 = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # route template, not the raw path, so /memory/{user_id} stays one series
+            route = getattr(request.scope.get("route"), "path", "unmatched")
+            HTTP_DURATION.observe(time.perf_counter() - t0, method=request.method, route=route, status=str(status))
+
+
+def _register_cache_metrics():
+    def query_embeddings():
+        vs = rag_mod.VECTORSTORE
+        cache = getattr(getattr(vs, "embeddings", None), "cache", None)
+        return cache.stats() if cache is not None else None
+
+    def web_search_persistent():
+        return web_search_mod.PERSISTENT_CACHE.stats() if web_search_mod.PERSISTENT_CACHE is not None else None
+
+    register_cache_collector("rag_query_embedding", query_embeddings)
+    register_cache_collector("rag_answer", rag_mod.ANSWER_CACHE.stats)
+    register_cache_collector("profile", lambda: app.state.profile_store.cache_stats())
+    register_cache_collector("nl2sql_question_sql", nl2sql_mod.SQL_CACHE.stats)
+    register_cache_collector("nl2sql_sql_result", nl2sql_mod.RESULT_CACHE.stats)
+    register_cache_collector("web_search", web_search_mod.RESULT_CACHE.stats)
+    register_cache_collector("web_search_persistent", web_search_persistent)
+    for site in settings.llm_cache_sites:
+        register_cache_collector(f"llm_{site}", lambda site=site: llm_cache.cache_stats().get(site))
+
+
+_register_cache_metrics()
+
+
+def _coalesced_samples():
+    counts = {"routing": ROUTE_FLIGHTS.coalesced, "rag_answer": rag_mod.cache_stats()["coalesced"],
+              "nl2sql": nl2sql_mod.cache_stats()["coalesced"], "web_search": web_search_mod.cache_stats()["coalesced"],
+              "sql_schema": nl2sql_mod.SCHEMA.status()["coalesced_refreshes"]}
+    for site, n in counts.items():
+        yield ("coalesced_calls_total", {"site": site}, n)
+
+
+REGISTRY.collector("coalesced_calls_total", "counter", "Calls that shared an identical call already in flight",
+                   _coalesced_samples)
+
+
+def _warm_sql():
+    # first schema read connects to Postgres; done here so the first nl2sql question doesn't pay for it
+    with READINESS.track("sql"):
+        nl2sql_mod.SCHEMA.refresh()
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     Path(settings.data_dir).mkdir(parents=True, exist_ok=True)
-    profile_db = settings.data_dir / "profile.sqlite3"
-    store = ProfileStore(profile_db)
-    set_profile_store(store)
-    app.state.profile_store = store
+    app.state.graph = None
+    # heavy or remote resources warm up in the background; /health/ready reports their progress
+    threading.Thread(target=_warm_sql, name="sql-warmup", daemon=True).start()
+    app.state.ingestion_worker = IngestionWorker(str(settings.docs_dir), settings.docs_watch_interval)
+    app.state.ingestion_worker.start()
+
+    with READINESS.track("profile_store"):
+        profile_db = settings.data_dir / "profile.sqlite3"
+        store = ProfileStore(
+            profile_db,
+            cache_size=settings.profile_cache_size,
+            flush_interval=settings.profile_flush_interval,
+            flush_batch=settings.profile_flush_batch,
+        )
+        set_profile_store(store)
+        app.state.profile_store = store
+
+    app.state.batch_store = BatchStore(settings.data_dir / "batches.sqlite3")
+    if settings.batch_retention_days > 0:
+        purged = app.state.batch_store.purge(settings.batch_retention_days * 86400)
+        if purged:
+            logger.info(f"Purged {purged} batch results older than {settings.batch_retention_days} days")
 
-    graph_runtime.start()
-    app.state.graph = build_graph(graph_runtime.checkpointer, app.state.profile_store)
+    with READINESS.track("checkpointer"):
+        await graph_runtime.start()
+    if READINESS.state("checkpointer") == "ready" and READINESS.state("profile_store") == "ready":
+        with READINESS.track("graph"):
+            app.state.graph = build_graph(graph_runtime.checkpointer, app.state.profile_store)
+    failed = [name for name in READINESS.required if READINESS.state(name) != "ready"]
+    if failed:
+        # profile store and checkpointer are local SQLite files: a failure there (permissions,
+        # full disk, corruption) doesn't clear by itself, so fail startup and let the process
+        # manager restart us instead of answering /chat with a retryable 503 forever
+        try:
+            await on_shutdown()
+        except Exception as e:
+            logger.warning(f"cleanup after failed startup: {e}")
+        raise RuntimeError(f"required subsystems failed to start: {', '.join(failed)}; see the log above")
+    app.state.checkpoint_janitor = CheckpointJanitor(
+        graph_runtime.path,
+        keep_last=settings.checkpoint_keep_last,
+        thread_ttl=settings.checkpoint_thread_ttl_days * 86400,
+        interval=settings.checkpoint_retention_interval,
+        batch=settings.checkpoint_delete_batch,
+    )
+    app.state.checkpoint_janitor.start()
     logger.info("Startup complete")
 
 @app.on_event("shutdown")
-def on_shutdown():
+async def on_shutdown():
+    try:
+        app.state.ingestion_worker.stop()
+    except Exception:
+        pass
+    try:
+        app.state.checkpoint_janitor.stop()
+    except Exception:
+        pass
     try:
         app.state.profile_store.close()
     except Exception:
         pass
-    graph_runtime.stop()
+    try:
+        app.state.batch_store.close()
+    except Exception:
+        pass
+    await graph_runtime.stop()
     logger.info("Shutdown complete")
 
 app.include_router(health.router)
 app.include_router(chat.router)
 app.include_router(memory.router)
+app.include_router(admin.router)
+app.include_router(metrics.router)
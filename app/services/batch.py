@@ -0,0 +1,172 @@
+from __future__ import annotations
+import asyncio, hashlib, json, time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Set
+from app.core.config import settings
+from app.core.logger import logger
+from app.db.batch_store import BatchStore
+from app.services.concurrency import BackendBusy
+
+Turn = Callable[[str, str], Awaitable[str | None]]   # (user_id, message) -> final answer
+_DONE = object()
+
+
+@dataclass(frozen=True)
+class BatchItem:
+    item_id: str
+    user_id: str
+    message: str
+
+    @property
+    def sha(self) -> str:
+        return hashlib.sha256(f"{self.user_id}\x1f{self.message}".encode("utf-8")).hexdigest()
+
+
+def parse_item(line: str, line_no: int) -> BatchItem:
+    """One NDJSON line: {"user_id", "message"} plus an optional "id" (defaults to the line number)."""
+    try:
+        obj = json.loads(line)
+    except ValueError as e:
+        raise ValueError(f"line {line_no}: not JSON ({e})") from None
+    if not isinstance(obj, dict):
+        raise ValueError(f"line {line_no}: expected an object")
+    user_id, message = obj.get("user_id"), obj.get("message")
+    if not isinstance(user_id, str) or not user_id.strip():
+        raise ValueError(f"line {line_no}: missing user_id")
+    if not isinstance(message, str) or not message.strip():
+        raise ValueError(f"line {line_no}: missing message")
+    item_id = obj.get("id", line_no)
+    return BatchItem(str(item_id), user_id, message)
+
+
+class BatchRejected(Exception):
+    def __init__(self, status: int, detail: str):
+        super().__init__(detail)
+        self.status, self.detail = status, detail
+
+
+class RunningBatches:
+    """Batch ids currently streaming; caps how many run at once and refuses a second run of the same id."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._ids: Set[str] = set()
+
+    def claim(self, batch_id: str) -> None:
+        if batch_id in self._ids:
+            raise BatchRejected(409, f"batch {batch_id!r} is already running")
+        if self.limit > 0 and len(self._ids) >= self.limit:
+            raise BatchRejected(429, f"{len(self._ids)} batches already running")
+        self._ids.add(batch_id)
+
+    def release(self, batch_id: str) -> None:
+        self._ids.discard(batch_id)
+
+    def __contains__(self, batch_id: str) -> bool:
+        return batch_id in self._ids
+
+    def stats(self) -> Dict[str, Any]:
+        return {"limit": self.limit, "running": sorted(self._ids)}
+
+
+RUNNING_BATCHES = RunningBatches(settings.batch_max_running)
+
+
+async def _run_item(batch_id: str, item: BatchItem, turn: Turn, store: BatchStore,
+                    item_timeout: float | None) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    answer = error = None
+    try:
+        answer = await asyncio.wait_for(turn(item.user_id, item.message), item_timeout)
+        status = "ok"
+    except BackendBusy as e:   # a TimeoutError too, but not the item's own deadline
+        status, error = "error", str(e)
+    except asyncio.TimeoutError:
+        status, error = "timeout", f"no answer after {item_timeout}s"
+    except Exception as e:
+        status, error = "error", f"{type(e).__name__}: {e}"
+        logger.warning(f"batch {batch_id} item {item.item_id} failed: {error}")
+    elapsed_ms = int((time.perf_counter() - t0) * 1000)
+    try:
+        await asyncio.to_thread(store.record, batch_id, item.item_id, item.user_id, item.sha,
+                                status, answer, error, elapsed_ms)
+    except Exception as e:   # the result still goes out; this item just reruns on resume
+        logger.warning(f"batch {batch_id} item {item.item_id}: could not record result: {e}")
+    return {"event": "item", "id": item.item_id, "user_id": item.user_id, "status": status,
+            "answer": answer, "error": error, "elapsed_ms": elapsed_ms}
+
+
+async def run_batch(batch_id: str, lines: Iterable[str], turn: Turn, store: BatchStore,
+                    concurrency: int, item_timeout: float | None = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run every NDJSON item through `turn` with at most `concurrency` in flight and yield one
+    {"event": "item"} result per line as it completes (so not in input order), then a final
+    {"event": "summary"}. Items already recorded as "ok" for this batch_id and the same
+    (user_id, message) are replayed with "resumed": true instead of rerun; bad lines and
+    repeated ids come back as "invalid". Closing the iterator cancels the items in flight.
+    """
+    t0 = time.perf_counter()
+    slots = asyncio.Semaphore(max(1, concurrency))
+    results: asyncio.Queue = asyncio.Queue(maxsize=2 * max(1, concurrency))
+    running: Set[asyncio.Task] = set()
+
+    async def run_one(item: BatchItem) -> None:
+        # the slot is held until the result is queued: with a slow reader, items wait here
+        # instead of more of them starting
+        try:
+            await results.put(await _run_item(batch_id, item, turn, store, item_timeout))
+        finally:
+            slots.release()
+
+    async def produce() -> None:
+        seen: Set[str] = set()
+        try:
+            for line_no, line in enumerate(lines, 1):
+                if not line.strip():
+                    continue
+                try:
+                    item = parse_item(line, line_no)
+                except ValueError as e:
+                    await results.put({"event": "item", "id": str(line_no), "status": "invalid", "error": str(e)})
+                    continue
+                if item.item_id in seen:
+                    await results.put({"event": "item", "id": item.item_id, "status": "invalid",
+                                       "error": f"line {line_no}: duplicate id"})
+                    continue
+                seen.add(item.item_id)
+                done = await asyncio.to_thread(store.get, batch_id, item.item_id)
+                if done and done["status"] == "ok" and done["message_sha"] == item.sha:
+                    await results.put({"event": "item", "id": item.item_id, "user_id": item.user_id, "status": "ok",
+                                       "answer": done["answer"], "error": None, "elapsed_ms": done["elapsed_ms"],
+                                       "resumed": True})
+                    continue
+                await slots.acquire()
+                task = asyncio.create_task(run_one(item))
+                running.add(task)
+                task.add_done_callback(running.discard)
+            while running:
+                await asyncio.wait(set(running))
+            await results.put(_DONE)
+        except Exception as e:
+            await results.put(e)
+
+    counts: Dict[str, int] = {}
+    resumed = 0
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            result = await results.get()
+            if result is _DONE:
+                break
+            if isinstance(result, Exception):
+                raise result
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            resumed += bool(result.get("resumed"))
+            yield result
+        yield {"event": "summary", "batch_id": batch_id, "items": sum(counts.values()), "statuses": counts,
+               "resumed": resumed, "elapsed_s": round(time.perf_counter() - t0, 3)}
+    finally:
+        producer.cancel()
+        for task in list(running):
+            task.cancel()
+        await asyncio.gather(producer, *running, return_exceptions=True)
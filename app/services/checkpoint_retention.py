@@ -0,0 +1,207 @@
+from __future__ import annotations
+import sqlite3, threading, time
+from pathlib import Path
+from typing import Any, Dict, List
+from app.core.logger import logger
+from app.core.tracking import traceable
+
+_UUID6_EPOCH = 0x01B21DD213814000  # 100ns intervals between 1582-10-15 and 1970-01-01
+
+
+def checkpoint_time(checkpoint_id: str) -> float:
+    """Unix time encoded in a LangGraph checkpoint id (uuid6: time-ordered)."""
+    h = checkpoint_id.replace("-", "")
+    ticks = int(h[0:8] + h[8:12] + h[13:16], 16)
+    return (ticks - _UUID6_EPOCH) / 1e7
+
+
+def enable_incremental_vacuum(path: Path) -> None:
+    """
+    Switch the checkpoint DB to auto_vacuum=INCREMENTAL. Only takes effect after one
+    full VACUUM, so call this at startup, before the saver opens and traffic arrives.
+    """
+    conn = sqlite3.connect(str(path))
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            t0 = time.perf_counter()
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+            logger.info(f"Checkpoint DB switched to incremental vacuum in {time.perf_counter() - t0:.1f}s")
+    finally:
+        conn.close()
+
+
+class CheckpointJanitor:
+    """
+    Periodic retention for the LangGraph checkpoint DB:
+      * per thread keep the last `keep_last` root checkpoints, and everything newer than the
+        oldest of those (so subgraph namespaces of recent runs survive), delete the rest;
+      * drop threads whose newest checkpoint is older than `thread_ttl` seconds;
+      * then release free pages (incremental_vacuum) and truncate the WAL.
+    Works on its own connection in short, batched transactions so live requests keep writing.
+    """
+
+    def __init__(self, path: Path, keep_last: int = 20, thread_ttl: float = 30 * 86400,
+                 interval: float = 3600.0, batch: int = 200):
+        self.path = Path(path)
+        self.keep_last = keep_last
+        self.thread_ttl = thread_ttl
+        self.interval = interval
+        self.batch = max(1, batch)
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._run_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._last: Dict[str, Any] = {}
+        self._totals = {"runs": 0, "checkpoints_deleted": 0, "writes_deleted": 0,
+                        "threads_dropped": 0, "reclaimed_bytes": 0}
+
+    # ---- lifecycle -----------------------------------------------------------
+    def start(self) -> None:
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="checkpoint-janitor", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def trigger(self) -> None:
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.warning(f"checkpoint retention failed: {e}")
+                with self._lock:
+                    self._last = {"error": str(e), "finished_at": time.time()}
+
+    # ---- stats ---------------------------------------------------------------
+    def _file_bytes(self) -> Dict[str, int]:
+        def size(p: Path) -> int:
+            try:
+                return p.stat().st_size
+            except OSError:
+                return 0
+        db = size(self.path)
+        wal = size(self.path.with_name(self.path.name + "-wal"))
+        return {"db_bytes": db, "wal_bytes": wal, "total_bytes": db + wal}
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = dict(self._file_bytes())
+        conn = self._connect()
+        try:
+            out["checkpoints"] = conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+            out["writes"] = conn.execute("SELECT COUNT(*) FROM writes").fetchone()[0]
+            out["threads"] = conn.execute("SELECT COUNT(DISTINCT thread_id) FROM checkpoints").fetchone()[0]
+            out["free_pages"] = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        except sqlite3.OperationalError:
+            pass  # tables not created yet
+        finally:
+            conn.close()
+        with self._lock:
+            out["totals"] = dict(self._totals)
+            out["last_run"] = dict(self._last)
+        out["policy"] = {"keep_last": self.keep_last, "thread_ttl_s": self.thread_ttl, "interval_s": self.interval}
+        return out
+
+    # ---- work ----------------------------------------------------------------
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.path), timeout=5.0, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def _delete_threads(self, conn: sqlite3.Connection, threads: List[str]) -> tuple[int, int]:
+        cps = wrs = 0
+        for i in range(0, len(threads), self.batch):
+            chunk = threads[i:i + self.batch]
+            marks = ",".join("?" * len(chunk))
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                cps += conn.execute(f"DELETE FROM checkpoints WHERE thread_id IN ({marks})", chunk).rowcount
+                wrs += conn.execute(f"DELETE FROM writes WHERE thread_id IN ({marks})", chunk).rowcount
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            time.sleep(0)  # let live writers in between batches
+        return cps, wrs
+
+    def _prune_thread(self, conn: sqlite3.Connection, thread_id: str) -> tuple[int, int]:
+        row = conn.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = '' "
+            "ORDER BY checkpoint_id DESC LIMIT 1 OFFSET ?",
+            (thread_id, self.keep_last - 1),
+        ).fetchone()
+        if row is None:
+            return 0, 0
+        cutoff = row[0]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cps = conn.execute("DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_id < ?",
+                               (thread_id, cutoff)).rowcount
+            wrs = conn.execute("DELETE FROM writes WHERE thread_id = ? AND checkpoint_id < ?",
+                               (thread_id, cutoff)).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cps, wrs
+
+    @traceable(name="checkpoint_retention_run")
+    def run_once(self) -> Dict[str, Any]:
+        with self._run_lock:
+            t0 = time.perf_counter()
+            before = self._file_bytes()["total_bytes"]
+            conn = self._connect()
+            try:
+                try:
+                    latest = conn.execute(
+                        "SELECT thread_id, MAX(checkpoint_id) FROM checkpoints GROUP BY thread_id").fetchall()
+                except sqlite3.OperationalError:
+                    return {}
+                now = time.time()
+                idle = [tid for tid, cid in latest if self.thread_ttl > 0 and now - checkpoint_time(cid) > self.thread_ttl]
+                cps, wrs = self._delete_threads(conn, idle)
+                if self.keep_last > 0:
+                    idle_set = set(idle)
+                    for tid, _ in latest:
+                        if tid in idle_set or self._stop.is_set():
+                            continue
+                        c, w = self._prune_thread(conn, tid)
+                        cps, wrs = cps + c, wrs + w
+                # hand freed pages back to the OS a slice at a time, then fold the WAL into the DB
+                while conn.execute("PRAGMA freelist_count").fetchone()[0] > 0 and not self._stop.is_set():
+                    conn.execute("PRAGMA incremental_vacuum(2000)")
+                wal = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+            finally:
+                conn.close()
+            after = self._file_bytes()["total_bytes"]
+            result = {
+                "finished_at": time.time(),
+                "duration_s": round(time.perf_counter() - t0, 3),
+                "threads_dropped": len(idle),
+                "checkpoints_deleted": cps,
+                "writes_deleted": wrs,
+                "reclaimed_bytes": max(0, before - after),
+                "wal_checkpoint_busy": bool(wal[0]) if wal else None,
+            }
+            with self._lock:
+                self._last = result
+                self._totals["runs"] += 1
+                for k in ("checkpoints_deleted", "writes_deleted", "threads_dropped", "reclaimed_bytes"):
+                    self._totals[k] += result[k]
+            logger.info(f"checkpoint retention: dropped {len(idle)} idle threads, {cps} checkpoints, "
+                        f"{wrs} writes; reclaimed {result['reclaimed_bytes']} bytes in {result['duration_s']}s")
+            return result
@@ -0,0 +1,340 @@
+from __future__ import annotations
+import asyncio, math, threading, time
+from collections import deque
+from contextlib import asynccontextmanager, nullcontext
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+from fastapi.responses import JSONResponse
+from app.core.config import settings
+from app.core.metrics import REGISTRY, FAST_BUCKETS, Sample
+
+BACKEND_QUEUE = REGISTRY.histogram("backend_queue_seconds", "Time spent waiting for a backend slot", ("backend",))
+BACKEND_TIMEOUTS = REGISTRY.counter("backend_queue_timeouts_total", "Calls that gave up waiting for a backend slot",
+                                    ("backend",))
+ADMISSION_QUEUE = REGISTRY.histogram("admission_queue_seconds", "Time a request waited for an admission slot")
+ADMISSION_REJECTED = REGISTRY.counter("admission_rejected_total", "Requests turned away by admission control",
+                                      ("reason",))
+THREAD_LOCK_WAIT = REGISTRY.histogram("thread_lock_wait_seconds", "Time a turn waited for the previous turn "
+                                      "of the same thread", buckets=FAST_BUCKETS + (2.5, 10.0, 30.0))
+
+
+class BackendBusy(TimeoutError):
+    """No backend slot freed up within backend_queue_timeout."""
+
+
+class BackendLimiter:
+    """
+    Counting semaphore for one backend, shared by async callers (graph nodes on the event
+    loop) and sync callers (tools running in worker threads). Slots are granted in FIFO
+    order; time spent queued goes to backend_queue_seconds{backend}.
+    """
+
+    def __init__(self, name: str, limit: int, timeout: float | None):
+        self.name, self.limit, self.timeout = name, limit, timeout
+        self._lock = threading.Lock()
+        self._free = limit
+        self._waiters: Deque[Any] = deque()   # threading.Event (sync) or (loop, future) (async)
+        self.acquired = 0
+        self.timeouts = 0
+        self.peak_waiting = 0
+
+    def _take_or_enqueue(self, waiter) -> bool:
+        with self._lock:
+            if self._free > 0 and not self._waiters:
+                self._free -= 1
+                return True
+            self._waiters.append(waiter)
+            self.peak_waiting = max(self.peak_waiting, len(self._waiters))
+            return False
+
+    def _withdraw(self, waiter) -> bool:
+        """Drop a waiter that gave up; False if a slot was already handed to it."""
+        with self._lock:
+            try:
+                self._waiters.remove(waiter)
+                return True
+            except ValueError:
+                return False
+
+    def _granted(self, t0: float) -> None:
+        self.acquired += 1
+        BACKEND_QUEUE.observe(time.perf_counter() - t0, backend=self.name)
+
+    def _timed_out(self) -> BackendBusy:
+        self.timeouts += 1
+        BACKEND_TIMEOUTS.inc(backend=self.name)
+        return BackendBusy(f"{self.name} is busy: no free slot (limit {self.limit}) after {self.timeout}s")
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    return
+                loop, fut = waiter
+                try:
+                    loop.call_soon_threadsafe(self._hand_over, fut)
+                    return
+                except RuntimeError:   # that caller's loop is closed; try the next one
+                    continue
+            self._free += 1
+
+    def _hand_over(self, fut: asyncio.Future) -> None:
+        if fut.cancelled():
+            self.release()   # the caller gave up after the slot was passed to it
+        else:
+            fut.set_result(None)
+
+    # ---- sync ------------------------------------------------------------------
+    def acquire(self) -> None:
+        t0, ev = time.perf_counter(), threading.Event()
+        if not self._take_or_enqueue(ev):
+            if not ev.wait(self.timeout) and self._withdraw(ev):
+                raise self._timed_out()
+        self._granted(t0)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+    # ---- async -----------------------------------------------------------------
+    async def acquire_async(self) -> None:
+        t0 = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        if not self._take_or_enqueue(waiter):
+            try:
+                await asyncio.wait_for(waiter[1], self.timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if not self._withdraw(waiter) and waiter[1].done() and not waiter[1].cancelled():
+                    self.release()
+                if isinstance(e, asyncio.TimeoutError):
+                    raise self._timed_out() from None
+                raise
+        self._granted(t0)
+
+    async def __aenter__(self):
+        await self.acquire_async()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_use, waiting = self.limit - self._free, len(self._waiters)
+        return {"limit": self.limit, "in_use": in_use, "waiting": waiting, "peak_waiting": self.peak_waiting,
+                "acquired": self.acquired, "timeouts": self.timeouts}
+
+
+_LIMITERS: Dict[str, BackendLimiter] = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def backend_limiter(name: str):
+    """
+    The shared limiter for a backend (ollama, openai, tavily, sql, qdrant, ...); use as
+    `with` from threads or `async with` on the loop. Backends without a positive entry in
+    BACKEND_LIMITS are unlimited and get a no-op context.
+    """
+    limit = settings.backend_limits.get(name, 0)
+    if limit <= 0:
+        return nullcontext()
+    with _LIMITERS_LOCK:
+        if name not in _LIMITERS:
+            _LIMITERS[name] = BackendLimiter(name, limit, settings.backend_queue_timeout or None)
+        return _LIMITERS[name]
+
+
+def llm_backend(model: str) -> str:
+    """Backend name for a "provider:model" setting (same defaults as get_router_llm)."""
+    return "ollama" if model.startswith("ollama:") else "openai"
+
+
+def backend_stats() -> Dict[str, Dict[str, Any]]:
+    with _LIMITERS_LOCK:
+        limiters = dict(_LIMITERS)
+    return {name: lim.stats() for name, lim in limiters.items()}
+
+
+def _backend_samples(field: str) -> Iterable[Sample]:
+    for name, s in backend_stats().items():
+        yield (f"backend_{field}", {"backend": name}, s[field])
+
+
+REGISTRY.collector("backend_in_use", "gauge", "Backend slots in use", lambda: _backend_samples("in_use"))
+REGISTRY.collector("backend_waiting", "gauge", "Calls queued for a backend slot", lambda: _backend_samples("waiting"))
+
+
+class Rejected(Exception):
+    def __init__(self, status: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status, self.reason, self.retry_after = status, reason, retry_after
+
+
+class AdmissionController:
+    """
+    Global cap on concurrent agent turns with a bounded wait queue. A request that finds
+    the queue full is rejected at once (429); one that waits longer than queue_timeout
+    gives up (503). Both carry a Retry-After estimated from recent turn durations.
+    A thread (user_id) with max_per_thread turns already running or queued is rejected
+    too (429): its turns run one at a time anyway, and would otherwise sit on slots
+    other users could run in. Lives on the event loop, so the counters need no lock.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float, max_per_thread: int = 0):
+        self.max_concurrent, self.max_queue, self.queue_timeout = max_concurrent, max_queue, queue_timeout
+        self.max_per_thread = max_per_thread
+        self._sem: asyncio.Semaphore | None = None
+        self._threads: Dict[str, int] = {}   # thread -> turns running or queued
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "queue_timeout": 0, "thread_busy": 0}
+        self._turn_seconds = 5.0   # EWMA of turn duration, seeds Retry-After
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrent > 0
+
+    def retry_after(self) -> int:
+        backlog = (self.waiting + 1) / max(self.max_concurrent, 1)
+        return max(1, min(60, math.ceil(backlog * self._turn_seconds)))
+
+    def _reject(self, status: int, reason: str) -> Rejected:
+        self.rejected[reason] += 1
+        ADMISSION_REJECTED.inc(reason=reason)
+        return Rejected(status, reason, self.retry_after())
+
+    async def acquire(self, thread: str | None = None) -> None:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_concurrent)
+        if thread is not None and self.max_per_thread > 0:
+            if self._threads.get(thread, 0) >= self.max_per_thread:
+                raise self._reject(429, "thread_busy")
+            self._threads[thread] = self._threads.get(thread, 0) + 1
+        try:
+            await self._admit()
+        except BaseException:
+            self._leave(thread)
+            raise
+
+    def _leave(self, thread: str | None) -> None:
+        n = self._threads.get(thread, 0) - 1 if thread is not None else 0
+        if n > 0:
+            self._threads[thread] = n
+        else:
+            self._threads.pop(thread, None)
+
+    async def _admit(self) -> None:
+        t0 = time.perf_counter()
+        if not self._sem.locked():
+            await self._sem.acquire()   # free slot: taken without suspending
+        elif self.waiting >= self.max_queue:
+            raise self._reject(429, "queue_full")
+        else:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._sem.acquire(), self.queue_timeout or None)
+            except asyncio.TimeoutError:
+                raise self._reject(503, "queue_timeout") from None
+            finally:
+                self.waiting -= 1
+        ADMISSION_QUEUE.observe(time.perf_counter() - t0)
+        self.running += 1
+        self.admitted += 1
+
+    def release(self, seconds: float, thread: str | None = None) -> None:
+        self._turn_seconds = 0.8 * self._turn_seconds + 0.2 * seconds
+        self.running -= 1
+        self._sem.release()
+        self._leave(thread)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "max_concurrent": self.max_concurrent, "max_queue": self.max_queue,
+                "queue_timeout": self.queue_timeout, "max_per_thread": self.max_per_thread,
+                "running": self.running, "waiting": self.waiting,
+                "admitted": self.admitted, "rejected": dict(self.rejected),
+                "avg_turn_seconds": round(self._turn_seconds, 3), "retry_after": self.retry_after()}
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware sending requests under `prefixes` (minus the `exclude` paths and their
+    sub-paths) through an AdmissionController. The slot is held until the response is fully
+    sent, so a streamed turn counts for its whole duration. `thread_of` maps a path to its
+    conversation thread for the per-thread cap.
+    """
+
+    def __init__(self, app, controller: AdmissionController, prefixes: Tuple[str, ...] = ("/chat",),
+                 exclude: Tuple[str, ...] = (), thread_of: Callable[[str], Optional[str]] | None = None):
+        self.app, self.controller, self.prefixes, self.exclude = app, controller, prefixes, exclude
+        self.thread_of = thread_of
+
+    def _admits(self, path: str) -> bool:
+        return path.startswith(self.prefixes) and not any(path == e or path.startswith(e + "/") for e in self.exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.controller.enabled or not self._admits(scope["path"]):
+            return await self.app(scope, receive, send)
+        thread = self.thread_of(scope["path"]) if self.thread_of is not None else None
+        try:
+            await self.controller.acquire(thread)
+        except Rejected as r:
+            detail = {"queue_full": "Too many requests queued", "queue_timeout": "Timed out waiting for a free slot",
+                      "thread_busy": "A turn for this user is already running and another is queued"}[r.reason]
+            response = JSONResponse({"detail": detail, "reason": r.reason}, status_code=r.status,
+                                    headers={"Retry-After": str(r.retry_after)})
+            return await response(scope, receive, send)
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(time.perf_counter() - t0, thread)
+
+
+class ThreadLocks:
+    """
+    One asyncio.Lock per conversation thread: turns for the same thread_id run one after
+    another (they share a checkpoint), different threads run in parallel. Entries are
+    dropped once no turn holds or waits on them. Per process, like the event loop.
+    """
+
+    def __init__(self):
+        self._locks: Dict[str, List[Any]] = {}   # thread_id -> [lock, holders + waiters]
+
+    @asynccontextmanager
+    async def hold(self, thread_id: str):
+        entry = self._locks.get(thread_id)
+        if entry is None:
+            entry = self._locks[thread_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        t0 = time.perf_counter()
+        try:
+            async with entry[0]:
+                THREAD_LOCK_WAIT.observe(time.perf_counter() - t0)
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._locks.pop(thread_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"active_threads": len(self._locks),
+                "queued_turns": sum(max(0, n - 1) for _, n in self._locks.values())}
+
+
+ADMISSION = AdmissionController(settings.max_concurrent_requests, settings.max_queued_requests,
+                                settings.request_queue_timeout, settings.max_turns_per_thread)
+THREAD_LOCKS = ThreadLocks()
+REGISTRY.collector("admission_running", "gauge", "Agent turns currently admitted",
+                   lambda: [("admission_running", {}, ADMISSION.running)])
+REGISTRY.collector("admission_waiting", "gauge", "Requests waiting for an admission slot",
+                   lambda: [("admission_waiting", {}, ADMISSION.waiting)])
+
+
+def stats() -> Dict[str, Any]:
+    return {"admission": ADMISSION.stats(), "threads": THREAD_LOCKS.stats(), "backends": backend_stats()}
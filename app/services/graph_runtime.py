@@ -2,23 +2,39 @@ from __future__ import annotations
 import contextvars
 from pathlib import Path
 import sqlite3
-from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from app.core.config import settings
 from app.core.logger import logger
+from app.core.metrics import SQLITE_WRITE_DURATION
 from app.core.tracking import traceable
+from app.services.checkpoint_retention import enable_incremental_vacuum
 
 # current user context used by memory tools
 current_user_id_ctx: contextvars.ContextVar[str] = contextvars.ContextVar("current_user_id", default="default_user")
 
+class TimedSqliteSaver(AsyncSqliteSaver):
+    """AsyncSqliteSaver that reports checkpoint write latency to /metrics."""
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        with SQLITE_WRITE_DURATION.time(db="graph_state"):
+            return await super().aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, *args, **kwargs):
+        with SQLITE_WRITE_DURATION.time(db="graph_state"):
+            return await super().aput_writes(config, writes, task_id, *args, **kwargs)
+
+
 class GraphRuntime:
     """
     Holds the LangGraph checkpointer and lifecycle.
-    We manually enter/exit the SqliteSaver context on app startup/shutdown.
+    We manually enter/exit the AsyncSqliteSaver context on app startup/shutdown.
+    The graph is driven with ainvoke/astream_events; sync calls still work from
+    worker threads (the saver hops onto its event loop).
     """
     def __init__(self, path: Path):
         self.path = path
         self._cm = None
-        self.checkpointer: SqliteSaver | None = None
+        self.checkpointer: AsyncSqliteSaver | None = None
 
     def _ensure_file(self, p: Path):
         p.parent.mkdir(parents=True, exist_ok=True)
@@ -28,19 +44,22 @@ class GraphRuntime:
             conn.execute("PRAGMA synchronous=NORMAL;")
         finally:
             conn.close()
+        # freed pages are returned by the retention job via incremental_vacuum
+        enable_incremental_vacuum(p)
 
     @traceable(name="graph_runtime_start")
-    def start(self):
+    async def start(self):
         self._ensure_file(self.path)
-        self._cm = SqliteSaver.from_conn_string(self.path.as_posix())
-        self.checkpointer = self._cm.__enter__()
-        logger.info(f"SqliteSaver open at {self.path}")
+        saver = TimedSqliteSaver if settings.metrics_enabled else AsyncSqliteSaver
+        self._cm = saver.from_conn_string(self.path.as_posix())
+        self.checkpointer = await self._cm.__aenter__()
+        logger.info(f"AsyncSqliteSaver open at {self.path}")
 
     @traceable(name="graph_runtime_stop")
-    def stop(self):
+    async def stop(self):
         if self._cm:
-            self._cm.__exit__(None, None, None)
-            logger.info("SqliteSaver closed")
+            await self._cm.__aexit__(None, None, None)
+            logger.info("AsyncSqliteSaver closed")
             self._cm = None
             self.checkpointer = None
 
@@ -0,0 +1,129 @@
+from __future__ import annotations
+import threading, time
+from typing import Any, Dict
+from app.core.logger import logger
+from app.core.tracking import traceable
+from app.services.readiness import READINESS, ERROR, READY, STARTING
+import app.tools.rag as rag_mod  # module, so refreshes land on rag_mod.VECTORSTORE
+
+
+class IngestionWorker:
+    """
+    Background thread that opens the RAG index (embedding model, vector backend, first
+    full sync) after startup, then polls docs_dir and indexes new/changed/deleted files
+    off the request path via rag_mod.refresh_vectorstore. One worker, one sync at a time.
+    If the index can't be opened (e.g. Qdrant is down) it retries on every poll.
+    """
+
+    def __init__(self, docs_dir: str, interval: float = 30.0):
+        self.docs_dir = docs_dir
+        self.interval = interval
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._status: Dict[str, Any] = {
+            "state": "idle",          # initializing | idle | indexing | error | stopped
+            "queue_depth": 0,         # files detected but not yet processed
+            "in_progress": None,
+            "last_scan_at": None,
+            "last_sync_at": None,
+            "last_error": None,
+            "syncs": 0,
+            "files_indexed": 0,
+            "chunks_indexed": 0,
+        }
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="rag-ingestion-worker", daemon=True)
+        self._thread.start()
+        if self.interval > 0:
+            logger.info(f"Ingestion worker watching {self.docs_dir} every {self.interval:g}s")
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._update(state="stopped")
+
+    def trigger(self) -> None:
+        """Ask for a rescan now instead of waiting for the next poll."""
+        self._wake.set()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._status)
+        out["corpus_version"] = rag_mod.ANSWER_CACHE.corpus_version
+        out["running"] = self._thread is not None and self._thread.is_alive()
+        return out
+
+    def _update(self, **kw) -> None:
+        with self._lock:
+            self._status.update(kw)
+
+    def _initialize(self) -> bool:
+        """Open the index and run the first full sync; on failure the API keeps serving without RAG."""
+        self._update(state="initializing")
+        READINESS.mark("vectorstore", STARTING)
+        try:
+            rag_mod.initialize_vectorstore(self.docs_dir, sync=False)
+            self._sync(force=True)
+        except Exception as e:
+            logger.warning(f"RAG index unavailable, will retry: {e}")
+            self._update(state="error", last_error=str(e), in_progress=None)
+            READINESS.mark("vectorstore", ERROR, str(e))
+            return False
+        READINESS.mark("vectorstore", READY)
+        return True
+
+    def _run(self) -> None:
+        ready = self._initialize()
+        if self.interval <= 0:
+            return   # watcher disabled: the startup sync was all we do
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            if not ready:
+                ready = self._initialize()
+            else:
+                self.sync_once()
+
+    def _on_plan(self, plan) -> None:
+        # removals are applied up front by sync_files; only files to embed are queued
+        self._update(last_scan_at=time.time(), queue_depth=len(plan.to_embed))
+        if plan.to_embed or plan.removed:
+            self._update(state="indexing")
+
+    def _on_file(self, path: str) -> None:
+        with self._lock:
+            self._status["queue_depth"] = max(0, self._status["queue_depth"] - 1)
+            self._status["in_progress"] = path
+
+    def _sync(self, force: bool = False):
+        stats = rag_mod.refresh_vectorstore(self.docs_dir, force=force,
+                                            on_plan=self._on_plan, on_file=self._on_file)
+        if stats is None:
+            self._update(state="idle", in_progress=None)
+            return None
+        with self._lock:
+            self._status.update(state="idle", in_progress=None, last_sync_at=time.time(), last_error=None,
+                                queue_depth=0)
+            self._status["syncs"] += 1
+            self._status["files_indexed"] += stats.files
+            self._status["chunks_indexed"] += stats.chunks
+        return stats
+
+    @traceable(name="ingestion_worker_sync")
+    def sync_once(self, force: bool = False):
+        try:
+            return self._sync(force)
+        except Exception as e:
+            logger.warning(f"Ingestion worker sync failed: {e}")
+            self._update(state="error", last_error=str(e), in_progress=None)
+            return None
@@ -0,0 +1,327 @@
+from __future__ import annotations
+import multiprocessing, os, queue, time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+from langchain_core.documents import Document
+from langchain_community.document_loaders import Docx2txtLoader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import PointIdsList, PointStruct
+from app.core.logger import logger
+from app.services.vectorstore import IngestManifest, IngestPlan, chunk_point_id
+
+
+def iter_pdf_pages(path: str) -> Iterator[Document]:
+    """
+    A PDF's pages one at a time, as PyPDFLoader gives them (same text, source and page
+    metadata). Its lazy_load collects every page first, and pypdf keeps each object it
+    has resolved, so here the reader's object cache is dropped after every page: a page
+    is re-read from the file if it is needed again, and memory stays flat with page count.
+    """
+    import pypdf
+    with open(path, "rb") as f:
+        reader = pypdf.PdfReader(f)
+        for page_number, page in enumerate(reader.pages):
+            text = page.extract_text()
+            reader.resolved_objects.clear()
+            yield Document(page_content=text, metadata={"source": path, "page": page_number})
+
+
+def iter_chunks(path: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> Iterator[Document]:
+    """
+    Stream one PDF/DOCX as chunks, a page at a time: only the current page and its chunks
+    are held, whatever the file size (a DOCX is a single document, so it is read whole).
+    Splitting is per page, as split_documents did over the loaded pages, so the chunks
+    (and point ids) are the same.
+    """
+    pages = iter_pdf_pages(path) if path.lower().endswith(".pdf") else Docx2txtLoader(path).lazy_load()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    for page in pages:
+        page.metadata = page.metadata or {}
+        page.metadata.setdefault("source", path)
+        yield from splitter.split_documents([page])
+
+
+def load_and_split(path: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[Document]:
+    """Parse one PDF/DOCX into a list of chunks (benchmarks, small files); indexing streams iter_chunks."""
+    return list(iter_chunks(path, chunk_size, chunk_overlap))
+
+
+def _batched(items: Iterable[Document], size: int) -> Iterator[List[Document]]:
+    batch: List[Document] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# parse events: ("chunks", path, [Document]) in file order, then ("done", path, n_chunks)
+# or ("failed", path, reason) once per file
+ParseEvent = Tuple[str, str, Any]
+_EVENTS: Any = None   # the parent's queue, set in each parser process by _init_parser
+
+
+def _init_parser(events) -> None:
+    global _EVENTS
+    _EVENTS = events
+
+
+def _parse_to_queue(path: str, batch_size: int) -> None:
+    """Worker task: stream one file's chunk batches to the parent. Top-level so it pickles."""
+    n = 0
+    try:
+        for batch in _batched(iter_chunks(path), batch_size):
+            n += len(batch)
+            _EVENTS.put(("chunks", path, batch))
+    except Exception as e:
+        _EVENTS.put(("failed", path, str(e)))
+        return
+    _EVENTS.put(("done", path, n))
+
+
+def _iter_local(paths: List[str], batch_size: int) -> Iterator[ParseEvent]:
+    for path in paths:
+        n = 0
+        try:
+            for batch in _batched(iter_chunks(path), batch_size):
+                n += len(batch)
+                yield "chunks", path, batch
+        except Exception as e:
+            yield "failed", path, str(e)
+            continue
+        yield "done", path, n
+
+
+def _iter_pool(paths: List[str], workers: int, batch_size: int, max_inflight: int) -> Iterator[ParseEvent]:
+    ctx = multiprocessing.get_context("spawn")
+    events = ctx.Queue(maxsize=max(1, max_inflight))
+    pool = ProcessPoolExecutor(max_workers=min(workers, len(paths)), mp_context=ctx,
+                               initializer=_init_parser, initargs=(events,))
+    futures = {pool.submit(_parse_to_queue, p, batch_size): p for p in paths}
+    finished: set = set()
+    try:
+        while len(finished) < len(paths):
+            try:
+                kind, path, payload = events.get(timeout=1.0)
+            except queue.Empty:
+                for fut, path in futures.items():
+                    if path not in finished and fut.done() and fut.exception() is not None:
+                        # the worker died (e.g. OOM-killed) before it could report
+                        finished.add(path)
+                        yield "failed", path, repr(fut.exception())
+                continue
+            if path in finished:
+                continue
+            if kind != "chunks":
+                finished.add(path)
+            yield kind, path, payload
+    finally:
+        # on early exit, parsers may be blocked on the full queue: drain it until they return
+        for fut in futures:
+            fut.cancel()
+        while not all(f.done() for f in futures):
+            try:
+                events.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        pool.shutdown(wait=True)
+
+
+def iter_parsed(paths: List[str], workers: int, batch_size: int = 256,
+                max_inflight: int = 8) -> Iterator[ParseEvent]:
+    """
+    Parse files page by page and yield ParseEvents as chunks become available. Batches
+    of one file arrive in order; batches of different files may interleave. With
+    workers > 1 files are parsed in a spawn-based process pool (so forking never inherits
+    the loaded embedding model) that hands batches over a queue of at most max_inflight
+    batches: parsers block, instead of piling up pages the embedder hasn't reached.
+    """
+    source = _iter_local(paths, batch_size) if workers <= 1 or len(paths) <= 1 \
+        else _iter_pool(paths, workers, batch_size, max_inflight)
+    for kind, path, payload in source:
+        if kind == "failed":
+            logger.warning(f"RAG: failed to parse {path}: {payload}")
+        yield kind, path, payload
+
+
+class QdrantWriter:
+    """Index writer over a Qdrant collection. Upserts are acknowledged (wait=True), so commit is a no-op."""
+
+    def __init__(self, client: QdrantClient, collection: str):
+        self.client = client
+        self.collection = collection
+
+    def upsert(self, ids: List[str], vectors: List[List[float]], payloads: List[dict]) -> None:
+        points = [PointStruct(id=pid, vector=vec, payload=pl) for pid, vec, pl in zip(ids, vectors, payloads)]
+        self.client.upsert(collection_name=self.collection, points=points, wait=True)
+
+    def delete(self, ids: List[str]) -> None:
+        if ids:
+            self.client.delete(collection_name=self.collection, points_selector=PointIdsList(points=ids))
+
+    def commit(self) -> None:
+        pass
+
+
+class FanoutWriter:
+    """Applies every write to several indexes (e.g. vectors + BM25) so they stay in lockstep."""
+
+    def __init__(self, *writers):
+        self.writers = writers
+
+    def upsert(self, ids: List[str], vectors: List[List[float]], payloads: List[dict]) -> None:
+        for w in self.writers:
+            w.upsert(ids, vectors, payloads)
+
+    def delete(self, ids: List[str]) -> None:
+        for w in self.writers:
+            w.delete(ids)
+
+    def commit(self) -> None:
+        for w in self.writers:
+            w.commit()
+
+
+@dataclass
+class IngestStats:
+    files: int = 0
+    failed: int = 0
+    chunks: int = 0
+    seconds: float = 0.0
+
+    def rates(self) -> str:
+        dt = max(self.seconds, 1e-9)
+        return f"{self.files / dt:.2f} docs/s, {self.chunks / dt:.1f} chunks/s"
+
+
+class BatchUpserter:
+    """
+    Buffers chunks across files and writes them to the index in fixed-size batches
+    (embed batch -> one upsert call), so at most one batch of chunks is held here no
+    matter how large the files are. Files arrive as a stream of chunk lists
+    (add_chunks ... end_file). A file enters the manifest only once its last chunk has
+    been flushed, and the manifest is saved right after writer.commit(), so an
+    interrupted run never records points the index doesn't durably hold.
+    """
+    def __init__(self, writer, embedding, manifest: IngestManifest, plan: IngestPlan,
+                 batch_size: int, commit_interval: float = 30.0):
+        self.writer = writer
+        self.embedding = embedding
+        self.manifest = manifest
+        self.plan = plan
+        self.batch_size = max(1, batch_size)
+        self.commit_interval = commit_interval
+        self._last_commit = time.monotonic()
+        self._buf: List[Tuple[str, str, dict]] = []
+        self._queued = 0
+        self._flushed = 0
+        self._open: Dict[str, List[str]] = {}  # path -> point ids queued so far
+        self._pending: List[Tuple[str, List[str], int, bool]] = []  # (path, ids, end offset, aborted)
+
+    def add_chunks(self, path: str, chunks: List[Document]) -> None:
+        ids = self._open.setdefault(path, [])
+        start = len(ids)
+        new_ids = [chunk_point_id(path, start + i, c.page_content) for i, c in enumerate(chunks)]
+        ids.extend(new_ids)
+        self._buf.extend((pid, c.page_content, c.metadata) for pid, c in zip(new_ids, chunks))
+        self._queued += len(new_ids)
+        while len(self._buf) >= self.batch_size:
+            self._write(self._buf[: self.batch_size])
+            del self._buf[: self.batch_size]
+        self._commit_done()
+
+    def end_file(self, path: str) -> None:
+        """All of path's chunks are queued; it is recorded once they are flushed."""
+        self._pending.append((path, self._open.pop(path, []), self._queued, False))
+        self._commit_done()
+
+    def abort_file(self, path: str) -> None:
+        """
+        path failed mid-way: once its queued chunks are flushed, delete the points that
+        the previous version didn't have and leave its manifest entry as it was.
+        """
+        self._pending.append((path, self._open.pop(path, []), self._queued, True))
+        self._commit_done()
+
+    def flush(self) -> None:
+        if self._buf:
+            self._write(self._buf)
+            self._buf = []
+        self._commit_done()
+        self.checkpoint()
+
+    def checkpoint(self) -> None:
+        self.writer.commit()
+        self.manifest.save()
+        self._last_commit = time.monotonic()
+
+    def _write(self, batch: List[Tuple[str, str, dict]]) -> None:
+        vectors = self.embedding.embed_documents([text for _, text, _ in batch])
+        payloads = [{"page_content": text, "metadata": meta} for _, text, meta in batch]
+        self.writer.upsert([pid for pid, _, _ in batch], vectors, payloads)
+        self._flushed += len(batch)
+
+    def _commit_done(self) -> None:
+        done = False
+        while self._pending and self._pending[0][2] <= self._flushed:
+            path, ids, _, aborted = self._pending.pop(0)
+            if aborted:
+                self.writer.delete(list(set(ids) - set(self.manifest.chunk_ids(path))))
+                continue
+            stale = set(self.manifest.chunk_ids(path)) - set(ids)
+            self.writer.delete(list(stale))
+            self.manifest.record(path, self.plan.hashes[path], os.stat(path), ids)
+            done = True
+        if done and time.monotonic() - self._last_commit >= self.commit_interval:
+            self.checkpoint()
+
+
+def sync_files(writer, embedding, manifest: IngestManifest, plan: IngestPlan,
+               workers: int, batch_size: int, max_inflight: int = 8,
+               on_file: Callable[[str], None] | None = None) -> IngestStats:
+    """
+    Apply an IngestPlan through `writer` (QdrantWriter or NumpyVectorStore): drop removed
+    files' points, then stream plan.to_embed page by page (parsed in parallel), embedding
+    and upserting batch_size chunks at a time, and log throughput. Peak memory follows
+    batch_size * max_inflight (plus the manifest's chunk ids), not file or corpus size.
+    """
+    stats = IngestStats()
+    for path in plan.removed:
+        writer.delete(manifest.chunk_ids(path))
+        manifest.forget(path)
+    paths = plan.to_embed
+    upserter = BatchUpserter(writer, embedding, manifest, plan, batch_size)
+    if not paths:
+        upserter.checkpoint()
+        return stats
+    t0 = time.perf_counter()
+    last_log = t0
+    started: set = set()
+    for kind, path, payload in iter_parsed(paths, workers, batch_size, max_inflight):
+        if on_file is not None and path not in started:
+            # reported when its first chunks (or its outcome, if it has none) arrive
+            started.add(path)
+            on_file(path)
+        if kind == "chunks":
+            upserter.add_chunks(path, payload)
+            continue
+        if kind == "failed":
+            upserter.abort_file(path)
+            stats.failed += 1
+            continue
+        upserter.end_file(path)
+        stats.files += 1
+        stats.chunks += payload
+        now = time.perf_counter()
+        if now - last_log >= 5.0:
+            stats.seconds = now - t0
+            logger.info(f"RAG ingest: {stats.files + stats.failed}/{len(paths)} files, "
+                        f"{stats.chunks} chunks ({stats.rates()})")
+            last_log = now
+    upserter.flush()
+    stats.seconds = time.perf_counter() - t0
+    return stats
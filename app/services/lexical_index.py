@@ -0,0 +1,206 @@
+from __future__ import annotations
+import math, re, sqlite3, threading
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from langchain_core.documents import Document
+
+# keep identifiers such as "HbA1c", "COVID-19" or "ICD-10.2" as single tokens
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with "
+    "what which who how when where why do does my me i you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+  doc     INTEGER PRIMARY KEY,
+  id      TEXT NOT NULL,
+  length  INTEGER NOT NULL,
+  added   INTEGER NOT NULL,
+  removed INTEGER
+);
+CREATE INDEX IF NOT EXISTS docs_by_id ON docs(id);
+CREATE TABLE IF NOT EXISTS postings (   -- length/added/removed copied from docs: a term scans one range
+  term    TEXT NOT NULL,
+  doc     INTEGER NOT NULL,
+  tf      INTEGER NOT NULL,
+  length  INTEGER NOT NULL,
+  added   INTEGER NOT NULL,
+  removed INTEGER,
+  PRIMARY KEY (term, doc)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_by_doc ON postings(doc);
+CREATE TABLE IF NOT EXISTS generations (
+  gen       INTEGER PRIMARY KEY,
+  docs      INTEGER NOT NULL,
+  total_len INTEGER NOT NULL,
+  corpus    TEXT               -- fingerprint of the corpus this generation indexes
+);
+"""
+_VISIBLE = "added <= ? AND (removed IS NULL OR removed > ?)"   # visible at a generation (bound twice)
+_MAX_VARS = 500   # ids per IN (...) query, under SQLite's bound-parameter limit
+
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index over chunks, keyed by the same point ids as the vector
+    index. Implements the ingestion writer interface (upsert/delete/commit), so it is
+    kept in sync by the same pipeline. Postings and doc lengths live in SQLite next to
+    the vectors and are written as they arrive; the chunk text is not stored, search()
+    returns point ids for the vector index to resolve. Every row carries the generation
+    that added (and removed) it, so fork() is copy-on-write: the fork writes the next
+    generation in the same file while this handle keeps reading its own. commit() stamps
+    the generation with `fingerprint()` (the ingest manifest's), read back as `corpus`,
+    so the caller can tell whether the file indexes the corpus it expects.
+    """
+
+    def __init__(self, path: Path, k1: float = 1.5, b: float = 0.75,
+                 fingerprint: Optional[Callable[[], str]] = None):
+        self.path = Path(path)
+        self.k1 = k1
+        self.b = b
+        self.fingerprint = fingerprint
+        self._lock = threading.RLock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = self._connect()
+        self._conn.executescript(_SCHEMA)
+        row = self._conn.execute(
+            "SELECT gen, docs, total_len, corpus FROM generations ORDER BY gen DESC LIMIT 1").fetchone()
+        self._gen, self._docs, self._total_len, self.corpus = row or (0, 0, 0, None)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30.0)
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        return conn
+
+    def commit(self) -> None:
+        with self._lock:
+            if self.fingerprint is not None:
+                self.corpus = self.fingerprint()
+            self._conn.execute("INSERT OR REPLACE INTO generations(gen, docs, total_len, corpus) VALUES(?, ?, ?, ?)",
+                               (self._gen, self._docs, self._total_len, self.corpus))
+            self._conn.commit()
+
+    def reset(self) -> None:
+        with self._lock:
+            for table in ("postings", "docs", "generations"):
+                self._conn.execute(f"DELETE FROM {table}")
+            self._docs, self._total_len = 0, 0
+        self.commit()
+
+    @property
+    def count(self) -> int:
+        return self._docs
+
+    def fork(self) -> "BM25Index":
+        """
+        Handle on the next generation of the same file, to update off to the side and swap
+        in later. Rows no generation from this one on can see are purged first.
+        """
+        other = self.__class__.__new__(self.__class__)
+        other.path, other.k1, other.b, other.fingerprint = self.path, self.k1, self.b, self.fingerprint
+        other._lock = threading.RLock()
+        other._conn = other._connect()
+        with self._lock:
+            gen, other._docs, other._total_len, other.corpus = self._gen, self._docs, self._total_len, self.corpus
+        other._gen = gen + 1
+        with other._conn:
+            other._conn.execute("DELETE FROM postings WHERE doc IN (SELECT doc FROM docs WHERE removed <= ?)", (gen,))
+            other._conn.execute("DELETE FROM docs WHERE removed <= ?", (gen,))
+            other._conn.execute("DELETE FROM generations WHERE gen < ?", (gen,))
+        return other
+
+    def upsert(self, ids: Sequence[str], vectors, payloads: Sequence[dict]) -> None:
+        with self._lock:
+            self._remove(ids)
+            docs, postings = [], []
+            doc = self._conn.execute("SELECT COALESCE(MAX(doc), 0) FROM docs").fetchone()[0]
+            for pid, pl in zip(ids, payloads):
+                tf = Counter(tokenize(pl.get("page_content", "")))
+                length = sum(tf.values())
+                doc += 1
+                docs.append((doc, pid, length, self._gen))
+                postings.extend((term, doc, n, length, self._gen) for term, n in tf.items())
+                self._docs += 1
+                self._total_len += length
+            self._conn.executemany("INSERT INTO docs(doc, id, length, added) VALUES(?, ?, ?, ?)", docs)
+            postings.sort()   # term order: inserts walk the primary key instead of jumping around it
+            self._conn.executemany("INSERT INTO postings(term, doc, tf, length, added) VALUES(?, ?, ?, ?, ?)",
+                                   postings)
+
+    def delete(self, ids: Sequence[str]) -> None:
+        with self._lock:
+            self._remove(ids)
+
+    def _remove(self, ids: Sequence[str]) -> None:
+        """Hide ids from this generation on; rows this generation added are dropped outright."""
+        ids = list(ids)
+        for i in range(0, len(ids), _MAX_VARS):
+            part = ids[i:i + _MAX_VARS]
+            rows = self._conn.execute(
+                f"SELECT doc, length, added FROM docs WHERE removed IS NULL AND id IN ({','.join('?' * len(part))})",
+                part).fetchall()
+            for doc, length, added in rows:
+                if added == self._gen:
+                    self._conn.execute("DELETE FROM postings WHERE doc = ?", (doc,))
+                    self._conn.execute("DELETE FROM docs WHERE doc = ?", (doc,))
+                else:
+                    self._conn.execute("UPDATE postings SET removed = ? WHERE doc = ?", (self._gen, doc))
+                    self._conn.execute("UPDATE docs SET removed = ? WHERE doc = ?", (self._gen, doc))
+                self._docs -= 1
+                self._total_len -= length
+
+    def search(self, query: str, k: int = 20) -> List[Tuple[str, float]]:
+        """Top k (point id, score) for query."""
+        terms = sorted(set(tokenize(query)))
+        with self._lock:
+            n = self._docs
+            if not n or not terms:
+                return []
+            avgdl = self._total_len / n
+            terms_in = ",".join("?" * len(terms))
+            df = dict(self._conn.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({terms_in}) AND {_VISIBLE} GROUP BY term",
+                [*terms, self._gen, self._gen]).fetchall())
+            if not df:
+                return []
+            # idf per term, then the whole BM25 sum and top k in SQLite
+            idf = [v for term, m in df.items() for v in (term, math.log(1.0 + (n - m + 0.5) / (m + 0.5)))]
+            case = "CASE term " + "WHEN ? THEN ? " * len(df) + "END"
+            top = self._conn.execute(
+                f"SELECT doc, SUM({case} * tf * ? / (tf + ? * (1.0 - ? + ? * length / ?))) AS score "
+                f"FROM postings WHERE term IN ({terms_in}) AND {_VISIBLE} "
+                f"GROUP BY doc ORDER BY score DESC LIMIT ?",
+                [*idf, self.k1 + 1.0, self.k1, self.b, self.b, avgdl, *terms, self._gen, self._gen, k]).fetchall()
+            if not top:
+                return []
+            ids = dict(self._conn.execute(
+                f"SELECT doc, id FROM docs WHERE doc IN ({','.join('?' * len(top))})", [d for d, _ in top]).fetchall())
+        return [(ids[doc], score) for doc, score in top]
+
+
+def _doc_key(doc: Document) -> tuple:
+    md = doc.metadata or {}
+    return md.get("source"), md.get("page"), doc.page_content
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Document]], k: int = 5,
+                           rrf_k: int = 60) -> List[Document]:
+    """Fuse ranked lists: score(d) = sum 1 / (rrf_k + rank). Documents are matched by source/page/content."""
+    scores: Dict[tuple, float] = {}
+    first: Dict[tuple, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, 1):
+            key = _doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            first.setdefault(key, doc)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [first[key] for key in best]
+
@@ -0,0 +1,102 @@
+from __future__ import annotations
+import hashlib, json, threading
+from typing import Any, Dict, Optional, Sequence
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.language_models import BaseChatModel
+from langchain_core.load import dumps, loads
+from app.core.cache import PersistentCache
+from app.core.config import settings
+
+LLM_CACHE_PATH = settings.data_dir / "llm_cache.sqlite3"
+# per-message fields that differ between otherwise identical prompts (uuid ids from the
+# graph's add_messages, provider timings/token counts on earlier AI turns)
+_VOLATILE = ("id", "response_metadata", "usage_metadata")
+
+
+def canonical_prompt(prompt: str) -> str:
+    """LangChain's serialized messages minus _VOLATILE fields, so identical conversations share a key."""
+    try:
+        messages = json.loads(prompt)
+    except ValueError:
+        return prompt
+    if not isinstance(messages, list):
+        return prompt
+    for m in messages:
+        kwargs = m.get("kwargs") if isinstance(m, dict) else None
+        if isinstance(kwargs, dict):
+            for field in _VOLATILE:
+                kwargs.pop(field, None)
+    return json.dumps(messages, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def messages_key(messages: Sequence[Any]) -> str:
+    """Content hash of a message list, ignoring _VOLATILE fields (for coalescing identical calls)."""
+    return hashlib.sha256(canonical_prompt(dumps(list(messages))).encode("utf-8")).hexdigest()
+
+
+class SQLiteLLMCache(BaseCache):
+    """
+    Exact-match LangChain cache for one call site, stored in its own table of
+    data_dir/llm_cache.sqlite3. The key hashes LangChain's llm_string (model, params,
+    bound tools, stop) with the serialized messages; size/TTL eviction and the thread
+    safety come from PersistentCache. Async lookups run in LangChain's executor.
+    """
+
+    def __init__(self, site: str, maxsize: int, ttl: Optional[float]):
+        self.site = site
+        self.store = PersistentCache(LLM_CACHE_PATH, f"llm_{site}", maxsize=maxsize, ttl=ttl)
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x1f{canonical_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        stored = self.store.get(self._key(prompt, llm_string))
+        if stored is None:
+            return None
+        try:
+            gens = [loads(g) for g in stored]
+        except Exception:
+            return None   # written by an incompatible langchain version; treat as a miss
+        for g in gens:   # lets the metrics callback tell replays from provider calls
+            g.generation_info = {**(g.generation_info or {}), "cached": True}
+        return gens
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        self.store.set(self._key(prompt, llm_string), [dumps(g) for g in return_val])
+
+    def clear(self, **kwargs: Any) -> None:
+        self.store.clear()
+
+
+_CACHES: Dict[str, SQLiteLLMCache] = {}
+_LOCK = threading.Lock()
+
+
+def llm_cache_for(site: str) -> Optional[SQLiteLLMCache]:
+    """The shared cache for a call site, or None when caching is off globally or for that site."""
+    if not settings.llm_cache_enabled or not settings.llm_cache_sites.get(site, False):
+        return None
+    with _LOCK:
+        if site not in _CACHES:
+            _CACHES[site] = SQLiteLLMCache(site, settings.llm_cache_size, settings.llm_cache_ttl or None)
+        return _CACHES[site]
+
+
+def with_llm_cache(llm: BaseChatModel, site: str) -> BaseChatModel:
+    """Copy of `llm` that reads/writes the call site's cache (the original is left uncached)."""
+    cache = llm_cache_for(site)
+    return llm if cache is None else llm.model_copy(update={"cache": cache})
+
+
+def cache_stats() -> dict:
+    with _LOCK:
+        caches = dict(_CACHES)
+    return {site: c.store.stats() for site, c in caches.items()}
+
+
+def clear_all() -> None:
+    with _LOCK:
+        caches = list(_CACHES.values())
+    for c in caches:
+        c.clear()
@@ -0,0 +1,497 @@
+from __future__ import annotations
+import heapq, json, os, shutil, threading
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+
+def _unit_rows(mat: np.ndarray) -> np.ndarray:
+    mat = np.asarray(mat, dtype=np.float32)
+    norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def quantize_int8(mat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 quantization: row ~= q * scale."""
+    scales = np.abs(mat).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    q = np.clip(np.rint(mat / scales[:, None]), -127, 127).astype(np.int8)
+    return q, scales.astype(np.float32)
+
+
+def mmr_select(query: np.ndarray, cands: np.ndarray, k: int, lambda_mult: float) -> List[int]:
+    """Vectorized maximal marginal relevance over unit-norm candidate rows; returns positions into cands."""
+    if len(cands) == 0:
+        return []
+    rel = cands @ query
+    pair = cands @ cands.T
+    k = min(k, len(cands))
+    selected: List[int] = []
+    redundancy = np.full(len(cands), -np.inf, dtype=np.float32)
+    chosen = np.zeros(len(cands), dtype=bool)
+    for _ in range(k):
+        red = np.where(np.isinf(redundancy), 0.0, redundancy)
+        score = lambda_mult * rel - (1.0 - lambda_mult) * red
+        score[chosen] = -np.inf
+        best = int(np.argmax(score))
+        selected.append(best)
+        chosen[best] = True
+        redundancy = np.maximum(redundancy, pair[best])
+    return selected
+
+
+
+_BLOCK = 4096        # rows copied at a time when a segment is written
+_SPILL_ROWS = 4096   # pending rows buffered before they are written out ahead of commit()
+
+
+def _keys(ids: Iterable[str]) -> np.ndarray:
+    """Point ids as a utf-8 bytes array, the dtype segments keep them in."""
+    keys = [pid.encode("utf-8") for pid in ids]
+    return np.array(keys) if keys else np.zeros((0,), dtype="S1")
+
+
+def _payload_line(text: str, metadata: dict) -> bytes:
+    return json.dumps({"page_content": text, "metadata": metadata}).encode("utf-8") + b"\n"
+
+
+def _read_rows(arr: np.memmap, lo: int, hi: int) -> np.ndarray:
+    """
+    Rows lo:hi of a memory-mapped array, read from its file rather than through the map:
+    a merge passes over every row once, and pages touched through the map would stay in
+    the process until the segment is dropped.
+    """
+    shape = (hi - lo, *arr.shape[1:])
+    size = arr.dtype.itemsize * int(np.prod(shape[1:], dtype=np.int64))
+    with open(arr.filename, "rb") as f:
+        f.seek(arr.offset + lo * size)
+        return np.frombuffer(f.read((hi - lo) * size), dtype=arr.dtype).reshape(shape)
+
+
+def _npy_file(path: Path, dtype, shape: Tuple[int, ...]):
+    """Open `path` for writing an .npy of `shape` row block by row block."""
+    f = open(path, "wb")
+    np.lib.format.write_array_header_1_0(
+        f, {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False, "shape": shape})
+    return f
+
+
+@dataclass(frozen=True)
+class _Segment:
+    """An immutable run of rows sorted by id, memory-mapped from segments/<name>/; only `dead` is ever replaced."""
+    name: str
+    vectors: np.ndarray            # (n, dim) float32 unit rows, or int8 codes
+    scales: Optional[np.ndarray]   # (n,) per-row scales when int8
+    ids: np.ndarray                # (n,) utf-8 point ids, ascending
+    offsets: np.ndarray            # (n + 1,) byte offset of each row's line in payloads.jsonl
+    payloads: np.ndarray           # payloads.jsonl as a uint8 memmap
+    dead: np.ndarray               # (n,) bool tombstones
+
+    @property
+    def live(self) -> int:
+        return len(self.ids) - int(self.dead.sum())
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        scores = np.asarray(self.vectors @ query, dtype=np.float32)
+        if self.scales is not None:
+            scores = scores * self.scales
+        scores[self.dead] = -np.inf
+        return scores
+
+    def rows(self, idx: Sequence[int]) -> np.ndarray:
+        rows = np.asarray(self.vectors[idx], dtype=np.float32)
+        if self.scales is not None:
+            rows = rows * self.scales[idx][:, None]
+        return _unit_rows(rows)
+
+    def find(self, keys: np.ndarray) -> np.ndarray:
+        """Rows holding any of `keys` (a _keys() array) that are not tombstoned."""
+        if not len(self.ids) or not len(keys):
+            return np.zeros((0,), dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.ids, keys), len(self.ids) - 1)
+        rows = pos[self.ids[pos] == keys]
+        return rows[~self.dead[rows]]
+
+    def read(self, lo: int, hi: int) -> Tuple[np.ndarray, Optional[np.ndarray], List[bytes]]:
+        """Codes, scales and payload lines of rows lo:hi, read from disk (see _read_rows)."""
+        offsets = np.asarray(self.offsets[lo:hi + 1]) - int(self.offsets[lo])
+        data = _read_rows(self.payloads, int(self.offsets[lo]), int(self.offsets[hi])).tobytes()
+        lines = [data[offsets[i]:offsets[i + 1]] for i in range(hi - lo)]
+        scales = None if self.scales is None else _read_rows(self.scales, lo, hi)
+        return _read_rows(self.vectors, lo, hi), scales, lines
+
+    def line(self, i: int) -> bytes:
+        return bytes(self.payloads[self.offsets[i]:self.offsets[i + 1]])
+
+    def doc(self, i: int) -> Document:
+        raw = json.loads(self.line(i))
+        return Document(page_content=raw["page_content"], metadata=raw["metadata"],
+                        id=self.ids[i].decode("utf-8"))
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    segments: Tuple[_Segment, ...]
+    next: int                      # number the next segment written is named after
+
+    @property
+    def count(self) -> int:
+        return sum(seg.live for seg in self.segments)
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process cosine index. Rows live in append-only segments under `path`: vectors in
+    a memory-mapped .npy (float32, or int8 with per-row scales), ids sorted for lookup,
+    payloads as JSON lines read by offset, so texts stay on disk until a hit needs them.
+    index.json lists the segments and their tombstoned rows. Searches run on an immutable
+    snapshot, so writers never block or tear concurrent readers.
+    Writes are buffered as pending rows (spilled to an unpublished segment every
+    _SPILL_ROWS) and deletions until commit() publishes them and tombstones the rows they
+    replace. A segment is merged into its predecessor once it is as large, and rewritten
+    once half of it is dead, so a sync rewrites each row O(log n) times and never holds
+    more than _SPILL_ROWS rows in RAM.
+    """
+
+    def __init__(self, path: Path, embedding: Embeddings, dtype: str = "float32"):
+        if dtype not in ("float32", "int8"):
+            raise ValueError(f"unsupported numpy index dtype: {dtype}")
+        self.path = Path(path)
+        self.dtype = dtype
+        self._embedding = embedding
+        self._lock = threading.Lock()
+        self._snap = self._load()
+        self._next = self._snap.next
+        self._clear_pending()
+        self._remove_segments(self._snap)
+
+    def _clear_pending(self) -> None:
+        self._pending: Dict[str, Tuple[np.ndarray, Optional[float], str, dict]] = {}  # id -> row to append
+        self._spilled: List[_Segment] = []   # pending rows already written out, published by commit()
+        self._deleted: Set[str] = set()      # ids whose committed rows get tombstoned
+
+    def _name(self) -> str:
+        name, self._next = f"{self._next:08d}", self._next + 1
+        return name
+
+    @staticmethod
+    def _tombstone(seg: _Segment, keys: np.ndarray) -> _Segment:
+        """seg with the rows holding `keys` marked dead (a new mask; snapshots sharing seg are untouched)."""
+        rows = seg.find(keys)
+        if not len(rows):
+            return seg
+        dead = seg.dead.copy()
+        dead[rows] = True
+        return replace(seg, dead=dead)
+
+    # ---- persistence -------------------------------------------------------
+    def _index_file(self) -> Path:
+        return self.path / "index.json"
+
+    def _segment_dir(self, name: str) -> Path:
+        return self.path / "segments" / name
+
+    def _load(self) -> _Snapshot:
+        try:
+            meta = json.loads(self._index_file().read_text(encoding="utf-8"))
+            if meta.get("dtype") != self.dtype:
+                raise ValueError("dtype changed")
+            segments = tuple(self._open_segment(s["name"], s["rows"], s["dead"]) for s in meta["segments"])
+            return _Snapshot(segments, int(meta["next"]))
+        except (OSError, ValueError, KeyError, TypeError):
+            return self._empty()
+
+    def _open_segment(self, name: str, rows: int, dead: Sequence[int]) -> _Segment:
+        d = self._segment_dir(name)
+        vectors = np.load(d / "vectors.npy", mmap_mode="r")
+        scales = np.load(d / "scales.npy", mmap_mode="r") if self.dtype == "int8" else None
+        ids = np.load(d / "ids.npy", mmap_mode="r")
+        offsets = np.load(d / "offsets.npy", mmap_mode="r")
+        if len(vectors) != rows or len(ids) != rows or len(offsets) != rows + 1:
+            raise ValueError(f"segment {name} is incomplete")
+        mask = np.zeros(rows, dtype=bool)
+        mask[np.asarray(dead, dtype=np.int64)] = True
+        payloads = np.memmap(d / "payloads.jsonl", dtype=np.uint8, mode="r")
+        return _Segment(name, vectors, scales, ids, offsets, payloads, mask)
+
+    def _write_segment(self, name: str, rows: int, dim: int, width: int,
+                       blocks: Iterable[Tuple[np.ndarray, Optional[np.ndarray], np.ndarray, List[bytes]]]) -> _Segment:
+        """Stream (codes, scales, keys, payload lines) blocks, already in id order, into segments/<name>/."""
+        d = self._segment_dir(name)
+        d.mkdir(parents=True, exist_ok=True)
+        code_dtype = np.int8 if self.dtype == "int8" else np.float32
+        key_dtype = np.dtype(f"S{width}")
+        # plain writes, not open_memmap: written pages go to the page cache, not this process
+        files = [_npy_file(d / "vectors.npy", code_dtype, (rows, dim)),
+                 _npy_file(d / "ids.npy", key_dtype, (rows,)),
+                 _npy_file(d / "offsets.npy", np.int64, (rows + 1,)),
+                 open(d / "payloads.jsonl", "wb")]
+        if self.dtype == "int8":
+            files.append(_npy_file(d / "scales.npy", np.float32, (rows,)))
+        vectors, ids, offsets, payloads = files[:4]
+        try:
+            offsets.write(np.zeros(1, dtype=np.int64).tobytes())
+            at = 0
+            for codes, sc, keys, lines in blocks:
+                vectors.write(np.ascontiguousarray(codes, dtype=code_dtype).tobytes())
+                if self.dtype == "int8":
+                    files[4].write(np.ascontiguousarray(sc, dtype=np.float32).tobytes())
+                ids.write(np.asarray(keys, dtype=key_dtype).tobytes())
+                offsets.write((at + np.cumsum([len(line) for line in lines], dtype=np.int64)).tobytes())
+                payloads.write(b"".join(lines))
+                at += sum(len(line) for line in lines)
+        finally:
+            for f in files:
+                f.close()
+        return self._open_segment(name, rows, [])
+
+    def _save(self, snap: _Snapshot) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        meta = {"dtype": self.dtype, "next": snap.next,
+                "segments": [{"name": s.name, "rows": len(s.ids), "dead": np.flatnonzero(s.dead).tolist()}
+                             for s in snap.segments]}
+        tmp = self._index_file().with_suffix(".tmp")
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp, self._index_file())
+
+    def _remove_segments(self, keep: _Snapshot) -> None:
+        """
+        Delete segment dirs that neither `keep` nor this handle's spills use. A fork may still
+        be reading them: its memory maps outlive the unlink on POSIX; elsewhere they are
+        retried on the next start.
+        """
+        live = {seg.name for seg in (*keep.segments, *self._spilled)}
+        root = self.path / "segments"
+        if root.is_dir():
+            for d in root.iterdir():
+                if d.name not in live:
+                    shutil.rmtree(d, ignore_errors=True)
+
+    def commit(self) -> None:
+        """Append pending rows as a segment, tombstone the rows they replace, compact, persist."""
+        with self._lock:
+            if self._pending:
+                self._spill()
+            if not self._spilled and not self._deleted:
+                return
+            fresh = self._spilled
+            gone = np.concatenate([_keys(self._deleted)] + [seg.ids[~seg.dead] for seg in fresh])
+            segments = [self._tombstone(seg, gone) for seg in self._snap.segments] + fresh
+            self._snap = _Snapshot(tuple(self._compact(segments)), self._next)
+            self._save(self._snap)
+            self._clear_pending()
+            self._remove_segments(self._snap)
+
+    def _spill(self) -> None:
+        """Write pending rows out as a segment that commit() publishes. Holds _lock."""
+        seg = self._pending_segment(self._name())
+        self._spilled = [self._tombstone(s, seg.ids) for s in self._spilled] + [seg]
+        self._pending = {}
+
+    def _pending_segment(self, name: str) -> _Segment:
+        order = sorted(self._pending, key=lambda pid: pid.encode("utf-8"))
+        rows = [self._pending[pid] for pid in order]
+        codes = np.stack([r[0] for r in rows])
+        scales = np.array([r[1] for r in rows], dtype=np.float32) if self.dtype == "int8" else None
+        keys = _keys(order)
+        lines = [_payload_line(r[2], r[3]) for r in rows]
+        return self._write_segment(name, len(rows), codes.shape[1], keys.dtype.itemsize,
+                                   [(codes, scales, keys, lines)])
+
+    def _compact(self, segments: List[_Segment]) -> List[_Segment]:
+        """
+        Drop empty segments, rewrite ones that are mostly tombstones, and merge the newest
+        segment into its predecessor while it is at least as large (a binary-counter policy:
+        O(log n) segments, each row rewritten O(log n) times over a sync).
+        """
+        out: List[_Segment] = []
+        for seg in segments:
+            if not seg.live:
+                continue
+            if seg.live * 2 < len(seg.ids):
+                seg = self._merge([seg], self._name())
+            out.append(seg)
+            while len(out) > 1 and out[-2].live <= out[-1].live:
+                out[-2:] = [self._merge(out[-2:], self._name())]
+        return out
+
+    def _merge(self, segments: List[_Segment], name: str) -> _Segment:
+        """Live rows of `segments` as one new segment, copied _BLOCK rows at a time in id order."""
+        live = [np.flatnonzero(~seg.dead) for seg in segments]
+        keys = np.concatenate([seg.ids[rows] for seg, rows in zip(segments, live)])
+        src = np.concatenate([np.full(len(rows), i, dtype=np.int32) for i, rows in enumerate(live)])
+        src_row = np.concatenate(live)
+        order = np.argsort(keys, kind="stable")
+        dim = segments[0].vectors.shape[1]
+        int8 = self.dtype == "int8"
+
+        def blocks():
+            for start in range(0, len(order), _BLOCK):
+                sel = order[start:start + _BLOCK]
+                seg_of, row_of = src[sel], src_row[sel]
+                codes = np.empty((len(sel), dim), dtype=np.int8 if int8 else np.float32)
+                scales = np.empty((len(sel),), dtype=np.float32) if int8 else None
+                lines: List[bytes] = [b""] * len(sel)
+                for i, seg in enumerate(segments):
+                    m = np.flatnonzero(seg_of == i)
+                    if not len(m):
+                        continue
+                    # a segment is sorted by id, so its rows in this block are one ascending run
+                    rows = row_of[m]
+                    lo = int(rows[0])
+                    c, sc, ls = seg.read(lo, int(rows[-1]) + 1)
+                    codes[m] = c[rows - lo]
+                    if int8:
+                        scales[m] = sc[rows - lo]
+                    for j, r in zip(m, rows):
+                        lines[j] = ls[r - lo]
+                yield codes, scales, keys[sel], lines
+
+        return self._write_segment(name, len(order), dim, keys.dtype.itemsize, blocks())
+
+    def _empty(self, nxt: int = 0) -> _Snapshot:
+        return _Snapshot((), nxt)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._clear_pending()
+            self._snap = self._empty(self._next)
+            self._save(self._snap)
+            self._remove_segments(self._snap)
+        for name in ("vectors.npy", "scales.npy", "payloads.json"):   # single-file layout, pre-segments
+            (self.path / name).unlink(missing_ok=True)
+
+    @property
+    def count(self) -> int:
+        """Live rows in the committed snapshot."""
+        return self._snap.count
+
+    def fork(self) -> "NumpyVectorStore":
+        """A second handle on the current snapshot; writes to it stay invisible here."""
+        other = self.__class__.__new__(self.__class__)
+        other.path, other.dtype, other._embedding = self.path, self.dtype, self._embedding
+        other._lock = threading.Lock()
+        with self._lock:
+            other._snap, other._next = self._snap, self._next
+            other._pending, other._spilled = dict(self._pending), list(self._spilled)
+            other._deleted = set(self._deleted)
+        return other
+
+    # ---- writes ------------------------------------------------------------
+    def _encode(self, rows: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        if self.dtype == "int8":
+            return quantize_int8(rows)
+        return rows, None
+
+    def upsert(self, ids: Sequence[str], vectors: Sequence[Sequence[float]], payloads: Sequence[dict]) -> None:
+        """Insert or overwrite rows (visible after commit). payloads use the Qdrant layout: {"page_content", "metadata"}."""
+        if not ids:
+            return
+        codes, scales = self._encode(_unit_rows(np.asarray(vectors, dtype=np.float32)))
+        with self._lock:
+            for j, pid in enumerate(ids):
+                self._pending[pid] = (codes[j], None if scales is None else float(scales[j]),
+                                      payloads[j].get("page_content", ""), payloads[j].get("metadata") or {})
+            if len(self._pending) >= _SPILL_ROWS:
+                self._spill()
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        keys = _keys(ids)
+        with self._lock:
+            dropped = any(len(seg.find(keys)) for seg in (*self._snap.segments, *self._spilled))
+            for pid in ids:
+                dropped |= self._pending.pop(pid, None) is not None
+            self._spilled = [self._tombstone(seg, keys) for seg in self._spilled]
+            self._deleted.update(ids)
+            return dropped
+
+    # ---- VectorStore interface ----------------------------------------------
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        if ids is None:
+            from app.services.vectorstore import chunk_point_id
+            ids = [chunk_point_id("", i, t) for i, t in enumerate(texts)]
+        vectors = self._embedding.embed_documents(texts)
+        self.upsert(ids, vectors, [{"page_content": t, "metadata": m} for t, m in zip(texts, metadatas)])
+        return list(ids)
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   path: Optional[Path] = None, dtype: str = "float32", **kwargs: Any) -> "NumpyVectorStore":
+        if path is None:
+            raise ValueError("NumpyVectorStore.from_texts requires path=")
+        store = cls(path, embedding, dtype=dtype)
+        store.add_texts(texts, metadatas, ids=kwargs.get("ids"))
+        store.commit()
+        return store
+
+    def _top(self, snap: _Snapshot, query: np.ndarray, k: int) -> List[Tuple[float, int, int]]:
+        """Best k (score, segment, row) over every segment, highest first."""
+        if k <= 0:
+            return []
+        best: List[Tuple[float, int, int]] = []
+        for si, seg in enumerate(snap.segments):
+            scores = seg.scores(query)
+            kk = min(k, len(scores))
+            for i in np.argpartition(-scores, kk - 1)[:kk]:
+                if scores[i] > -np.inf:
+                    best.append((float(scores[i]), si, int(i)))
+        return heapq.nlargest(k, best)
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        snap = self._snap
+        q = _unit_rows(np.asarray(embedding, dtype=np.float32))
+        return [(snap.segments[si].doc(i), s) for s, si, i in self._top(snap, q, k)]
+
+    def get_by_ids(self, ids: Sequence[str], /) -> List[Document]:
+        """Committed documents for `ids`, in the order asked for; unknown ids are skipped."""
+        snap = self._snap
+        keys = _keys(ids)
+        found: Dict[str, Document] = {}
+        for seg in snap.segments:
+            for i in seg.find(keys):
+                doc = seg.doc(int(i))
+                found[doc.id] = doc
+        return [found[pid] for pid in ids if pid in found]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k=k)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [d for d, _ in self.similarity_search_with_score_by_vector(embedding, k=k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k=k)
+
+    def _select_relevance_score_fn(self):
+        return lambda score: (score + 1.0) / 2.0
+
+    def max_marginal_relevance_search_by_vector(self, embedding: List[float], k: int = 4, fetch_k: int = 20,
+                                                lambda_mult: float = 0.5, **kwargs: Any) -> List[Document]:
+        snap = self._snap
+        q = _unit_rows(np.asarray(embedding, dtype=np.float32))
+        cand = self._top(snap, q, max(fetch_k, k))
+        if not cand:
+            return []
+        rows = np.concatenate([snap.segments[si].rows([i]) for _, si, i in cand])
+        picked = mmr_select(q, rows, k, lambda_mult)
+        return [snap.segments[cand[p][1]].doc(cand[p][2]) for p in picked]
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20,
+                                      lambda_mult: float = 0.5, **kwargs: Any) -> List[Document]:
+        return self.max_marginal_relevance_search_by_vector(
+            self._embedding.embed_query(query), k=k, fetch_k=fetch_k, lambda_mult=lambda_mult)
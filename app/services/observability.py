@@ -0,0 +1,140 @@
+from __future__ import annotations
+import functools, time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
+from langchain_core.outputs import LLMResult
+from langchain_core.tools import BaseTool
+from app.core.config import settings
+from app.core.metrics import REGISTRY, LLM_DURATION, LLM_TOKENS, NODE_DURATION, TOOL_DURATION, Sample
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Records LLM latency + token usage and tool latency from LangChain callbacks.
+    run_inline keeps it on the calling thread/loop (no executor hop for async runs);
+    the per-run bookkeeping is a dict insert and pop.
+    """
+    run_inline = True
+
+    def __init__(self):
+        self._llm: Dict[UUID, Tuple[float, str]] = {}
+        self._tools: Dict[UUID, Tuple[float, str]] = {}
+
+    # ---- LLMs ---------------------------------------------------------------
+    def _start_llm(self, serialized: Dict[str, Any], run_id: UUID, metadata: Optional[dict]) -> None:
+        model = (metadata or {}).get("ls_model_name") or (serialized or {}).get("name") or "unknown"
+        self._llm[run_id] = (time.perf_counter(), model)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs) -> None:
+        self._start_llm(serialized, run_id, metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs) -> None:
+        self._start_llm(serialized, run_id, metadata)
+
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs) -> None:
+        started = self._llm.pop(run_id, None)
+        if started is None:
+            return
+        t0, model = started
+        LLM_DURATION.observe(time.perf_counter() - t0, model=model)
+        if any((g.generation_info or {}).get("cached") for gens in response.generations for g in gens):
+            return   # replayed from the LLM cache: the provider reported (and billed) these tokens once
+        usage = None
+        for gens in response.generations:
+            for g in gens:
+                usage = getattr(getattr(g, "message", None), "usage_metadata", None) or usage
+        if usage is None:
+            token_usage = (response.llm_output or {}).get("token_usage") or {}
+            usage = {"input_tokens": token_usage.get("prompt_tokens", 0),
+                     "output_tokens": token_usage.get("completion_tokens", 0)}
+        for kind in ("input", "output"):
+            n = usage.get(f"{kind}_tokens") or 0
+            if n:
+                LLM_TOKENS.inc(n, model=model, kind=kind)
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        started = self._llm.pop(run_id, None)
+        if started is not None:
+            LLM_DURATION.observe(time.perf_counter() - started[0], model=started[1])
+
+    # ---- tools --------------------------------------------------------------
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs) -> None:
+        self._tools[run_id] = (time.perf_counter(), (serialized or {}).get("name") or kwargs.get("name") or "unknown")
+
+    def _end_tool(self, run_id: UUID, status: str) -> None:
+        started = self._tools.pop(run_id, None)
+        if started is not None:
+            TOOL_DURATION.observe(time.perf_counter() - started[0], tool=started[1], status=status)
+
+    def on_tool_end(self, output, *, run_id, **kwargs) -> None:
+        self._end_tool(run_id, "ok")
+
+    def on_tool_error(self, error, *, run_id, **kwargs) -> None:
+        self._end_tool(run_id, "error")
+
+
+METRICS_CALLBACK = MetricsCallbackHandler()
+
+
+def instrument_llm(llm: BaseChatModel) -> BaseChatModel:
+    """Copy of `llm` reporting to METRICS_CALLBACK (copies made from it keep the callback)."""
+    if not settings.metrics_enabled:
+        return llm
+    return llm.model_copy(update={"callbacks": [*(llm.callbacks or []), METRICS_CALLBACK]})
+
+
+def instrument_tools(tools: List[BaseTool]) -> List[BaseTool]:
+    if not settings.metrics_enabled:
+        return tools
+    return [t.model_copy(update={"callbacks": [*(t.callbacks or []), METRICS_CALLBACK]}) for t in tools]
+
+
+def timed_node(name: str, fn: Callable) -> Callable:
+    """Wrap an async graph node so its wall time lands in agent_node_duration_seconds{node=name}."""
+    if not settings.metrics_enabled:
+        return fn
+
+    # functools.wraps keeps fn's signature visible, so LangGraph still injects config/store when fn takes them
+    @functools.wraps(fn)
+    async def node(state, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return await fn(state, **kwargs)
+        finally:
+            NODE_DURATION.observe(time.perf_counter() - t0, node=name)
+    return node
+
+
+_CACHES: List[Tuple[str, Callable[[], Optional[dict]]]] = []
+
+
+def register_cache_collector(name: str, stats: Callable[[], Optional[dict]]) -> None:
+    """Expose a cache's hits/misses (from its existing stats() dict) as counters at scrape time."""
+    _CACHES.append((name, stats))
+
+
+def _cache_samples(field: str) -> Iterable[Sample]:
+    for name, stats in _CACHES:
+        try:
+            s = stats()
+        except Exception:
+            continue
+        if s and field in s:
+            yield (f"cache_{field}_total", {"cache": name}, s[field])
+
+
+def _cache_size_samples() -> Iterable[Sample]:
+    for name, stats in _CACHES:
+        try:
+            s = stats()
+        except Exception:
+            continue
+        if s and "size" in s:
+            yield ("cache_entries", {"cache": name}, s["size"])
+
+
+REGISTRY.collector("cache_hits_total", "counter", "Cache hits", lambda: _cache_samples("hits"))
+REGISTRY.collector("cache_misses_total", "counter", "Cache misses", lambda: _cache_samples("misses"))
+REGISTRY.collector("cache_entries", "gauge", "Entries currently cached", _cache_size_samples)
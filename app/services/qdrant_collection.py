@@ -0,0 +1,165 @@
+from __future__ import annotations
+import json
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as qm
+from app.core.config import settings
+from app.core.logger import logger
+
+QUANTIZATION_MODES = ("none", "int8")
+
+
+def embedding_dimension(embedding) -> int:
+    """Output size of an Embeddings model (unwrapping CachedQueryEmbeddings); probes it if it can't say."""
+    inner = getattr(embedding, "inner", embedding)
+    get_dim = getattr(getattr(inner, "client", None), "get_sentence_embedding_dimension", None)
+    dim = get_dim() if callable(get_dim) else None
+    return int(dim) if dim else len(embedding.embed_documents(["dimension probe"])[0])
+
+
+@dataclass(frozen=True)
+class CollectionLayout:
+    """
+    How the RAG collection is stored and searched. HNSW and quantization are set on the
+    vector params (not collection-wide), so they also round-trip through local mode.
+    With int8 the originals are kept (on disk when on_disk) for rescoring the top
+    limit * oversampling quantized hits.
+    """
+    on_disk: bool = False
+    on_disk_payload: bool = False
+    quantization: str = "none"
+    quantile: float = 0.99
+    always_ram: bool = True
+    rescore: bool = True
+    oversampling: float = 2.0
+    hnsw_m: int = 16
+    hnsw_ef_construct: int = 100
+    hnsw_on_disk: bool = False
+    hnsw_ef: int = 0
+
+    def __post_init__(self):
+        if self.quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"qdrant quantization must be one of {QUANTIZATION_MODES}, got {self.quantization!r}")
+
+    @classmethod
+    def from_settings(cls) -> "CollectionLayout":
+        return cls(
+            on_disk=settings.qdrant_on_disk,
+            on_disk_payload=settings.qdrant_on_disk_payload,
+            quantization=settings.qdrant_quantization,
+            quantile=settings.qdrant_quantization_quantile,
+            always_ram=settings.qdrant_quantization_always_ram,
+            rescore=settings.qdrant_rescore,
+            oversampling=settings.qdrant_oversampling,
+            hnsw_m=settings.qdrant_hnsw_m,
+            hnsw_ef_construct=settings.qdrant_hnsw_ef_construct,
+            hnsw_on_disk=settings.qdrant_hnsw_on_disk,
+            hnsw_ef=settings.qdrant_hnsw_ef,
+        )
+
+    def hnsw_config(self) -> qm.HnswConfigDiff:
+        return qm.HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct, on_disk=self.hnsw_on_disk)
+
+    def quantization_config(self) -> Optional[qm.ScalarQuantization]:
+        if self.quantization == "none":
+            return None
+        return qm.ScalarQuantization(scalar=qm.ScalarQuantizationConfig(
+            type=qm.ScalarType.INT8, quantile=self.quantile, always_ram=self.always_ram))
+
+    def vector_params(self, size: int) -> qm.VectorParams:
+        return qm.VectorParams(size=size, distance=qm.Distance.COSINE, on_disk=self.on_disk,
+                               hnsw_config=self.hnsw_config(), quantization_config=self.quantization_config())
+
+    def search_params(self) -> Optional[qm.SearchParams]:
+        """Per-query params (beam width, rescoring); None when the server defaults apply."""
+        quant = None
+        if self.quantization != "none":
+            quant = qm.QuantizationSearchParams(rescore=self.rescore, oversampling=self.oversampling)
+        if quant is None and self.hnsw_ef <= 0:
+            return None
+        return qm.SearchParams(hnsw_ef=self.hnsw_ef or None, quantization=quant)
+
+    def estimated_ram(self, points: int, size: int, payload_bytes: int = 0) -> Dict[str, int]:
+        """
+        Rough resident bytes per storage part (what Qdrant keeps in RAM, not page cache):
+        float32 originals, int8 copies, HNSW links (~2*m per point on level 0) and payloads.
+        """
+        quantized = self.quantization == "int8"
+        parts = {
+            "vectors": 0 if self.on_disk else points * size * 4,
+            "quantized": points * size if quantized and (self.always_ram or not self.on_disk) else 0,
+            "hnsw": 0 if self.hnsw_on_disk else points * self.hnsw_m * 2 * 4,
+            "payload": 0 if self.on_disk_payload else points * payload_bytes,
+        }
+        parts["total"] = sum(parts.values())
+        return parts
+
+    def describe(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _current(info: qm.CollectionInfo) -> Dict[str, Any]:
+    params = info.config.params
+    vectors = params.vectors
+    if not isinstance(vectors, qm.VectorParams):   # named vectors: not a layout we created
+        return {"size": None}
+    hnsw = vectors.hnsw_config or info.config.hnsw_config
+    quant = vectors.quantization_config or info.config.quantization_config
+    scalar = getattr(quant, "scalar", None)
+    return {
+        "size": vectors.size,
+        "on_disk": bool(vectors.on_disk),
+        "on_disk_payload": bool(params.on_disk_payload),
+        "quantization": "int8" if scalar is not None else "none",
+        "quantile": getattr(scalar, "quantile", None),
+        "always_ram": getattr(scalar, "always_ram", None),
+        "hnsw_m": getattr(hnsw, "m", None),
+        "hnsw_ef_construct": getattr(hnsw, "ef_construct", None),
+        "hnsw_on_disk": bool(getattr(hnsw, "on_disk", False)),
+    }
+
+
+def _drift(current: Dict[str, Any], layout: CollectionLayout) -> Dict[str, Any]:
+    wanted = {k: v for k, v in layout.describe().items() if k in current}
+    if layout.quantization == "none":
+        wanted.pop("quantile", None)
+        wanted.pop("always_ram", None)
+    return {k: (current[k], v) for k, v in wanted.items() if current[k] != v}
+
+
+def create_collection(client: QdrantClient, name: str, size: int, layout: CollectionLayout) -> None:
+    """(Re)create `name` empty, with `size`-dim cosine vectors stored as `layout` says."""
+    if client.collection_exists(name):
+        client.delete_collection(name)
+    client.create_collection(collection_name=name, vectors_config=layout.vector_params(size),
+                             on_disk_payload=layout.on_disk_payload)
+    logger.info(f"Qdrant collection {name} created: {size}-dim, {json.dumps(layout.describe())}")
+
+
+def ensure_collection(client: QdrantClient, name: str, size: int, layout: CollectionLayout) -> bool:
+    """
+    Make `name` match (size, layout). A missing collection, or one whose vector size differs
+    (embed_model changed), is recreated empty and True is returned. Other differences are
+    applied in place; Qdrant rebuilds the index / quantized copies in the background.
+    """
+    if not client.collection_exists(name):
+        create_collection(client, name, size, layout)
+        return True
+    current = _current(client.get_collection(name))
+    if current["size"] != size:
+        logger.warning(f"Qdrant collection {name} has {current['size']}-dim vectors, "
+                       f"embed model gives {size}: recreating it")
+        create_collection(client, name, size, layout)
+        return True
+    drift = _drift(current, layout)
+    if drift:
+        logger.info(f"Qdrant collection {name}: updating layout {drift}")
+        client.update_collection(
+            collection_name=name,
+            vectors_config={"": qm.VectorParamsDiff(
+                on_disk=layout.on_disk, hnsw_config=layout.hnsw_config(),
+                quantization_config=layout.quantization_config() or qm.Disabled.DISABLED)},
+            collection_params=qm.CollectionParamsDiff(on_disk_payload=layout.on_disk_payload),
+        )
+    return False
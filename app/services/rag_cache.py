@@ -0,0 +1,109 @@
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from app.core.cache import LRUCache
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Wraps an Embeddings model and memoizes embed_query in a bounded LRU; documents pass through."""
+
+    def __init__(self, inner: Embeddings, maxsize: int = 1024):
+        self.inner = inner
+        self.cache = LRUCache(maxsize=maxsize)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = text.strip()
+        vec = self.cache.get(key)
+        if vec is None:
+            vec = self.inner.embed_query(text)
+            self.cache.set(key, vec)
+        return vec
+
+
+class SemanticAnswerCache:
+    """
+    Answers keyed by question embedding: a lookup hits when the cosine similarity to a
+    stored question is >= threshold. Embeddings sit in a preallocated (maxsize, dim)
+    matrix whose slots are reused on eviction, so a lookup is one matrix-vector product.
+    Entries are bound to a corpus version and the whole cache is dropped when the indexed
+    documents change.
+    """
+
+    def __init__(self, maxsize: int = 512, threshold: float = 0.95):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.corpus_version: Optional[str] = None
+        self._mat: Optional[np.ndarray] = None       # (maxsize, dim) unit rows, allocated on first store
+        self._valid = np.zeros(max(maxsize, 0), dtype=bool)
+        self._answers: List[Optional[str]] = [None] * max(maxsize, 0)
+        self._lru: "OrderedDict[int, None]" = OrderedDict()   # used slots, least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _unit(vec) -> np.ndarray:
+        v = np.asarray(vec, dtype=np.float32)
+        n = float(np.linalg.norm(v))
+        return v / n if n else v
+
+    def set_corpus_version(self, version: str) -> None:
+        with self._lock:
+            if version != self.corpus_version:
+                self._clear()
+                self.corpus_version = version
+
+    def lookup(self, vec) -> Optional[str]:
+        q = self._unit(vec)
+        with self._lock:
+            if self._lru and self._mat.shape[1] == len(q):
+                sims = self._mat @ q
+                sims[~self._valid] = -np.inf
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    self._lru.move_to_end(best)
+                    self.hits += 1
+                    return self._answers[best]
+            self.misses += 1
+            return None
+
+    def store(self, vec, answer: str, corpus_version: Optional[str] = None) -> None:
+        """Cache answer for vec, unless it was computed against another corpus version than the current one."""
+        if self.maxsize <= 0:
+            return
+        q = self._unit(vec)
+        with self._lock:
+            if corpus_version is not None and corpus_version != self.corpus_version:
+                return
+            if self._mat is None or self._mat.shape[1] != len(q):
+                self._clear()
+                self._mat = np.zeros((self.maxsize, len(q)), dtype=np.float32)
+            if len(self._lru) < self.maxsize:
+                slot = int(np.argmin(self._valid))   # first free slot
+            else:
+                slot, _ = self._lru.popitem(last=False)
+            self._mat[slot] = q
+            self._valid[slot] = True
+            self._answers[slot] = answer
+            self._lru[slot] = None
+
+    def _clear(self) -> None:
+        self._valid[:] = False
+        self._answers = [None] * len(self._answers)
+        self._lru.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"size": len(self._lru), "maxsize": self.maxsize, "threshold": self.threshold,
+                "hits": self.hits, "misses": self.misses, "hit_rate": (self.hits / total) if total else 0.0,
+                "corpus_version": self.corpus_version}
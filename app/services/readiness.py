@@ -0,0 +1,94 @@
+from __future__ import annotations
+import threading, time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Optional
+from app.core.logger import logger
+
+PENDING, STARTING, READY, ERROR, DISABLED = "pending", "starting", "ready", "error", "disabled"
+_SETTLED = {READY, ERROR, DISABLED}
+
+
+class Readiness:
+    """
+    Per-subsystem startup state for the health probes. `required` subsystems gate
+    readiness; the rest (vector store, SQL) only degrade it, so one unavailable backend
+    doesn't keep the API from serving. Also records import time and time-to-ready.
+    """
+
+    def __init__(self, required: Iterable[str], optional: Iterable[str]):
+        self.required = tuple(required)
+        self._lock = threading.Lock()
+        self._subsystems: Dict[str, Dict[str, Any]] = {
+            name: {"state": PENDING, "detail": None, "since": None, "seconds": None}
+            for name in (*self.required, *optional)
+        }
+        self.boot_t0 = time.perf_counter()
+        self.booted_at = time.time()
+        self.import_seconds: Optional[float] = None
+        self.ready_seconds: Optional[float] = None    # boot -> all required subsystems ready
+        self.settled_seconds: Optional[float] = None  # boot -> every subsystem ready/error/disabled
+
+    def set_boot(self, t0: float, import_seconds: float) -> None:
+        self.boot_t0 = t0
+        self.import_seconds = import_seconds
+        logger.info(f"app import took {import_seconds:.2f}s")
+
+    def mark(self, name: str, state: str, detail: Any = None) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            sub = self._subsystems.setdefault(name, {"state": PENDING, "detail": None, "since": None, "seconds": None})
+            if state == STARTING:
+                sub["since"] = now
+            elif sub["since"] is not None and state in _SETTLED:
+                sub["seconds"] = round(now - sub["since"], 3)
+            sub["state"], sub["detail"] = state, detail
+            states = {n: s["state"] for n, s in self._subsystems.items()}
+            elapsed = round(now - self.boot_t0, 3)
+            if self.ready_seconds is None and all(states[n] == READY for n in self.required):
+                self.ready_seconds = elapsed
+                logger.info(f"ready to serve {elapsed:.2f}s after boot")
+            if self.settled_seconds is None and all(s in _SETTLED for s in states.values()):
+                self.settled_seconds = elapsed
+                logger.info(f"all subsystems settled {elapsed:.2f}s after boot: {states}")
+
+    @contextmanager
+    def track(self, name: str):
+        """Mark `name` starting, then ready, or error (the exception is logged, not re-raised)."""
+        self.mark(name, STARTING)
+        try:
+            yield
+        except Exception as e:
+            logger.warning(f"{name} failed to start: {e}")
+            self.mark(name, ERROR, f"{type(e).__name__}: {e}")
+        else:
+            self.mark(name, READY)
+
+    def state(self, name: str) -> str:
+        with self._lock:
+            return self._subsystems.get(name, {}).get("state", PENDING)
+
+    @property
+    def is_ready(self) -> bool:
+        return all(self.state(n) == READY for n in self.required)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            subs = {n: {k: v for k, v in s.items() if k != "since"} for n, s in self._subsystems.items()}
+        required_ok = all(subs[n]["state"] == READY for n in self.required)
+        all_ok = all(s["state"] in (READY, DISABLED) for s in subs.values())
+        if required_ok:
+            status = "ready" if all_ok else "degraded"
+        else:
+            status = "error" if any(subs[n]["state"] == ERROR for n in self.required) else "starting"
+        return {
+            "status": status,
+            "required": list(self.required),
+            "subsystems": subs,
+            "uptime_s": round(time.time() - self.booted_at, 1),
+            "import_seconds": self.import_seconds,
+            "time_to_ready_s": self.ready_seconds,
+            "time_to_settled_s": self.settled_seconds,
+        }
+
+
+READINESS = Readiness(required=("profile_store", "checkpointer", "graph"), optional=("vectorstore", "sql"))
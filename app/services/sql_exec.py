@@ -0,0 +1,119 @@
+from __future__ import annotations
+import json, re, time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Tuple
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection, Engine, make_url
+
+# statement terminator(s), and any comments after them
+_TRAILING_END = re.compile(r";(\s|;|--[^\n]*)*$")
+
+
+def make_engine(uri: str, pool_size: int = 5, max_overflow: int = 5, pool_recycle: int = 1800) -> Engine:
+    """Pooled engine; pool sizing only applies to server databases (SQLite picks its own pool)."""
+    if make_url(uri).get_backend_name() == "sqlite":
+        return create_engine(uri)
+    return create_engine(uri, pool_size=pool_size, max_overflow=max_overflow,
+                         pool_recycle=pool_recycle, pool_pre_ping=True)
+
+
+def _statement(sql: str) -> str:
+    """sql without surrounding whitespace or a trailing ';' (and comments after it)."""
+    return _TRAILING_END.sub("", sql.strip()).rstrip()
+
+
+def ensure_limit(sql: str, limit: int) -> str:
+    """
+    Cap a SELECT at `limit` rows by wrapping it, so any LIMIT / OFFSET / FETCH form it ends
+    with (LIMIT ALL, LIMIT 10,500, ...) is left alone and only ever narrowed. The newlines
+    keep a trailing -- comment from swallowing the closing parenthesis.
+    """
+    return f"SELECT * FROM (\n{_statement(sql)}\n) AS _bounded LIMIT {int(limit)}"
+
+
+@dataclass
+class BoundedResult:
+    columns: List[str]
+    rows: List[Tuple[Any, ...]]
+    truncated: bool
+    total: Optional[int] = None     # row count when truncated and counting finished in time
+    total_estimated: bool = False   # total is the planner's estimate, not a count
+    elapsed_ms: float = 0.0
+    sql: str = ""
+    notes: List[str] = field(default_factory=list)
+
+    def render(self) -> str:
+        out = f"Columns: {', '.join(self.columns)}\n{self.rows}"
+        if self.truncated:
+            total = "more" if self.total is None else \
+                f"~{self.total} (estimated)" if self.total_estimated else f"{self.total}"
+            out += f"\n... (showing first {len(self.rows)} of {total} rows)"
+        return out
+
+
+@contextmanager
+def _guarded(conn: Connection, timeout_ms: int):
+    """Read-only transaction with a per-statement time limit (Postgres natively, SQLite via progress handler)."""
+    backend = conn.engine.dialect.name
+    with conn.begin():
+        if backend == "postgresql":
+            conn.execute(text("SET TRANSACTION READ ONLY"))
+            if timeout_ms > 0:
+                conn.execute(text(f"SET LOCAL statement_timeout = {int(timeout_ms)}"))
+            yield
+        elif backend == "sqlite" and timeout_ms > 0:
+            raw = conn.connection.driver_connection
+            deadline = time.monotonic() + timeout_ms / 1000
+            raw.set_progress_handler(lambda: int(time.monotonic() > deadline), 10000)
+            try:
+                yield
+            finally:
+                raw.set_progress_handler(None, 0)
+        else:
+            yield
+
+
+def _estimate_rows(conn: Connection, sql: str) -> Optional[int]:
+    """The planner's row estimate for sql (Postgres EXPLAIN, which doesn't run it); None elsewhere."""
+    if conn.engine.dialect.name != "postgresql":
+        return None
+    plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def run_bounded(engine: Engine, sql: str, max_rows: int = 20, timeout_ms: int = 5000,
+                total: str = "estimate") -> BoundedResult:
+    """
+    Execute a read-only query returning at most `max_rows` rows. Asks the database for
+    max_rows + 1 rows through a server-side cursor to detect truncation without pulling the
+    rest. When truncated, `total` says how the full size is reported: "estimate" (the
+    planner's estimate, Postgres only), "exact" (a COUNT(*) over the original query, which
+    runs it a second time; same time limit) or "off".
+    """
+    t0 = time.perf_counter()
+    base = _statement(sql)
+    bounded = ensure_limit(base, max_rows + 1)
+    with engine.connect() as conn:
+        with _guarded(conn, timeout_ms):
+            result = conn.execution_options(stream_results=True, max_row_buffer=max_rows + 1).execute(text(bounded))
+            columns = list(result.keys())
+            rows = [tuple(r) for r in result.fetchmany(max_rows + 1)]
+            result.close()
+        truncated = len(rows) > max_rows
+        rows = rows[:max_rows]
+        out = BoundedResult(columns, rows, truncated, sql=bounded)
+        if truncated and total in ("estimate", "exact"):
+            try:
+                with _guarded(conn, timeout_ms):
+                    if total == "exact":
+                        out.total = conn.execute(
+                            text(f"SELECT COUNT(*) FROM (\n{base}\n) AS _bounded_count")).scalar()
+                    else:
+                        out.total, out.total_estimated = _estimate_rows(conn, base), True
+            except Exception as e:
+                out.notes.append(f"row count unavailable: {type(e).__name__}")
+    out.elapsed_ms = (time.perf_counter() - t0) * 1000
+    return out
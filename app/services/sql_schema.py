@@ -0,0 +1,164 @@
+from __future__ import annotations
+import hashlib, re, threading, time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Set
+from langchain_community.utilities import SQLDatabase
+from sqlalchemy.engine import Engine
+from app.core.cache import SingleFlight
+from app.core.logger import logger
+
+# question words that name a Chinook table without using its name
+TABLE_SYNONYMS: Dict[str, str] = {
+    "song": "track", "tune": "track", "music": "track",
+    "sale": "invoice", "revenue": "invoice", "order": "invoice", "purchase": "invoice", "spent": "invoice",
+    "sold": "invoice_line", "bought": "invoice_line", "quantity": "invoice_line",
+    "band": "artist", "singer": "artist", "musician": "artist",
+    "record": "album", "client": "customer", "buyer": "customer",
+    "staff": "employee", "manager": "employee", "agent": "employee", "rep": "employee",
+    "format": "media_type",
+}
+_DDL_KEYWORDS = {"constraint", "primary", "foreign", "unique", "check"}
+
+
+def _words(text: str) -> List[str]:
+    """Lowercased word stems; splits CamelCase and snake_case, crude plural stripping."""
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", text)
+    out = []
+    for w in re.findall(r"[a-zA-Z]+", text.lower()):
+        if len(w) > 4 and w.endswith("ies"):
+            w = w[:-3] + "y"
+        elif len(w) > 3 and w.endswith("s") and not w.endswith("ss"):
+            w = w[:-1]
+        out.append(w)
+    return out
+
+
+def _norm_table(name: str) -> str:
+    return "_".join(_words(name))
+
+
+@dataclass(frozen=True)
+class _Tables:
+    """One refresh's table info and the word indexes derived from it; replaced whole, never mutated."""
+    info: Dict[str, str] = field(default_factory=dict)
+    name_words: Dict[str, Set[str]] = field(default_factory=dict)
+    column_words: Dict[str, Set[str]] = field(default_factory=dict)
+    links: Dict[str, Set[str]] = field(default_factory=dict)
+    by_norm: Dict[str, str] = field(default_factory=dict)
+
+
+class SchemaSnapshot:
+    """
+    Cached CREATE TABLE + sample rows for every usable table, captured once and reused
+    until `ttl` seconds pass or refresh() is called. Duck-types the two members
+    create_sql_query_chain needs from SQLDatabase (`dialect`, `get_table_info`), so the
+    chain can be built once over the snapshot instead of re-introspecting per question.
+    """
+
+    def __init__(self, engine_provider: Callable[[], Engine], dialect: str, sample_rows: int = 3,
+                 ttl: float = 3600.0, max_tables: int = 4):
+        self.engine_provider = engine_provider
+        self._dialect = dialect
+        self.sample_rows = sample_rows
+        self.db: Optional[SQLDatabase] = None   # reflected on first refresh, not at import
+        self.ttl = ttl
+        self.max_tables = max_tables
+        self._lock = threading.Lock()
+        self._refreshes = SingleFlight()   # concurrent expired readers share one reload
+        self._tables = _Tables()
+        self.built_at: Optional[float] = None
+        self.build_seconds: Optional[float] = None
+        self.fingerprint: str = ""     # hash of the DDL (not the sample rows); changes when the schema does
+
+    @property
+    def dialect(self) -> str:
+        return self._dialect
+
+    def refresh(self) -> None:
+        t0 = time.perf_counter()
+        if self.db is None:
+            self.db = SQLDatabase(self.engine_provider(), sample_rows_in_table_info=self.sample_rows)
+        info: Dict[str, str] = {}
+        for table in self.db.get_usable_table_names():
+            info[table] = self.db.get_table_info([table])
+        name_words, column_words, links = {}, {}, {t: set() for t in info}
+        by_norm = {_norm_table(t): t for t in info}
+        for table, text in info.items():
+            ddl = text.split("/*", 1)[0]
+            cols = [c for c in re.findall(r'^\t"?(\w+)"?\s', ddl, flags=re.M) if c.lower() not in _DDL_KEYWORDS]
+            name_words[table] = set(_words(table))
+            column_words[table] = {w for c in cols for w in _words(c)} - {"id"}
+            for ref in re.findall(r'REFERENCES\s+"?(\w+)"?', ddl):
+                if ref in links:
+                    links[table].add(ref)
+                    links[ref].add(table)
+        # foreign-key columns (artist_id in album) say nothing about relevance; names do that
+        table_words = set().union(*name_words.values()) if name_words else set()
+        column_words = {t: w - table_words for t, w in column_words.items()}
+        fingerprint = hashlib.sha256(
+            "\n".join(info[t].split("/*", 1)[0] for t in sorted(info)).encode("utf-8")).hexdigest()[:16]
+        with self._lock:
+            self.fingerprint = fingerprint
+            self._tables = _Tables(info, name_words, column_words, links, by_norm)
+            self.built_at = time.time()
+            self.build_seconds = time.perf_counter() - t0
+        logger.info(f"NL2SQL schema snapshot: {len(info)} tables in {self.build_seconds:.2f}s")
+
+    def _ensure(self) -> None:
+        if self.built_at is not None and (self.ttl <= 0 or time.time() - self.built_at < self.ttl):
+            return
+        try:
+            self._refreshes.do("refresh", self.refresh)
+        except Exception as e:
+            if self.built_at is None:
+                raise
+            logger.warning(f"NL2SQL schema refresh failed, keeping previous snapshot: {e}")
+            self.built_at = time.time()
+
+    def _current(self) -> _Tables:
+        self._ensure()
+        with self._lock:
+            return self._tables
+
+    def get_table_info(self, table_names: Optional[Iterable[str]] = None) -> str:
+        info = self._current().info
+        names = list(info) if table_names is None else [t for t in table_names if t in info]
+        return "\n\n".join(info[t] for t in names)
+
+    def relevant_tables(self, question: str) -> Optional[List[str]]:
+        """
+        Tables worth putting in the prompt: name/synonym matches score 3, column-word matches
+        score by rarity (1 / tables sharing that word); keep the best `max_tables` with
+        score >= 1 plus any single table that joins two picks. None means "use the whole schema".
+        """
+        tables = self._current()   # one refresh's view throughout, even if another lands meanwhile
+        if self.max_tables <= 0:
+            return None
+        words = set(_words(question))
+        hinted = {tables.by_norm.get(_norm_table(TABLE_SYNONYMS[w])) for w in words if w in TABLE_SYNONYMS}
+        df: Dict[str, int] = {}
+        for cols in tables.column_words.values():
+            for w in cols:
+                df[w] = df.get(w, 0) + 1
+        scores: Dict[str, float] = {}
+        for table in tables.info:
+            name_words = tables.name_words[table]
+            score = 3.0 if (name_words and name_words <= words) or table in hinted else 0.0
+            score += sum(1.0 / df[w] for w in words & tables.column_words[table])
+            if score >= 1.0:
+                scores[table] = score
+        if not scores:
+            return None
+        picked = sorted(scores, key=lambda t: (-scores[t], t))[: self.max_tables]
+        for i, a in enumerate(picked[:]):
+            for b in picked[i + 1:]:
+                if b in tables.links[a]:
+                    continue
+                bridge = sorted(tables.links[a] & tables.links[b])
+                if bridge and bridge[0] not in picked:
+                    picked.append(bridge[0])
+        return picked
+
+    def status(self) -> dict:
+        return {"tables": len(self._tables.info), "fingerprint": self.fingerprint, "built_at": self.built_at, "build_seconds": self.build_seconds,
+                "ttl": self.ttl, "max_tables": self.max_tables, "coalesced_refreshes": self._refreshes.coalesced}
@@ -0,0 +1,119 @@
+from __future__ import annotations
+import hashlib, json, os, uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List
+
+SUPPORTED_EXTS = (".pdf", ".docx")
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: str, bufsize: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(bufsize)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_point_id(source: str, index: int, text: str) -> str:
+    """Deterministic Qdrant point id: same file + position + content -> same id."""
+    digest = hashlib.sha256(f"{source}\0{index}\0{text}".encode("utf-8")).hexdigest()
+    return str(uuid.UUID(hex=digest[:32]))
+
+
+def scan_docs(docs_dir: str) -> Dict[str, os.stat_result]:
+    """Return {path: stat} for every supported document in docs_dir."""
+    found: Dict[str, os.stat_result] = {}
+    if not os.path.isdir(docs_dir):
+        return found
+    for filename in sorted(os.listdir(docs_dir)):
+        if not filename.lower().endswith(SUPPORTED_EXTS):
+            continue
+        path = os.path.join(docs_dir, filename)
+        if os.path.isfile(path):
+            found[path] = os.stat(path)
+    return found
+
+
+@dataclass
+class IngestPlan:
+    added: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    hashes: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def to_embed(self) -> List[str]:
+        return self.added + self.changed
+
+
+@dataclass
+class IngestManifest:
+    """
+    Tracks what has already been indexed: per file its content hash and the
+    point ids of its chunks, so a restart only touches files that changed.
+    """
+    path: Path
+    embed_model: str
+    files: Dict[str, dict] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Path, embed_model: str) -> "IngestManifest":
+        try:
+            raw = json.loads(Path(path).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return cls(path=Path(path), embed_model=embed_model)
+        if raw.get("version") != MANIFEST_VERSION or raw.get("embed_model") != embed_model:
+            # different embedding space -> nothing we stored is reusable
+            return cls(path=Path(path), embed_model=embed_model)
+        return cls(path=Path(path), embed_model=embed_model, files=raw.get("files", {}))
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        payload = {"version": MANIFEST_VERSION, "embed_model": self.embed_model, "files": self.files}
+        tmp.write_text(json.dumps(payload, indent=1), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def fingerprint(self) -> str:
+        """Stable id of the indexed corpus; changes whenever any file is added, changed or removed."""
+        h = hashlib.sha256(self.embed_model.encode("utf-8"))
+        for path in sorted(self.files):
+            h.update(f"\0{path}\0{self.files[path].get('sha256', '')}".encode("utf-8"))
+        return h.hexdigest()[:16]
+
+    def chunk_ids(self, path: str) -> List[str]:
+        return list(self.files.get(path, {}).get("chunks", []))
+
+    def record(self, path: str, sha256: str, st: os.stat_result, chunk_ids: List[str]) -> None:
+        self.files[path] = {"sha256": sha256, "size": st.st_size, "mtime": st.st_mtime, "chunks": chunk_ids}
+
+    def forget(self, path: str) -> None:
+        self.files.pop(path, None)
+
+    def diff(self, current: Dict[str, os.stat_result]) -> IngestPlan:
+        plan = IngestPlan()
+        for path, st in current.items():
+            entry = self.files.get(path)
+            if entry and entry.get("size") == st.st_size and entry.get("mtime") == st.st_mtime:
+                # cheap stat match: trust the stored hash, don't re-read the file
+                plan.unchanged.append(path)
+                plan.hashes[path] = entry["sha256"]
+                continue
+            sha = file_sha256(path)
+            plan.hashes[path] = sha
+            if entry is None:
+                plan.added.append(path)
+            elif entry.get("sha256") != sha:
+                plan.changed.append(path)
+            else:
+                # touched but identical content: refresh the stat, keep the points
+                self.record(path, sha, st, entry.get("chunks", []))
+                plan.unchanged.append(path)
+        plan.removed = [p for p in self.files if p not in current]
+        return plan
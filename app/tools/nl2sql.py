@@ -1,15 +1,73 @@
-import re
+import hashlib, re, threading
 from pydantic import BaseModel
 from langchain.tools import tool
-from langchain_community.utilities import SQLDatabase
 from langchain_community.chat_models import ChatOllama
 from langchain.chains import create_sql_query_chain
-from langchain_community.tools.sql_database.tool import QuerySQLDataBaseTool
+from sqlalchemy.engine import Engine, make_url
 from app.core.config import settings
+from app.core.cache import PersistentCache, SingleFlight
 from app.core.tracking import traceable
+from app.services.sql_schema import SchemaSnapshot
+from app.services.sql_exec import make_engine, run_bounded
+from app.services.llm_cache import with_llm_cache
+from app.services.observability import instrument_llm
+from app.core.metrics import BACKEND_DURATION
+from app.services.concurrency import backend_limiter
 
-DB = SQLDatabase.from_uri(settings.chinook_uri)
-SQL_LLM = ChatOllama(model=settings.ollama_model)
+# The pooled engine (and its DB driver) is created on first use, so importing this module
+# never touches Postgres; the schema is captured on first use too (refreshed on TTL / admin request).
+_ENGINE: Engine | None = None
+_ENGINE_LOCK = threading.Lock()
+
+
+def get_engine() -> Engine:
+    global _ENGINE
+    with _ENGINE_LOCK:
+        if _ENGINE is None:
+            _ENGINE = make_engine(settings.chinook_uri, pool_size=settings.nl2sql_pool_size,
+                                  max_overflow=settings.nl2sql_max_overflow,
+                                  pool_recycle=settings.nl2sql_pool_recycle)
+        return _ENGINE
+
+
+SQL_LLM = with_llm_cache(instrument_llm(ChatOllama(model=settings.ollama_model)), "nl2sql")
+SCHEMA = SchemaSnapshot(get_engine, make_url(settings.chinook_uri).get_backend_name(),
+                        sample_rows=settings.nl2sql_sample_rows,
+                        ttl=settings.nl2sql_schema_ttl, max_tables=settings.nl2sql_max_tables)
+SQL_CHAIN = create_sql_query_chain(SQL_LLM, SCHEMA)
+
+# level 1: normalized question -> cleaned SQL (valid while model + schema are unchanged)
+# level 2: SQL text -> result, expiring after NL2SQL_RESULT_CACHE_TTL since the data can change
+_CACHE_DB = settings.data_dir / "nl2sql_cache.sqlite3"
+SQL_CACHE = PersistentCache(_CACHE_DB, "question_sql", maxsize=settings.nl2sql_sql_cache_size)
+RESULT_CACHE = PersistentCache(_CACHE_DB, "sql_result", maxsize=settings.nl2sql_result_cache_size,
+                               ttl=settings.nl2sql_result_cache_ttl)
+# concurrent identical questions / queries (e.g. a batch) share one generation / execution
+_FLIGHTS = SingleFlight()
+
+
+def _normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question.strip().lower()).rstrip("?.! ")
+
+
+def _sql_cache_key(question: str) -> str:
+    raw = f"{settings.ollama_model}\x1f{SCHEMA.fingerprint}\x1f{_normalize_question(question)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _execute(query: str) -> str:
+    try:
+        with backend_limiter("sql"), BACKEND_DURATION.time(backend="sql", op="query"):
+            res = run_bounded(get_engine(), query, max_rows=settings.nl2sql_max_rows,
+                              timeout_ms=settings.nl2sql_statement_timeout_ms,
+                              total=settings.nl2sql_total_rows)
+    except Exception as e:
+        return f"Error: {e}"
+    return res.render()
+
+
+def cache_stats() -> dict:
+    return {"question_sql": SQL_CACHE.stats(), "sql_result": RESULT_CACHE.stats(), "coalesced": _FLIGHTS.coalesced}
 
 def _clean_sql_query(text: str) -> str:
     text = re.sub(r"```(?:sql|SQL|postgresql|mysql)?\s*(.*?)\s*```", r"\1", text, flags=re.DOTALL)
@@ -26,6 +84,21 @@ def _clean_sql_query(text: str) -> str:
         raise ValueError("Generated SQL is not a read-only SELECT/CTE.")
     return text
 
+def _generate(question: str, tables, sql_key: str) -> str:
+    with backend_limiter("ollama"):
+        generated = SQL_CHAIN.invoke({"question": question, "table_names_to_use": tables})
+    query = _clean_sql_query(generated)
+    SQL_CACHE.set(sql_key, query)
+    return query
+
+
+def _run(query: str, result_key: str) -> str:
+    result = _execute(query)
+    if not result.startswith("Error:"):
+        RESULT_CACHE.set(result_key, result)
+    return result
+
+
 class SQLToolSchema(BaseModel):
     question: str
 
@@ -33,11 +106,13 @@ class SQLToolSchema(BaseModel):
 @traceable(name="nl2sql_tool")
 def nl2sql_tool(question: str) -> str:
     """Translate a natural-language question into a **read-only** SQL query for the Chinook Postgres DB, execute it, and return SQL + a result preview."""
-    write = create_sql_query_chain(SQL_LLM, DB)
-    exec_tool = QuerySQLDataBaseTool(db=DB)
-    query = _clean_sql_query(write.invoke({"question": question}))
-    result = exec_tool.invoke(query)
-    preview = result
-    if isinstance(result, list) and len(result) > 20:
-        preview = result[:20] + [f"... ({len(result)-20} more rows)"]
-    return f"SQL:\n{query}\n\nResult:\n{preview}"
+    tables = SCHEMA.relevant_tables(question)   # also refreshes the snapshot, so the key sees the current fingerprint
+    sql_key = _sql_cache_key(question)
+    query = SQL_CACHE.get(sql_key)
+    if query is None:
+        query = _FLIGHTS.do(("sql", sql_key), lambda: _generate(question, tables, sql_key))
+    result_key = f"{settings.nl2sql_max_rows}\x1f{query}"
+    result = RESULT_CACHE.get(result_key)
+    if result is None:
+        result = _FLIGHTS.do(("result", result_key), lambda: _run(query, result_key))
+    return f"SQL:\n{query}\n\nResult:\n{result}"
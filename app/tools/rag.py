@@ -1,92 +1,232 @@
-import os
-from typing import List
+import os, threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List
 from pydantic import BaseModel
 from langchain.tools import tool
 from langchain_core.documents import Document
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import SentenceTransformerEmbeddings
 from langchain.vectorstores import Qdrant
+from langchain_core.vectorstores import VectorStore
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_community.chat_models import ChatOllama
+from app.core.cache import SingleFlight
 from app.core.config import settings
 from app.core.tracking import traceable
+from app.services.ingestion import FanoutWriter, IngestStats, QdrantWriter, sync_files
+from app.services.lexical_index import BM25Index, reciprocal_rank_fusion
+from app.services.numpy_index import NumpyVectorStore
+from app.services.qdrant_collection import CollectionLayout, create_collection, embedding_dimension, ensure_collection
+from app.services.rag_cache import CachedQueryEmbeddings, SemanticAnswerCache
+from app.services.llm_cache import with_llm_cache
+from app.services.observability import instrument_llm
+from app.core.metrics import BACKEND_DURATION
+from app.services.concurrency import backend_limiter
+from app.services.vectorstore import IngestManifest, IngestPlan, scan_docs
 
 # Global vectorstore (set at startup)
-VECTORSTORE: Qdrant | None = None
+VECTORSTORE: VectorStore | None = None
+# BM25 index over the same chunks, fused with dense hits (set by initialize_vectorstore)
+LEXICAL_INDEX: BM25Index | None = None
+
+# Answers for near-identical questions, dropped whenever the indexed corpus changes
+ANSWER_CACHE = SemanticAnswerCache(
+    maxsize=settings.rag_answer_cache_size,
+    threshold=settings.rag_answer_cache_threshold,
+)
+# concurrent identical questions (e.g. a batch) share one retrieval + answer
+_FLIGHTS = SingleFlight()
+
+
+def cache_stats() -> dict:
+    return {"answer": ANSWER_CACHE.stats(), "coalesced": _FLIGHTS.coalesced}
+
+
+@dataclass
+class _IndexHandle:
+    """Everything needed to re-sync the index after startup (used by the ingestion worker)."""
+    embedding: CachedQueryEmbeddings
+    manifest: IngestManifest
+    vectorstore: VectorStore
+    qdrant_writer: QdrantWriter | None
+    lexical: BM25Index | None
+
+
+_HANDLE: _IndexHandle | None = None
+_REFRESH_LOCK = threading.Lock()
+# per-query Qdrant params (hnsw_ef, quantized rescoring) for the configured layout
+SEARCH_PARAMS = CollectionLayout.from_settings().search_params()
+
+
+def _qdrant_client() -> QdrantClient:
+    # QDRANT_URL=":memory:" runs Qdrant embedded in-process (benchmarks, offline runs)
+    if settings.qdrant_url == ":memory:":
+        return QdrantClient(location=":memory:")
+    return QdrantClient(url=settings.qdrant_url)
+
+
+def _open_qdrant(embedding, manifest: IngestManifest):
+    client = _qdrant_client()
+    collection = settings.qdrant_collection
+    layout = CollectionLayout.from_settings()
+    size = embedding_dimension(embedding)
+    if not manifest.files:
+        # unusable manifest: start the collection from scratch too, so they agree
+        create_collection(client, collection, size, layout)
+    elif ensure_collection(client, collection, size, layout):
+        manifest.files = {}   # collection was missing or had another vector size
+    vs = Qdrant(client=client, collection_name=collection, embeddings=embedding)
+    return vs, QdrantWriter(client, collection)
+
+
+def _open_numpy(embedding, index_dir: Path, manifest: IngestManifest):
+    vs = NumpyVectorStore(index_dir, embedding, dtype=settings.numpy_index_dtype)
+    if vs.count == 0 or not manifest.files:
+        vs.reset()
+        manifest.files = {}
+    return vs, None
+
 
 @traceable(name="initialize_vectorstore")
-def initialize_vectorstore(docs_dir: str) -> Qdrant:
-    documents: List[Document] = []
-    if os.path.isdir(docs_dir):
-        for filename in os.listdir(docs_dir):
-            path = os.path.join(docs_dir, filename)
-            if filename.lower().endswith(".pdf"):
-                loader = PyPDFLoader(path)
-            elif filename.lower().endswith(".docx"):
-                loader = Docx2txtLoader(path)
-            else:
-                continue
-            loaded = loader.load()
-            for d in loaded:
-                d.metadata = d.metadata or {}
-                d.metadata.setdefault("source", path)
-            documents.extend(loaded)
-    print(f"RAG: loaded {len(documents)} docs")
-
-    chunks = []
-    if documents:
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        chunks = splitter.split_documents(documents)
-    print(f"RAG: split into {len(chunks)} chunks")
-
-    embedding = SentenceTransformerEmbeddings(model_name=settings.embed_model)
-
-    client = QdrantClient(url=settings.qdrant_url)
-    collection = "my_rag_collection"
-    names = [c.name for c in client.get_collections().collections]
-    if collection not in names:
-        client.recreate_collection(
-            collection_name=collection,
-            vectors_config=VectorParams(size=384, distance=Distance.COSINE),
-        )
-    vs = Qdrant.from_documents(
-        documents=chunks,
-        embedding=embedding,
-        collection_name=collection,
-        url=settings.qdrant_url,
+def initialize_vectorstore(docs_dir: str, sync: bool = True) -> VectorStore:
+    """
+    Incrementally sync docs_dir into the configured vector backend (Qdrant or the
+    embedded NumPy index). A manifest remembers each file's content hash and chunk
+    point ids: unchanged files are skipped, changed files are re-embedded in place
+    and deleted files have their points removed. With sync=False only the index is
+    opened; the caller runs refresh_vectorstore(force=True) itself.
+    """
+    global _HANDLE, VECTORSTORE, LEXICAL_INDEX
+    embedding = CachedQueryEmbeddings(
+        SentenceTransformerEmbeddings(
+            model_name=settings.embed_model,
+            encode_kwargs={"batch_size": settings.embed_batch_size},
+        ),
+        maxsize=settings.rag_query_cache_size,
     )
-    return vs
+
+    numpy_backend = settings.vector_backend == "numpy"
+    index_dir = settings.data_dir / "numpy_index" if numpy_backend else settings.data_dir
+    manifest_path = index_dir / "manifest.json" if numpy_backend else settings.data_dir / "rag_manifest.json"
+    manifest = IngestManifest.load(manifest_path, settings.embed_model)
+
+    (index_dir / "bm25_index.json").unlink(missing_ok=True)   # pre-SQLite BM25 file
+    lexical = BM25Index(index_dir / "bm25_index.sqlite3", fingerprint=manifest.fingerprint) \
+        if settings.rag_hybrid else None
+    if lexical is not None and manifest.files and lexical.corpus != manifest.fingerprint():
+        # BM25 index missing, or last committed for another corpus (say, left over from before
+        # hybrid was switched off and on again): rebuild everything once
+        print("RAG: lexical index missing or out of date, rebuilding the whole index")
+        manifest.files = {}
+
+    if numpy_backend:
+        vs, qdrant_writer = _open_numpy(embedding, index_dir, manifest)
+    else:
+        vs, qdrant_writer = _open_qdrant(embedding, manifest)
+    if lexical is not None and not manifest.files:
+        lexical.reset()
+
+    with _REFRESH_LOCK:
+        _HANDLE = _IndexHandle(embedding, manifest, vs, qdrant_writer, lexical)
+        VECTORSTORE, LEXICAL_INDEX = vs, lexical
+    if sync:
+        refresh_vectorstore(docs_dir, force=True)
+    return VECTORSTORE
+
+
+def refresh_vectorstore(docs_dir: str, force: bool = False,
+                        on_plan: Callable[[IngestPlan], None] | None = None,
+                        on_file: Callable[[str], None] | None = None) -> IngestStats | None:
+    """
+    Re-scan docs_dir and index whatever changed. NumPy/BM25 indexes are updated on a
+    fork and swapped into VECTORSTORE / LEXICAL_INDEX once the sync ends, so retriever_tool
+    never sees a half-applied change; if the sync fails, the fork is still swapped in, as
+    committed so far, to match the saved manifest. Qdrant upserts are live per batch.
+    Serialized by a lock, so concurrent callers never index the same file twice.
+    Returns None when nothing changed.
+    """
+    global VECTORSTORE, LEXICAL_INDEX
+    with _REFRESH_LOCK:
+        h = _HANDLE
+        if h is None:
+            return None
+        plan = h.manifest.diff(scan_docs(docs_dir))
+        if on_plan is not None:
+            on_plan(plan)
+        if not (force or plan.to_embed or plan.removed):
+            return None
+
+        vs = h.vectorstore.fork() if isinstance(h.vectorstore, NumpyVectorStore) else h.vectorstore
+        lexical = h.lexical.fork() if h.lexical is not None else None
+        writer = h.qdrant_writer or vs
+        if lexical is not None:
+            writer = FanoutWriter(writer, lexical)
+        try:
+            stats = sync_files(writer, h.embedding, h.manifest, plan,
+                               workers=settings.ingest_workers or (os.cpu_count() or 1),
+                               batch_size=settings.upsert_batch_size,
+                               max_inflight=settings.ingest_queue_batches, on_file=on_file)
+        finally:
+            # sync_files commits the fork and saves the manifest as it goes: even when it fails
+            # part-way, files the manifest now lists are in the fork, so that is what gets served
+            h.vectorstore, h.lexical = vs, lexical
+            VECTORSTORE, LEXICAL_INDEX = vs, lexical
+            ANSWER_CACHE.set_corpus_version(h.manifest.fingerprint())
+    print(f"RAG: {len(plan.added)} added, {len(plan.changed)} changed, "
+          f"{len(plan.removed)} removed, {len(plan.unchanged)} unchanged; "
+          f"embedded {stats.chunks} chunks from {stats.files} files ({stats.rates()}), {stats.failed} failed")
+    return stats
+
+
+def _documents(ids: List[str]) -> List[Document]:
+    """Chunks for BM25 hits, read from the vector index (the BM25 index keeps no text)."""
+    if not ids:
+        return []
+    if isinstance(VECTORSTORE, NumpyVectorStore):
+        return VECTORSTORE.get_by_ids(ids)
+    vs: Qdrant = VECTORSTORE
+    points = {str(p.id): p.payload or {} for p in vs.client.retrieve(vs.collection_name, ids, with_payload=True)}
+    return [Document(page_content=points[pid].get(vs.content_payload_key) or "",
+                     metadata=points[pid].get(vs.metadata_payload_key) or {}, id=pid)
+            for pid in ids if pid in points]
+
+
+def retrieve(question: str) -> List[Document]:
+    """Dense MMR hits, fused with BM25 hits via reciprocal-rank fusion when hybrid retrieval is on."""
+    hybrid = LEXICAL_INDEX is not None and settings.rag_hybrid
+    fetch_k = settings.rag_fetch_k if hybrid else settings.rag_dense_fetch_k
+    search_kwargs = {"k": settings.rag_k, "fetch_k": fetch_k, "lambda_mult": 0.3}
+    if settings.vector_backend == "qdrant":
+        search_kwargs["search_params"] = SEARCH_PARAMS   # hnsw_ef / quantized rescoring, if configured
+    retriever = VECTORSTORE.as_retriever(search_type="mmr", search_kwargs=search_kwargs)
+    with backend_limiter(settings.vector_backend), \
+            BACKEND_DURATION.time(backend=settings.vector_backend, op="retrieve"):
+        dense = retriever.invoke(question)
+    if not hybrid:
+        return dense
+    ids = [pid for pid, _ in LEXICAL_INDEX.search(question, k=settings.rag_lexical_k)]
+    with backend_limiter(settings.vector_backend), \
+            BACKEND_DURATION.time(backend=settings.vector_backend, op="fetch"):
+        lexical = _documents(ids)
+    return reciprocal_rank_fusion([dense, lexical], k=settings.rag_k, rrf_k=settings.rag_rrf_k)
+
 
 class RagToolSchema(BaseModel):
     question: str
 
-RAG_QA_LLM = ChatOllama(model=settings.ollama_model)
+RAG_QA_LLM = with_llm_cache(instrument_llm(ChatOllama(model=settings.ollama_model)), "rag_qa")
 
-@tool(args_schema=RagToolSchema)
-@traceable(name="retriever_tool")
-def retriever_tool(question: str) -> str:
-    """Retrieve the most relevant chunks from the local RAG index (Qdrant) and answer using ONLY that context, with sources appended."""
-    global VECTORSTORE
-    if VECTORSTORE is None:
-        return ("RAG is not initialized yet (no documents indexed). "
-                "Add PDF/DOCX files to the docs folder and restart the server.")
-    try:
-        retriever = VECTORSTORE.as_retriever(
-            search_type="mmr",
-            search_kwargs={"k": 5, "fetch_k": 20, "lambda_mult": 0.3},
-        )
-        docs = retriever.invoke(question)
-        if not docs:
-            return "I don't have enough information in the documents."
-
-        combined = "\n\n".join(d.page_content for d in docs)
-
-        prompt = ChatPromptTemplate.from_template(
-            """You are a precise assistant. Using ONLY the context below, answer clearly and concisely.
+def _answer(question: str, qvec, corpus_version: str | None) -> str:
+    docs = retrieve(question)
+    if not docs:
+        return "I don't have enough information in the documents."
+
+    combined = "\n\n".join(d.page_content for d in docs)
+
+    prompt = ChatPromptTemplate.from_template(
+        """You are a precise assistant. Using ONLY the context below, answer clearly and concisely.
 If the answer isn't in the context, say "I don't have enough information in the documents."
 Respect the user's stored tone, summary_style, and prefers_sources.
 
@@ -97,19 +237,40 @@ Context:
 {c}
 
 Answer:"""
-        )
-        chain = (prompt | RAG_QA_LLM | StrOutputParser())
+    )
+    chain = (prompt | RAG_QA_LLM | StrOutputParser())
+    with backend_limiter("ollama"):
         answer = chain.invoke({"q": question, "c": combined})
 
-        sources = []
-        for d in docs:
-            s = d.metadata.get("source")
-            page = d.metadata.get("page")
-            sources.append(f"{os.path.basename(s)}#page={page}" if s and page is not None
-                           else os.path.basename(s) if s else "")
-        sources = sorted(set([s for s in sources if s]))
-        if sources:
-            answer += "\n\nSources: " + ", ".join(sources)
-        return answer
+    sources = []
+    for d in docs:
+        s = d.metadata.get("source")
+        page = d.metadata.get("page")
+        sources.append(f"{os.path.basename(s)}#page={page}" if s and page is not None
+                       else os.path.basename(s) if s else "")
+    sources = sorted(set([s for s in sources if s]))
+    if sources:
+        answer += "\n\nSources: " + ", ".join(sources)
+    # not cached if a refresh swapped the corpus while this answer was being computed
+    ANSWER_CACHE.store(qvec, answer, corpus_version)
+    return answer
+
+
+@tool(args_schema=RagToolSchema)
+@traceable(name="retriever_tool")
+def retriever_tool(question: str) -> str:
+    """Retrieve the most relevant chunks from the local RAG index and answer using ONLY that context, with sources appended."""
+    global VECTORSTORE
+    if VECTORSTORE is None:
+        return ("RAG is not initialized yet (no documents indexed). "
+                "Add PDF/DOCX files to the docs folder; they are picked up automatically.")
+    try:
+        qvec = VECTORSTORE.embeddings.embed_query(question)
+        cached = ANSWER_CACHE.lookup(qvec)
+        if cached is not None:
+            return cached
+        version = ANSWER_CACHE.corpus_version
+        key = (version, " ".join(question.lower().split()))
+        return _FLIGHTS.do(key, lambda: _answer(question, qvec, version))
     except Exception as e:
-        return f"RAG error: {e}"
\ No newline at end of file
+        return f"RAG error: {e}"
@@ -1,11 +1,86 @@
+import re, threading
+from typing import Any, Dict, List
 from pydantic import BaseModel
 from langchain.tools import tool
 
 # If you prefer non-deprecated wrapper:
 # from langchain_tavily import TavilySearchResults
 from langchain_community.tools.tavily_search import TavilySearchResults
+from app.core.cache import LRUCache, PersistentCache, SingleFlight
+from app.core.config import settings
+from app.core.logger import logger
+from app.core.metrics import BACKEND_DURATION
+from app.services.concurrency import backend_limiter
 from app.core.tracking import traceable
 
+# One Tavily client for the process (created on first search, so a missing key only fails searches).
+_CLIENT: TavilySearchResults | None = None
+_CLIENT_LOCK = threading.Lock()
+
+# Normalized query -> raw Tavily results. In-memory TTL cache always; the SQLite copy under
+# data_dir is used when WEB_SEARCH_MODE is "record" (live + persist) or "replay" (offline, no network).
+RESULT_CACHE = LRUCache(settings.web_search_cache_size, ttl=settings.web_search_cache_ttl)
+PERSISTENT_CACHE: PersistentCache | None = (
+    PersistentCache(settings.data_dir / "web_search_cache.sqlite3", "tavily",
+                    maxsize=settings.web_search_persist_size)
+    if settings.web_search_mode in ("record", "replay") else None
+)
+_FLIGHTS = SingleFlight()
+_STATS = {"network_calls": 0, "replay_misses": 0}
+
+
+def _client() -> TavilySearchResults:
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = TavilySearchResults(max_results=settings.web_search_max_results)
+        return _CLIENT
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query.strip().lower()).rstrip("?.! ")
+
+
+def _fetch(key: str, query: str) -> List[Dict[str, Any]]:
+    if settings.web_search_mode == "replay":
+        stored = PERSISTENT_CACHE.get(key)
+        if stored is not None:
+            return stored
+        # local stub: no network in replay runs, an unseen query simply has no results
+        _STATS["replay_misses"] += 1
+        logger.info(f"web search replay miss: {key!r}")
+        return []
+    _STATS["network_calls"] += 1
+    with backend_limiter("tavily"), BACKEND_DURATION.time(backend="tavily", op="search"):
+        results = _client().invoke({"query": query})
+    if not isinstance(results, list):
+        # the wrapper returns an error string instead of raising; don't cache it
+        raise RuntimeError(str(results))
+    if PERSISTENT_CACHE is not None:
+        PERSISTENT_CACHE.set(key, results)
+    return results
+
+
+def search(query: str) -> List[Dict[str, Any]]:
+    """Cached, coalesced Tavily search: concurrent identical queries share one request."""
+    key = normalize_query(query)
+    results = RESULT_CACHE.get(key)
+    if results is None:
+        results = _FLIGHTS.do(key, lambda: _fetch(key, query))
+        RESULT_CACHE.set(key, results)
+    return results
+
+
+def cache_stats() -> dict:
+    return {
+        "mode": settings.web_search_mode,
+        "memory": RESULT_CACHE.stats(),
+        "persistent": PERSISTENT_CACHE.stats() if PERSISTENT_CACHE is not None else None,
+        "coalesced": _FLIGHTS.coalesced,
+        **_STATS,
+    }
+
+
 class WebSearchSchema(BaseModel):
     query: str
 
@@ -14,8 +89,7 @@ class WebSearchSchema(BaseModel):
 @traceable(name="web_search_tool")
 def web_search_tool(query: str) -> str:
     """Search the web (Tavily) and return a concise summary of top results with links."""
-    tavily = TavilySearchResults(max_results=4)
-    results = tavily.invoke({"query": query})
+    results = search(query)
     if not results:
         return "No results found."
     lines = []
@@ -25,5 +99,4 @@ def web_search_tool(query: str) -> str:
         title = r.get("title") or url
         snippet = content[:500].strip()
         lines.append(f"{i}. {title}\n   {url}\n   {snippet}")
-    return "Top results:\n\n" + "\n\n".join(lines)# def web_search_tool(query: str) -> str:
-
+    return "Top results:\n\n" + "\n\n".join(lines)
@@ -0,0 +1,328 @@
+"""
+Offline stand-ins for every external backend the agents use, for benchmarks and load tests:
+
+- FakeChatModel: deterministic chat model with bind_tools / with_structured_output
+  support (routes by keyword, calls the worker's tool once, then answers) and a
+  configurable per-call and per-token latency
+- HashEmbeddings: feature-hashed bag-of-words vectors (384-d, like all-MiniLM-L6-v2)
+- StubTavily: canned search results after a configurable delay
+- build_chinook(): a small SQLite copy of the Chinook schema with synthetic rows
+- write_corpus(): a few DOCX files for the RAG index
+
+install() swaps them into the already-imported app modules; the settings they depend
+on (DATA_DIR, CHINOOK_URI, VECTOR_BACKEND, ...) must be in the environment before
+app.core.config is imported (see bench.load_test).
+"""
+from __future__ import annotations
+import asyncio, hashlib, random, re, sqlite3, time, zipfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+from xml.sax.saxutils import escape
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+# keyword -> worker; a question matching several workers fans out to all of them
+ROUTE_KEYWORDS = {
+    "nl2sql": ("sql", "database", "track", "album", "artist", "customer", "invoice", "genre",
+               "employee", "playlist", "sales", "revenue"),
+    "memory": ("remember", "recall", "my name", "i prefer", "forget"),
+    "rag": ("document", "docs", "pdf", "policy", "handbook", "according to", "report"),
+    "web_researcher": ("news", "latest", "today", "current", "web", "search"),
+}
+WORDS = ("alpha bravo charlie delta echo foxtrot golf hotel india juliet kilo lima mike november "
+         "oscar papa quebec romeo sierra tango uniform victor whiskey xray yankee zulu").split()
+
+
+def route_for(question: str) -> List[str]:
+    q = question.lower()
+    routes = [w for w, kws in ROUTE_KEYWORDS.items() if any(k in q for k in kws)]
+    return routes or ["web_researcher"]
+
+
+def _text(content: Any) -> str:
+    return content if isinstance(content, str) else str(content)
+
+
+def _seeded(text: str) -> random.Random:
+    return random.Random(int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little"))
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic chat model. With a Router tool bound it acts as the supervisor
+    (keyword routing, FINISH once a worker answered); with worker tools bound it calls
+    the worker's main tool once and then answers from the tool output; without tools
+    it writes SQL for create_sql_query_chain prompts and filler text otherwise.
+    """
+    model_name: str = "fake-chat"
+    latency: float = 0.0        # seconds per call
+    token_latency: float = 0.0  # extra seconds per generated token
+    reply_tokens: int = 40
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "reply_tokens": self.reply_tokens}
+
+    def bind_tools(self, tools: Sequence[Any], *, tool_choice: Optional[str] = None, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], tool_choice=tool_choice, **kwargs)
+
+    # ---- behaviour ----------------------------------------------------------
+    def _reply(self, messages: List[BaseMessage], tools: Optional[List[dict]]) -> AIMessage:
+        specs = {t["function"]["name"]: t["function"] for t in tools or []}
+        question = next((_text(m.content) for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        last = messages[-1] if messages else None
+
+        if "Router" in specs:
+            if isinstance(last, HumanMessage):
+                first, *also = route_for(question)
+                args = {"next": first, "also": also}
+            else:
+                args = {"next": "FINISH", "also": []}
+            return self._tool_call("Router", args)
+
+        if specs and not isinstance(last, ToolMessage):
+            name = self._pick_tool(list(specs), question)
+            required = specs[name].get("parameters", {}).get("required", [])
+            args = {p: ("bench_note" if p == "key" else question) for p in required}
+            return self._tool_call(name, args)
+
+        if isinstance(last, ToolMessage):
+            return self._text_reply(f"Based on {last.name or 'the tool'}: {_text(last.content)[:200]}")
+        prompt = "\n".join(_text(m.content) for m in messages)
+        if "SQLQuery" in prompt:
+            tables = re.findall(r'CREATE TABLE "?(\w+)"?', prompt)
+            return self._text_reply(f"SELECT * FROM {tables[0] if tables else 'artist'} LIMIT 5;", filler=False)
+        return self._text_reply(question or prompt[-200:])
+
+    @staticmethod
+    def _pick_tool(names: List[str], question: str) -> str:
+        main = [n for n in names if n not in ("remember_tool", "recall_tool")]
+        if main:
+            return main[0]
+        return "remember_tool" if "remember" in question.lower() and "remember_tool" in names else names[-1]
+
+    @staticmethod
+    def _tool_call(name: str, args: dict) -> AIMessage:
+        call_id = "call_" + hashlib.blake2b(f"{name}{args}".encode(), digest_size=6).hexdigest()
+        return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": call_id}])
+
+    def _text_reply(self, seed: str, filler: bool = True) -> AIMessage:
+        if not filler:
+            return AIMessage(content=seed)
+        rng = _seeded(seed)
+        words = [rng.choice(WORDS) for _ in range(self.reply_tokens)]
+        return AIMessage(content=f"{seed[:120]} -- {' '.join(words)}")
+
+    def _result(self, messages: List[BaseMessage], tools) -> ChatResult:
+        msg = self._reply(messages, tools)
+        in_tokens = sum(len(_text(m.content)) for m in messages) // 4
+        out_tokens = max(1, len(_text(msg.content)) // 4)
+        msg.usage_metadata = {"input_tokens": in_tokens, "output_tokens": out_tokens,
+                              "total_tokens": in_tokens + out_tokens}
+        return ChatResult(generations=[ChatGeneration(message=msg)])
+
+    def _delay(self, result: ChatResult) -> float:
+        return self.latency + self.token_latency * result.generations[0].message.usage_metadata["output_tokens"]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        result = self._result(messages, kwargs.get("tools"))
+        time.sleep(self._delay(result))
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        result = self._result(messages, kwargs.get("tools"))
+        await asyncio.sleep(self._delay(result))
+        return result
+
+
+class HashEmbeddings(Embeddings):
+    """Feature-hashed bag of words, L2-normalized; `latency` seconds per text embedded."""
+
+    def __init__(self, dim: int = 384, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+
+    def _embed(self, text: str) -> List[float]:
+        v = np.zeros(self.dim, dtype=np.float32)
+        for tok in re.findall(r"\w+", text.lower()):
+            h = int.from_bytes(hashlib.blake2b(tok.encode("utf-8"), digest_size=8).digest(), "little")
+            v[h % self.dim] += 1.0 if (h >> 63) & 1 else -1.0
+        n = float(np.linalg.norm(v))
+        return (v / n if n else v).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency * len(texts))
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._embed(text)
+
+
+class StubTavily:
+    """Same call shape as TavilySearchResults.invoke; returns canned hits after `latency` seconds."""
+
+    def __init__(self, latency: float = 0.0, max_results: int = 4):
+        self.latency = latency
+        self.max_results = max_results
+        self.calls = 0
+
+    def invoke(self, payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        query = str(payload.get("query", ""))
+        slug = re.sub(r"\W+", "-", query.lower()).strip("-")[:60] or "empty"
+        rng = _seeded(query)
+        return [{"url": f"https://example.com/{slug}/{i}",
+                 "content": f"Result {i} for {query}: " + " ".join(rng.choice(WORDS) for _ in range(60))}
+                for i in range(self.max_results)]
+
+
+# ---- fixtures -----------------------------------------------------------------
+CHINOOK_DDL = """
+CREATE TABLE artist(artist_id integer primary key, name text);
+CREATE TABLE album(album_id integer primary key, title text, artist_id integer references artist(artist_id));
+CREATE TABLE genre(genre_id integer primary key, name text);
+CREATE TABLE media_type(media_type_id integer primary key, name text);
+CREATE TABLE track(track_id integer primary key, name text, album_id integer references album(album_id),
+    media_type_id integer references media_type(media_type_id), genre_id integer references genre(genre_id),
+    composer text, milliseconds integer, bytes integer, unit_price numeric);
+CREATE TABLE employee(employee_id integer primary key, last_name text, first_name text, title text,
+    reports_to integer references employee(employee_id), birth_date text, hire_date text, address text,
+    city text, state text, country text, postal_code text, phone text, fax text, email text);
+CREATE TABLE customer(customer_id integer primary key, first_name text, last_name text, company text,
+    address text, city text, state text, country text, postal_code text, phone text, fax text, email text,
+    support_rep_id integer references employee(employee_id));
+CREATE TABLE invoice(invoice_id integer primary key, customer_id integer references customer(customer_id),
+    invoice_date text, billing_address text, billing_city text, billing_state text, billing_country text,
+    billing_postal_code text, total numeric);
+CREATE TABLE invoice_line(invoice_line_id integer primary key, invoice_id integer references invoice(invoice_id),
+    track_id integer references track(track_id), unit_price numeric, quantity integer);
+CREATE TABLE playlist(playlist_id integer primary key, name text);
+CREATE TABLE playlist_track(playlist_id integer references playlist(playlist_id),
+    track_id integer references track(track_id), primary key(playlist_id, track_id));
+"""
+
+
+def build_chinook(path: Path, scale: int = 1, seed: int = 7) -> Path:
+    """SQLite database with the Chinook schema (snake_case, as in the Postgres import) and synthetic rows."""
+    path = Path(path)
+    path.unlink(missing_ok=True)
+    rng = random.Random(seed)
+    word = lambda: rng.choice(WORDS).title()
+    countries = ["USA", "Canada", "Brazil", "France", "Germany", "India", "Japan"]
+    n_artists, n_albums, n_tracks = 50 * scale, 120 * scale, 1500 * scale
+    n_customers, n_invoices = 60 * scale, 400 * scale
+    conn = sqlite3.connect(str(path))
+    with conn:
+        conn.executescript(CHINOOK_DDL)
+        conn.executemany("INSERT INTO genre VALUES(?, ?)", enumerate(["Rock", "Jazz", "Metal", "Pop", "Blues", "Latin"], 1))
+        conn.executemany("INSERT INTO media_type VALUES(?, ?)", enumerate(["MPEG audio file", "AAC audio file"], 1))
+        conn.executemany("INSERT INTO artist VALUES(?, ?)", [(i, f"{word()} {word()}") for i in range(1, n_artists + 1)])
+        conn.executemany("INSERT INTO album VALUES(?, ?, ?)",
+                         [(i, f"{word()} {word()}", rng.randint(1, n_artists)) for i in range(1, n_albums + 1)])
+        conn.executemany("INSERT INTO track VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         [(i, f"{word()} {word()}", rng.randint(1, n_albums), rng.randint(1, 2), rng.randint(1, 6),
+                           word(), rng.randint(120_000, 420_000), rng.randint(2_000_000, 9_000_000), 0.99)
+                          for i in range(1, n_tracks + 1)])
+        conn.executemany("INSERT INTO employee(employee_id, last_name, first_name, title, country) VALUES(?, ?, ?, ?, ?)",
+                         [(i, word(), word(), "Sales Support Agent", rng.choice(countries)) for i in range(1, 9)])
+        conn.executemany("INSERT INTO customer(customer_id, first_name, last_name, country, email, support_rep_id) "
+                         "VALUES(?, ?, ?, ?, ?, ?)",
+                         [(i, word(), word(), rng.choice(countries), f"c{i}@example.com", rng.randint(1, 8))
+                          for i in range(1, n_customers + 1)])
+        conn.executemany("INSERT INTO invoice(invoice_id, customer_id, invoice_date, billing_country, total) "
+                         "VALUES(?, ?, ?, ?, ?)",
+                         [(i, rng.randint(1, n_customers), f"20{rng.randint(20, 25)}-{rng.randint(1, 12):02d}-01",
+                           rng.choice(countries), round(rng.uniform(0.99, 25.0), 2)) for i in range(1, n_invoices + 1)])
+        conn.executemany("INSERT INTO invoice_line VALUES(?, ?, ?, ?, ?)",
+                         [(i, rng.randint(1, n_invoices), rng.randint(1, n_tracks), 0.99, rng.randint(1, 3))
+                          for i in range(1, 3 * n_invoices + 1)])
+        conn.executemany("INSERT INTO playlist VALUES(?, ?)", [(i, f"{word()} Mix") for i in range(1, 11)])
+        conn.executemany("INSERT OR IGNORE INTO playlist_track VALUES(?, ?)",
+                         [(rng.randint(1, 10), rng.randint(1, n_tracks)) for _ in range(500 * scale)])
+    conn.close()
+    return path
+
+
+_DOCX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/word/document.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+        '</Types>'),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="word/document.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'),
+}
+
+
+def write_docx(path: Path, paragraphs: Sequence[str]) -> Path:
+    """Minimal valid .docx (one run per paragraph), enough for Docx2txtLoader."""
+    body = "".join(f"<w:p><w:r><w:t>{escape(p)}</w:t></w:r></w:p>" for p in paragraphs)
+    document = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                f"<w:body>{body}</w:body></w:document>")
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, xml in _DOCX_PARTS.items():
+            z.writestr(name, xml)
+        z.writestr("word/document.xml", document)
+    return path
+
+
+def write_corpus(docs_dir: Path, files: int = 5, paragraphs: int = 40, seed: int = 7) -> List[Path]:
+    docs_dir = Path(docs_dir)
+    docs_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    out = []
+    for f in range(files):
+        paras = [f"Policy {f}.{p}: " + " ".join(rng.choice(WORDS) for _ in range(80)) for p in range(paragraphs)]
+        out.append(write_docx(docs_dir / f"handbook_{f}.docx", paras))
+    return out
+
+
+# ---- wiring -------------------------------------------------------------------
+def install(llm_latency: float = 0.0, token_latency: float = 0.0, embed_latency: float = 0.0,
+            search_latency: float = 0.0) -> Dict[str, Any]:
+    """
+    Point the app at the fakes. Call after the env is set and before app startup;
+    models are wrapped like the real ones (metrics callback + per-site LLM cache).
+    """
+    from langchain.chains import create_sql_query_chain
+    import app.agents.unified_graph as ug
+    import app.tools.nl2sql as nl2sql_mod
+    import app.tools.rag as rag_mod
+    import app.tools.web_search as web_search_mod
+    from app.core.config import settings
+    from app.services.llm_cache import with_llm_cache
+    from app.services.observability import instrument_llm
+
+    def llm() -> FakeChatModel:
+        return FakeChatModel(latency=llm_latency, token_latency=token_latency)
+
+    ug.get_router_llm = llm
+    rag_mod.RAG_QA_LLM = with_llm_cache(instrument_llm(llm()), "rag_qa")
+    nl2sql_mod.SQL_LLM = with_llm_cache(instrument_llm(llm()), "nl2sql")
+    nl2sql_mod.SQL_CHAIN = create_sql_query_chain(nl2sql_mod.SQL_LLM, nl2sql_mod.SCHEMA)
+    rag_mod.SentenceTransformerEmbeddings = lambda **kwargs: HashEmbeddings(latency=embed_latency)
+    tavily = StubTavily(search_latency, settings.web_search_max_results)
+    web_search_mod._CLIENT = tavily
+    return {"tavily": tavily}
@@ -0,0 +1,214 @@
+"""
+Peak memory of RAG ingestion (app.services.ingestion.sync_files) against corpus size and
+batch size. Synthetic text PDFs are written to a temp dir, then every configuration is
+ingested in a fresh process with hash embeddings (no model download), and that process
+reports its RSS before ingesting and its peak after. Parser worker peaks (--workers > 1)
+are reported separately.
+
+  * streaming: the pipeline as shipped, pages -> chunks -> embed -> upsert in batches;
+  * eager: each file loaded and split whole before it is queued (the pre-streaming
+    behaviour), as the baseline that grows with file size.
+
+Points go to the writers the app is configured with: the NumPy index or a Qdrant
+collection (VECTOR_BACKEND; an embedded QDRANT_URL=":memory:" keeps every point in this
+process), plus the BM25 index when RAG_HYBRID is on. --writer count swaps them for one
+that keeps nothing, to isolate the pipeline's own share.
+
+    python -m bench.ingest_memory --pages 250,1000,4000 --batch-sizes 64,256,1024 --out ingest_memory.json
+"""
+from __future__ import annotations
+import argparse, json, os, random, subprocess, sys, tempfile, time
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+
+from bench.fakes import WORDS
+
+PAGE_LINES = 45
+LINE_WORDS = 14
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: Path, pages: int, seed: int) -> Path:
+    """Uncompressed PDF of `pages` text pages (Helvetica), written incrementally."""
+    rng = random.Random(seed)
+    offsets: List[int] = []
+    with open(path, "wb") as f:
+        def obj(body: bytes) -> None:
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % len(offsets) + body + b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n")
+        kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(pages))
+        obj(b"<< /Type /Catalog /Pages 2 0 R >>")
+        obj(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode("ascii"))
+        obj(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+        for i in range(pages):
+            lines = [f"Section {i}.{n}: " + " ".join(rng.choice(WORDS) for _ in range(LINE_WORDS))
+                     for n in range(PAGE_LINES)]
+            stream = ("BT /F1 9 Tf 11 TL 36 806 Td "
+                      + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in lines) + " ET").encode("latin-1")
+            obj(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode("ascii"))
+            obj(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(offsets) + 1))
+        for off in offsets:
+            f.write(b"%010d 00000 n \n" % off)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(offsets) + 1, xref))
+    return path
+
+
+def write_corpus(docs_dir: Path, pages: int, files: int, seed: int) -> List[Path]:
+    docs_dir.mkdir(parents=True, exist_ok=True)
+    per_file = [pages // files + (1 if i < pages % files else 0) for i in range(files)]
+    return [write_pdf(docs_dir / f"manual_{i}.pdf", n, seed + i) for i, n in enumerate(per_file) if n]
+
+
+class CountingWriter:
+    """Index writer that keeps nothing but counts."""
+
+    def __init__(self):
+        self.points = 0
+
+    def upsert(self, ids: List[str], vectors: List[List[float]], payloads: List[dict]) -> None:
+        self.points += len(ids)
+
+    def delete(self, ids: List[str]) -> None:
+        pass
+
+    def commit(self) -> None:
+        pass
+
+
+def make_writer(kind: str, hybrid: bool, work: Path, embedding):
+    """The index writers refresh_vectorstore would use (minus the fork), built in `work`."""
+    from app.core.config import settings
+    from app.services.ingestion import FanoutWriter, QdrantWriter
+    from app.services.lexical_index import BM25Index
+    from app.services.numpy_index import NumpyVectorStore
+    from app.services.qdrant_collection import CollectionLayout, create_collection, embedding_dimension
+
+    if kind == "count":
+        return CountingWriter()
+    if kind == "qdrant":
+        from qdrant_client import QdrantClient
+        client = QdrantClient(location=":memory:") if settings.qdrant_url == ":memory:" \
+            else QdrantClient(url=settings.qdrant_url)
+        collection = f"bench_ingest_{os.getpid()}"
+        create_collection(client, collection, embedding_dimension(embedding), CollectionLayout.from_settings())
+        writer = QdrantWriter(client, collection)
+    else:
+        writer = NumpyVectorStore(work / "numpy_index", embedding, dtype=settings.numpy_index_dtype)
+    if hybrid:
+        writer = FanoutWriter(writer, BM25Index(work / "bm25_index.sqlite3"))
+    return writer
+
+
+def child(args) -> Dict[str, Any]:
+    """One ingest in this process; imports happen first so the baseline includes them."""
+    import resource
+    from bench.fakes import HashEmbeddings
+    from bench.qdrant_layouts import _rss_mb
+    from app.services.ingestion import BatchUpserter, QdrantWriter, load_and_split, sync_files
+    from app.services.vectorstore import IngestManifest, scan_docs
+
+    work = Path(args.workdir)
+    embedding = HashEmbeddings()
+    writer = make_writer(args.writer, args.hybrid == "on", work, embedding)
+    manifest = IngestManifest(path=work / "manifest.json", embed_model="hash")
+    plan = manifest.diff(scan_docs(args.docs))
+    baseline = _rss_mb()
+    t0 = time.perf_counter()
+    if args.mode == "eager":
+        upserter = BatchUpserter(writer, embedding, manifest, plan, args.batch_size)
+        for path in plan.to_embed:
+            upserter.add_chunks(path, load_and_split(path))
+            upserter.end_file(path)
+        upserter.flush()
+        chunks = sum(len(manifest.chunk_ids(p)) for p in plan.to_embed)
+    else:
+        chunks = sync_files(writer, embedding, manifest, plan, workers=args.workers,
+                            batch_size=args.batch_size, max_inflight=args.max_inflight).chunks
+    seconds = time.perf_counter() - t0
+    for w in getattr(writer, "writers", (writer,)):
+        if isinstance(w, QdrantWriter):
+            w.client.delete_collection(w.collection)
+    kb = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "chunks": chunks,
+        "seconds": round(seconds, 2),
+        "baseline_rss_mb": round(baseline, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / kb, 1),
+        "worker_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / kb, 1),
+    }
+
+
+def run_one(docs: Path, mode: str, batch_size: int, args) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as work:
+        cmd = [sys.executable, "-m", "bench.ingest_memory", "--child", "--docs", str(docs), "--workdir", work,
+               "--mode", mode, "--batch-size", str(batch_size), "--workers", str(args.workers),
+               "--max-inflight", str(args.max_inflight), "--writer", args.writer, "--hybrid", args.hybrid]
+        env = dict(os.environ, DATA_DIR=work)
+        proc = subprocess.run(cmd, capture_output=True, text=True, env=env)
+    if proc.returncode:
+        raise SystemExit(f"ingest child failed ({mode}, batch {batch_size}):\n{proc.stderr[-2000:]}")
+    res = json.loads(proc.stdout.strip().splitlines()[-1])
+    res["ingest_mb"] = round(res["peak_rss_mb"] - res["baseline_rss_mb"], 1)
+    return res
+
+
+def main(argv: Sequence[str] | None = None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--pages", default="250,1000,4000", help="corpus sizes, total pages")
+    ap.add_argument("--files", type=int, default=2, help="PDFs each corpus is spread over")
+    ap.add_argument("--batch-sizes", default="64,256,1024")
+    ap.add_argument("--modes", default="streaming,eager")
+    ap.add_argument("--workers", type=int, default=1, help="parser processes (streaming mode)")
+    ap.add_argument("--max-inflight", type=int, default=8, help="chunk batches parsers may run ahead")
+    ap.add_argument("--writer", choices=("configured", "numpy", "qdrant", "count"), default="configured",
+                    help="index the points go to; configured = VECTOR_BACKEND")
+    ap.add_argument("--hybrid", choices=("configured", "on", "off"), default="configured",
+                    help="also build the BM25 index; configured = RAG_HYBRID")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--out", default=None, help="write results as JSON")
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--docs", default=None, help=argparse.SUPPRESS)
+    ap.add_argument("--workdir", default=None, help=argparse.SUPPRESS)
+    ap.add_argument("--mode", default="streaming", help=argparse.SUPPRESS)
+    ap.add_argument("--batch-size", type=int, default=256, help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(child(args)))
+        return
+    from app.core.config import settings
+    if args.writer == "configured":
+        args.writer = settings.vector_backend
+    if args.hybrid == "configured":
+        args.hybrid = "on" if settings.rag_hybrid and args.writer != "count" else "off"
+
+    results: Dict[str, Any] = {"files": args.files, "workers": args.workers, "max_inflight": args.max_inflight,
+                               "writer": args.writer, "hybrid": args.hybrid, "runs": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in (int(p) for p in args.pages.split(",")):
+            docs = Path(tmp) / f"docs_{pages}"
+            corpus_mb = sum(p.stat().st_size for p in write_corpus(docs, pages, args.files, args.seed)) / 2**20
+            for mode in args.modes.split(","):
+                for batch_size in (int(b) for b in args.batch_sizes.split(",")):
+                    res = run_one(docs, mode, batch_size, args)
+                    res.update(pages=pages, corpus_mb=round(corpus_mb, 1), mode=mode, batch_size=batch_size)
+                    results["runs"].append(res)
+                    print(f"{pages:>6} pages ({corpus_mb:5.1f} MB) {mode:>9} batch {batch_size:>5}: "
+                          f"+{res['ingest_mb']:6.1f} MB over {res['baseline_rss_mb']} MB baseline "
+                          f"(peak {res['peak_rss_mb']} MB, workers {res['worker_peak_rss_mb']} MB), "
+                          f"{res['chunks']} chunks in {res['seconds']}s")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
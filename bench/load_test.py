@@ -0,0 +1,384 @@
+"""
+Load test: replay a JSONL workload against the API at a fixed concurrency and report
+p50/p95/p99 per endpoint and per graph node / tool / LLM / backend, RPS and peak RSS.
+
+By default the app runs in-process with every external backend replaced by the fakes
+in bench.fakes (fake chat models, hash embeddings, in-memory Qdrant or the NumPy index,
+a SQLite Chinook, stub Tavily), so runs are offline and repeatable. --url targets a
+running server instead; per-node numbers are then estimated from its /metrics buckets.
+
+Workload lines are either chat turns, {"message": ..., "user_id": ..., "stream": false}
+(requests.jsonl-style {"title", "body"} lines use the title as the message), or raw
+calls, {"method": "GET", "path": "/memory/u1", "json": null, "route": "GET /memory/{user_id}"}.
+
+    python -m bench.load_test --workload bench/workloads/mixed.jsonl --concurrency 8 --requests 400 --out load.json
+    python -m bench.load_test --workload requests.jsonl --llm-latency 0.05 --baseline load.json
+"""
+from __future__ import annotations
+import argparse, asyncio, contextlib, itertools, json, math, os, platform, re, resource, shutil, subprocess, sys, tempfile, time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+DEFAULT_WORKLOAD = Path(__file__).parent / "workloads" / "mixed.jsonl"
+# histogram families reported per label (name in /metrics, label(s) forming the key)
+FAMILIES = {
+    "nodes": ("agent_node_duration_seconds", ("node",)),
+    "tools": ("agent_tool_duration_seconds", ("tool",)),
+    "llm": ("llm_request_duration_seconds", ("model",)),
+    "backends": ("backend_request_duration_seconds", ("backend", "op")),
+    "sqlite_writes": ("sqlite_write_duration_seconds", ("db",)),
+}
+
+
+# ---- workload -------------------------------------------------------------------
+def load_workload(path: Path) -> List[Dict[str, Any]]:
+    items = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        if not line.strip():
+            continue
+        d = json.loads(line)
+        if "path" in d:
+            method = d.get("method", "POST").upper()
+            items.append({"method": method, "path": d["path"], "json": d.get("json"),
+                          "route": d.get("route") or f"{method} {d['path']}"})
+            continue
+        message = d.get("message") or d.get("title") or d.get("body")
+        if not message:
+            raise SystemExit(f"workload line has no message/title/body or path: {line[:80]}")
+        items.append({"message": message, "user_id": d.get("user_id"), "stream": bool(d.get("stream"))})
+    if not items:
+        raise SystemExit(f"empty workload: {path}")
+    return items
+
+
+def build_requests(items: List[Dict[str, Any]], total: int, users: int) -> List[Dict[str, Any]]:
+    """Cycle the workload up to `total` calls; chat turns without a user_id spread over `users` threads."""
+    out = []
+    for i, item in zip(range(total), itertools.cycle(items)):
+        if "path" in item:
+            out.append(item)
+            continue
+        uid = item["user_id"] or f"bench-{i % max(users, 1)}"
+        suffix = "/stream" if item["stream"] else ""
+        out.append({"method": "POST", "path": f"/chat/{uid}{suffix}", "json": {"message": item["message"]},
+                    "route": f"POST /chat/{{user_id}}{suffix}", "stream": item["stream"]})
+    return out
+
+
+# ---- statistics -----------------------------------------------------------------
+def percentile(sorted_vals: List[float], p: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    return sorted_vals[max(0, math.ceil(p / 100 * len(sorted_vals)) - 1)]
+
+
+def summarize(values_s: List[float]) -> Dict[str, float]:
+    ms = sorted(v * 1000 for v in values_s)
+    return {
+        "count": len(ms),
+        "mean_ms": round(sum(ms) / len(ms), 3) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "max_ms": round(ms[-1], 3) if ms else 0.0,
+    }
+
+
+class Recorder:
+    """Tees the app's latency histograms into raw samples (in-process runs) for exact percentiles."""
+
+    def __init__(self):
+        self.active = False
+        self.samples: Dict[str, Dict[str, List[float]]] = defaultdict(lambda: defaultdict(list))
+
+    def attach(self, family: str, hist, labelnames: Tuple[str, ...]) -> None:
+        observe = hist.observe
+
+        def tee(value: float, **labels) -> None:
+            observe(value, **labels)
+            if self.active:
+                self.samples[family][":".join(str(labels.get(n, "")) for n in labelnames)].append(value)
+        hist.observe = tee
+
+    def report(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        return {fam: {k: summarize(v) for k, v in sorted(series.items())} for fam, series in self.samples.items()}
+
+
+_LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_buckets(text: str) -> Dict[str, Dict[str, Dict[float, float]]]:
+    """{family metric: {label key: {le: cumulative count}}} from a Prometheus text scrape."""
+    wanted = {name: labels for name, labels in FAMILIES.values()}
+    out: Dict[str, Dict[str, Dict[float, float]]] = defaultdict(lambda: defaultdict(dict))
+    for line in text.splitlines():
+        name, _, rest = line.partition("{")
+        if not name.endswith("_bucket") or name[:-7] not in wanted:
+            continue
+        labels_txt, _, value = rest.rpartition("} ")
+        labels = dict(_LABEL_RE.findall(labels_txt))
+        key = ":".join(labels.get(n, "") for n in wanted[name[:-7]])
+        out[name[:-7]][key][float(labels["le"])] = float(value)
+    return out
+
+
+def estimate_from_buckets(before: dict, after: dict) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """Per-series percentiles interpolated within histogram buckets (scrape delta over the run)."""
+    report: Dict[str, Dict[str, Dict[str, float]]] = {}
+    for fam, (metric, _) in FAMILIES.items():
+        series = {}
+        for key, buckets in after.get(metric, {}).items():
+            prev = before.get(metric, {}).get(key, {})
+            bounds = sorted(buckets)
+            counts = [buckets[b] - prev.get(b, 0.0) for b in bounds]
+            total = counts[-1] if counts else 0
+            if total <= 0:
+                continue
+
+            def q(p: float) -> float:
+                rank, lo, lo_count = p / 100 * total, 0.0, 0.0
+                for b, c in zip(bounds, counts):
+                    if c >= rank:
+                        if math.isinf(b):
+                            return lo * 1000
+                        frac = (rank - lo_count) / (c - lo_count) if c > lo_count else 0.0
+                        return (lo + (b - lo) * frac) * 1000
+                    lo, lo_count = b, c
+                return lo * 1000
+            series[key] = {"count": int(total), "p50_ms": round(q(50), 3), "p95_ms": round(q(95), 3),
+                           "p99_ms": round(q(99), 3), "estimated_from_buckets": True}
+        if series:
+            report[fam] = series
+    return report
+
+
+# ---- driver ---------------------------------------------------------------------
+async def _one(client: httpx.AsyncClient, req: Dict[str, Any]) -> Tuple[str, Any, float, Optional[float]]:
+    t0 = time.perf_counter()
+    first: Optional[float] = None
+    try:
+        if req.get("stream"):
+            async with client.stream(req["method"], req["path"], json=req["json"]) as r:
+                async for _ in r.aiter_bytes():
+                    if first is None:
+                        first = time.perf_counter() - t0
+                status: Any = r.status_code
+        else:
+            r = await client.request(req["method"], req["path"], json=req["json"])
+            status = r.status_code
+    except Exception as e:
+        status = f"error:{type(e).__name__}"
+    return req["route"], status, time.perf_counter() - t0, first
+
+
+async def drive(client: httpx.AsyncClient, reqs: List[Dict[str, Any]], concurrency: int) -> Tuple[list, float]:
+    queue: asyncio.Queue = asyncio.Queue()
+    for r in reqs:
+        queue.put_nowait(r)
+    results: list = []
+
+    async def worker():
+        while True:
+            try:
+                req = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            results.append(await _one(client, req))
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return results, time.perf_counter() - t0
+
+
+def endpoint_report(results: list) -> Dict[str, Any]:
+    by_route: Dict[str, list] = defaultdict(list)
+    for row in results:
+        by_route[row[0]].append(row)
+    out = {}
+    for route, rows in sorted(by_route.items()):
+        statuses: Dict[str, int] = defaultdict(int)
+        for _, status, _, _ in rows:
+            statuses[str(status)] += 1
+        entry = {**summarize([r[2] for r in rows]), "status": dict(sorted(statuses.items())),
+                 "errors": sum(n for s, n in statuses.items() if not (s.isdigit() and int(s) < 400))}
+        ttfb = [r[3] for r in rows if r[3] is not None]
+        if ttfb:
+            entry["first_byte"] = summarize(ttfb)
+        out[route] = entry
+    return out
+
+
+def _peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _offline_env(args, workdir: Path) -> None:
+    """Settings for the in-process app; must run before anything imports app.core.config."""
+    from bench.fakes import build_chinook, write_corpus
+    docs = workdir / "docs"
+    write_corpus(docs, files=args.docs)
+    chinook = build_chinook(workdir / "chinook.sqlite3", scale=args.sql_scale)
+    os.environ.update({
+        "DATA_DIR": str(workdir / "data"),
+        "DOCS_DIR": str(docs),
+        "CHINOOK_URI": f"sqlite:///{chinook}",
+        "VECTOR_BACKEND": args.vector_backend,
+        "QDRANT_URL": ":memory:",
+        "WEB_SEARCH_MODE": "live",
+        "LLM_CACHE_ENABLED": "true" if args.llm_cache else "false",
+        "LANGSMITH_ENABLED": "false",
+        "LANGCHAIN_TRACING_V2": "false",
+        "INGEST_WORKERS": "1",
+        "DOCS_WATCH_INTERVAL": "0",
+        "METRICS_ENABLED": "true",
+    })
+
+
+async def _wait_settled(readiness, timeout: float) -> Dict[str, Any]:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        snap = readiness.snapshot()
+        if snap["time_to_settled_s"] is not None:
+            return snap
+        await asyncio.sleep(0.1)
+    return readiness.snapshot()
+
+
+async def run_in_process(args, reqs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    from bench import fakes
+    stubs = fakes.install(llm_latency=args.llm_latency, token_latency=args.token_latency,
+                          embed_latency=args.embed_latency, search_latency=args.search_latency)
+    from app.core import metrics
+    from app.main import app
+    from app.services.readiness import READINESS
+
+    recorder = Recorder()
+    for fam, (name, labelnames) in FAMILIES.items():
+        recorder.attach(fam, metrics.REGISTRY.get(name), labelnames)
+
+    async with app.router.lifespan_context(app):
+        boot = await _wait_settled(READINESS, args.startup_timeout)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+            await drive(client, reqs[:args.warmup], args.concurrency)
+            tokens_before = {tuple(l.values()): v for _, l, v in metrics.LLM_TOKENS.samples()}
+            recorder.active = True
+            results, wall = await drive(client, reqs[args.warmup:], args.concurrency)
+            recorder.active = False
+            tokens = {":".join(l.values()): int(v - tokens_before.get(tuple(l.values()), 0))
+                      for _, l, v in metrics.LLM_TOKENS.samples()}
+    return {
+        "mode": "in_process",
+        "boot": {k: boot[k] for k in ("status", "import_seconds", "time_to_ready_s", "time_to_settled_s")},
+        "results": results, "wall": wall, "breakdown": recorder.report(),
+        "llm_tokens": dict(sorted(tokens.items())), "tavily_calls": stubs["tavily"].calls,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+async def run_remote(args, reqs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+        await drive(client, reqs[:args.warmup], args.concurrency)
+        before = parse_buckets((await client.get("/metrics")).text)
+        results, wall = await drive(client, reqs[args.warmup:], args.concurrency)
+        after = parse_buckets((await client.get("/metrics")).text)
+    # the server's memory isn't visible from here; only the harness's own peak is known
+    return {"mode": "remote", "url": args.url, "results": results, "wall": wall,
+            "breakdown": estimate_from_buckets(before, after), "peak_rss_mb": None,
+            "client_peak_rss_mb": _peak_rss_mb()}
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    """Relative change (current / baseline - 1) of throughput and per-series percentiles."""
+    def rel(a, b):
+        return round(a / b - 1, 4) if a is not None and b else None
+
+    out: Dict[str, Any] = {"rps": rel(current["summary"]["rps"], baseline.get("summary", {}).get("rps"))}
+    sections = {"endpoints": (current["endpoints"], baseline.get("endpoints", {}))}
+    for fam in FAMILIES:
+        sections[fam] = (current["breakdown"].get(fam, {}), baseline.get("breakdown", {}).get(fam, {}))
+    for name, (cur, base) in sections.items():
+        diffs = {key: {p: rel(s.get(p), base[key].get(p)) for p in ("p50_ms", "p95_ms", "p99_ms")}
+                 for key, s in cur.items() if key in base}
+        if diffs:
+            out[name] = diffs
+    return out
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workload", default=str(DEFAULT_WORKLOAD))
+    ap.add_argument("--requests", type=int, default=200, help="measured calls (workload is cycled)")
+    ap.add_argument("--warmup", type=int, default=10, help="extra calls before measuring")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--users", type=int, default=16, help="distinct threads for lines without user_id")
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--url", default=None, help="load a running server instead of the in-process fake stack")
+    ap.add_argument("--llm-latency", type=float, default=0.0, help="fake LLM seconds per call")
+    ap.add_argument("--token-latency", type=float, default=0.0, help="fake LLM seconds per output token")
+    ap.add_argument("--embed-latency", type=float, default=0.0, help="fake embedding seconds per text")
+    ap.add_argument("--search-latency", type=float, default=0.0, help="stub Tavily seconds per search")
+    ap.add_argument("--vector-backend", choices=("numpy", "qdrant"), default="numpy",
+                    help="qdrant runs the client's in-memory mode")
+    ap.add_argument("--llm-cache", action="store_true", help="keep the persistent LLM cache on")
+    ap.add_argument("--docs", type=int, default=5, help="synthetic DOCX files to index")
+    ap.add_argument("--sql-scale", type=int, default=1, help="multiplier for synthetic Chinook rows")
+    ap.add_argument("--startup-timeout", type=float, default=120.0)
+    ap.add_argument("--workdir", default=None, help="where fixtures and data_dir go (default: temp, removed)")
+    ap.add_argument("--baseline", default=None, help="previous --out file to compare against")
+    ap.add_argument("--out", default=None, help="write results as JSON")
+    args = ap.parse_args()
+
+    items = load_workload(Path(args.workload))
+    reqs = build_requests(items, args.warmup + args.requests, args.users)
+
+    workdir = None
+    if args.url:
+        run = asyncio.run(run_remote(args, reqs))
+    else:
+        workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="bench_load_"))
+        workdir.mkdir(parents=True, exist_ok=True)
+        _offline_env(args, workdir)
+        with contextlib.redirect_stdout(sys.stderr):   # keep stdout for the JSON report (the app print()s)
+            run = asyncio.run(run_in_process(args, reqs))
+
+    results, wall = run.pop("results"), run.pop("wall")
+    errors = sum(1 for _, s, _, _ in results if not (isinstance(s, int) and s < 400))
+    report = {
+        "meta": {
+            "commit": _git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(), "cpus": os.cpu_count(),
+            "workload": args.workload, "workload_lines": len(items),
+            "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline", "workdir")},
+        },
+        "summary": {"requests": len(results), "errors": errors, "wall_s": round(wall, 3),
+                    "rps": round(len(results) / wall, 2) if wall else 0.0,
+                    "latency": summarize([r[2] for r in results])},
+        "endpoints": endpoint_report(results),
+        **run,
+    }
+    if args.baseline:
+        report["vs_baseline"] = compare(report, json.loads(Path(args.baseline).read_text(encoding="utf-8")))
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    if workdir is not None and not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Qdrant collection layouts (app.services.qdrant_collection.CollectionLayout) compared on
+memory, query latency and recall@k, using synthetic clustered unit vectors with a
+chunk-sized payload and exact top-k as ground truth.
+
+By default this runs against Qdrant's local in-memory mode, which accepts every layout
+but always searches exact float32 in-process: its latency and RSS are the brute-force
+baseline, not HNSW / int8. So each layout also reports
+  * estimated_ram: what a server keeps resident for it (CollectionLayout.estimated_ram),
+    at the benchmark size and scaled to --scale-to points;
+  * simulated_recall: int8 scalar quantization (quantile clipping, 256 levels) replayed
+    in NumPy with the layout's oversampling and rescoring.
+With --url the same layouts are built on a real server (HNSW + quantization), and
+latency / recall are measured there.
+
+    python -m bench.qdrant_layouts --points 50000 --out qdrant_layouts.json
+    python -m bench.qdrant_layouts --url http://localhost:6333 --points 200000
+"""
+from __future__ import annotations
+import argparse, json, os, resource, time, warnings
+from typing import Any, Dict, List
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as qm
+
+from app.services.qdrant_collection import CollectionLayout, create_collection
+from bench.load_test import summarize
+
+LAYOUTS: Dict[str, CollectionLayout] = {
+    "float32_ram": CollectionLayout(),
+    "float32_disk": CollectionLayout(on_disk=True, on_disk_payload=True),
+    "int8_rescore_x2": CollectionLayout(on_disk=True, on_disk_payload=True, quantization="int8", oversampling=2.0),
+    "int8_rescore_x1": CollectionLayout(on_disk=True, on_disk_payload=True, quantization="int8", oversampling=1.0),
+    "int8_no_rescore": CollectionLayout(on_disk=True, on_disk_payload=True, quantization="int8", rescore=False),
+    "int8_m8_ef64": CollectionLayout(on_disk=True, on_disk_payload=True, quantization="int8",
+                                     hnsw_m=8, hnsw_ef=64),
+}
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:   # no procfs: fall back to the peak
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def make_data(points: int, dim: int, queries: int, clusters: int, seed: int):
+    """Unit vectors around random centers (like topical chunks), and queries near random points."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    X = centers[rng.integers(0, clusters, points)] + 0.6 * rng.standard_normal((points, dim)).astype(np.float32)
+    X /= np.linalg.norm(X, axis=1, keepdims=True)
+    Q = X[rng.integers(0, points, queries)] + 0.3 * rng.standard_normal((queries, dim)).astype(np.float32)
+    Q /= np.linalg.norm(Q, axis=1, keepdims=True)
+    return X, Q
+
+
+def exact_topk(X: np.ndarray, Q: np.ndarray, k: int) -> np.ndarray:
+    out = np.empty((len(Q), k), dtype=np.int64)
+    for i in range(0, len(Q), 64):
+        s = Q[i:i + 64] @ X.T
+        top = np.argpartition(-s, k, axis=1)[:, :k]
+        out[i:i + 64] = np.take_along_axis(top, np.argsort(-np.take_along_axis(s, top, axis=1), axis=1), axis=1)
+    return out
+
+
+def recall(found: List[List[int]], truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    return round(float(np.mean([len(set(f[:k]) & set(t)) / k for f, t in zip(found, truth.tolist())])), 4)
+
+
+def simulated_int8_recall(X: np.ndarray, Q: np.ndarray, truth: np.ndarray, layout: CollectionLayout) -> float:
+    """Top-k through int8 codes (points and queries quantized alike), then optional rescoring."""
+    k = truth.shape[1]
+    lo, hi = np.quantile(X, [1 - layout.quantile, layout.quantile])
+    scale = (hi - lo) / 255.0
+
+    def dequant(a: np.ndarray) -> np.ndarray:
+        return (np.clip(np.round((a - lo) / scale), 0, 255) * scale + lo).astype(np.float32)
+
+    Xq, Qq = dequant(X), dequant(Q)
+    fetch = max(k, int(round(k * layout.oversampling))) if layout.rescore else k
+    found = []
+    for i in range(len(Q)):
+        s = Xq @ Qq[i]
+        cand = np.argpartition(-s, fetch)[:fetch]
+        order = X[cand] @ Q[i] if layout.rescore else s[cand]
+        found.append(cand[np.argsort(-order)][:k].tolist())
+    return recall(found, truth)
+
+
+def run_layout(client: QdrantClient, name: str, layout: CollectionLayout, X: np.ndarray, Q: np.ndarray,
+               truth: np.ndarray, payload: Dict[str, Any], batch: int, local: bool) -> Dict[str, Any]:
+    collection = f"bench_{name}"
+    rss0 = _rss_mb()
+    create_collection(client, collection, X.shape[1], layout)
+    t0 = time.perf_counter()
+    for start in range(0, len(X), batch):
+        vecs = X[start:start + batch]
+        client.upsert(collection, points=qm.Batch(ids=list(range(start, start + len(vecs))),
+                                                  vectors=vecs.tolist(), payloads=[payload] * len(vecs)), wait=True)
+    upsert_s = time.perf_counter() - t0
+    if not local:   # let the server finish building HNSW / quantized copies before querying
+        while client.get_collection(collection).status != qm.CollectionStatus.GREEN:
+            time.sleep(0.5)
+    index_s = time.perf_counter() - t0
+    k = truth.shape[1]
+    params = layout.search_params()
+    latencies, found = [], []
+    for q in Q:
+        t = time.perf_counter()
+        hits = client.query_points(collection, query=q.tolist(), limit=k, search_params=params,
+                                   with_payload=True).points
+        latencies.append(time.perf_counter() - t)
+        found.append([h.id for h in hits])
+    points, dim = X.shape
+    payload_bytes = len(json.dumps(payload))
+    out = {
+        "layout": layout.describe(),
+        "upsert_s": round(upsert_s, 2),
+        "index_s": round(index_s, 2),
+        "latency": summarize(latencies),
+        "recall_at_k": recall(found, truth),
+        "estimated_ram_mb": {p: round(v / 2**20, 1)
+                             for p, v in layout.estimated_ram(points, dim, payload_bytes).items()},
+    }
+    if local:
+        out["local_rss_delta_mb"] = round(_rss_mb() - rss0, 1)
+        if layout.quantization == "int8":
+            out["simulated_recall_at_k"] = simulated_int8_recall(X, Q, truth, layout)
+    client.delete_collection(collection)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default=None, help="Qdrant server; default is local in-memory mode")
+    ap.add_argument("--points", type=int, default=20000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--clusters", type=int, default=200)
+    ap.add_argument("--payload-chars", type=int, default=1000, help="chunk text size stored per point")
+    ap.add_argument("--batch", type=int, default=512)
+    ap.add_argument("--scale-to", type=int, default=10_000_000, help="also report estimated RAM at this many points")
+    ap.add_argument("--layouts", default=",".join(LAYOUTS), help="comma-separated subset of " + ",".join(LAYOUTS))
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--out", default=None, help="write results as JSON")
+    args = ap.parse_args()
+
+    local = args.url is None
+    if local:   # the docstring's caveat; local mode would repeat it for every layout
+        warnings.filterwarnings("ignore", message="Local mode performs exact")
+    client = QdrantClient(location=":memory:") if local else QdrantClient(url=args.url)
+    X, Q = make_data(args.points, args.dim, args.queries, args.clusters, args.seed)
+    truth = exact_topk(X, Q, args.k)
+    payload = {"page_content": "x" * args.payload_chars, "metadata": {"source": "docs/bench.pdf", "page": 1}}
+    payload_bytes = len(json.dumps(payload))
+
+    results: Dict[str, Any] = {
+        "engine": "local" if local else args.url,
+        "points": args.points, "dim": args.dim, "queries": args.queries, "k": args.k,
+        "payload_bytes": payload_bytes, "layouts": {},
+    }
+    for name in args.layouts.split(","):
+        layout = LAYOUTS[name]
+        res = run_layout(client, name, layout, X, Q, truth, payload, args.batch, local)
+        res[f"estimated_ram_mb_at_{args.scale_to}"] = round(
+            layout.estimated_ram(args.scale_to, args.dim, payload_bytes)["total"] / 2**20, 1)
+        results["layouts"][name] = res
+        print(f"{name:>16}: recall@{args.k} {res['recall_at_k']:.3f}"
+              + (f" (int8 simulated {res['simulated_recall_at_k']:.3f})" if "simulated_recall_at_k" in res else "")
+              + f", p50 {res['latency']['p50_ms']:.2f} ms, p95 {res['latency']['p95_ms']:.2f} ms, "
+              f"est. RAM {res['estimated_ram_mb']['total']} MB "
+              f"({res[f'estimated_ram_mb_at_{args.scale_to}']} MB at {args.scale_to:,} points)")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Dense-only MMR (the old retriever: k=5, fetch_k=20) vs. hybrid BM25 + dense RRF
+(fetch_k=10) on the documents in docs_dir.
+
+There is no labelled query set, so queries are synthesized from the corpus: for a
+sample of chunks we take a short window of text around its rarest tokens (the kind of
+identifier / drug-name / acronym lookups that dense retrieval tends to miss). A query
+counts as recalled when its source chunk is in the top-k.
+
+    python -m bench.retrieval_compare --docs ./docs --queries 200 --out bench_output.json
+"""
+from __future__ import annotations
+import argparse, json, random, statistics, tempfile, time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from langchain_community.embeddings import SentenceTransformerEmbeddings
+from langchain_core.documents import Document
+
+from app.core.config import settings
+from app.services.ingestion import load_and_split
+from app.services.lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+from app.services.numpy_index import NumpyVectorStore
+from app.services.rag_cache import CachedQueryEmbeddings
+from app.services.vectorstore import chunk_point_id, scan_docs
+
+
+def build_corpus(docs_dir: str) -> List[Document]:
+    chunks: List[Document] = []
+    for path in scan_docs(docs_dir):
+        chunks.extend(load_and_split(path))
+    return chunks
+
+
+def synth_queries(chunks: List[Document], n: int, seed: int = 7) -> List[tuple[str, int]]:
+    df = Counter(t for c in chunks for t in set(tokenize(c.page_content)))
+    rng = random.Random(seed)
+    picks = rng.sample(range(len(chunks)), min(n, len(chunks)))
+    out = []
+    for i in picks:
+        words = chunks[i].page_content.split()
+        if len(words) < 8:
+            continue
+        toks = [tokenize(w) for w in words]
+        rarity = [min((df[t] for t in ts), default=len(chunks)) for ts in toks]
+        center = min(range(len(words)), key=lambda j: rarity[j])
+        lo = max(0, center - 3)
+        out.append((" ".join(words[lo:lo + 7]), i))
+    return out
+
+
+def evaluate(name: str, search: Callable[[str], List[Document]], queries, chunks, k: int) -> Dict:
+    key_of = {(c.metadata.get("source"), c.metadata.get("page"), c.page_content): i for i, c in enumerate(chunks)}
+    hits, lat = 0, []
+    for q, target in queries:
+        t0 = time.perf_counter()
+        docs = search(q)
+        lat.append((time.perf_counter() - t0) * 1000)
+        found = {key_of.get((d.metadata.get("source"), d.metadata.get("page"), d.page_content)) for d in docs[:k]}
+        hits += target in found
+    lat.sort()
+    return {
+        "retriever": name,
+        "queries": len(queries),
+        f"recall@{k}": hits / max(len(queries), 1),
+        "p50_ms": statistics.median(lat) if lat else 0.0,
+        "p95_ms": lat[int(0.95 * (len(lat) - 1))] if lat else 0.0,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--docs", default=str(settings.docs_dir))
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--out", default=None, help="write results as JSON")
+    args = ap.parse_args()
+
+    chunks = build_corpus(args.docs)
+    if not chunks:
+        raise SystemExit(f"no PDF/DOCX chunks found in {args.docs}")
+    embedding = CachedQueryEmbeddings(SentenceTransformerEmbeddings(model_name=settings.embed_model), maxsize=100_000)
+    tmp = Path(tempfile.mkdtemp(prefix="bench_retrieval_"))
+    ids = [chunk_point_id(c.metadata.get("source", ""), i, c.page_content) for i, c in enumerate(chunks)]
+    payloads = [{"page_content": c.page_content, "metadata": c.metadata} for c in chunks]
+    dense = NumpyVectorStore(tmp, embedding)
+    dense.upsert(ids, embedding.embed_documents([c.page_content for c in chunks]), payloads)
+    dense.commit()
+    lexical = BM25Index(tmp / "bm25_index.sqlite3")
+    lexical.upsert(ids, None, payloads)
+    lexical.commit()
+
+    queries = synth_queries(chunks, args.queries)
+    for q, _ in queries:  # time search, not the encoder: both retrievers share the cached query vector
+        embedding.embed_query(q)
+
+    def dense_only(q):
+        return dense.max_marginal_relevance_search(q, k=args.k, fetch_k=20, lambda_mult=0.3)
+
+    def hybrid(q):
+        d = dense.max_marginal_relevance_search(q, k=args.k, fetch_k=10, lambda_mult=0.3)
+        lx = dense.get_by_ids([pid for pid, _ in lexical.search(q, k=settings.rag_lexical_k)])
+        return reciprocal_rank_fusion([d, lx], k=args.k, rrf_k=settings.rag_rrf_k)
+
+    results = {
+        "chunks": len(chunks),
+        "results": [
+            evaluate("dense_mmr_fetch20", dense_only, queries, chunks, args.k),
+            evaluate("hybrid_rrf_fetch10", hybrid, queries, chunks, args.k),
+        ],
+    }
+    print(json.dumps(results, indent=2))
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()